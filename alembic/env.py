@@ -5,6 +5,8 @@ from sqlalchemy import pool
 
 from alembic import context
 from session.db_adapter import Base
+from session.partitioned import is_bucket_table
+from session.constants import Config
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -26,6 +28,33 @@ target_metadata = Base.metadata
 # ... etc.
 
 
+def database_urls() -> list:
+    """Return the URLs of the databases to migrate.
+
+    That is the sqlalchemy.url of the ini file plus every shard of
+    SESSION_SHARDS (see session.sharding). `-x shard=<name>` migrates only
+    the named shard.
+
+    """
+    shard = context.get_x_argument(as_dictionary=True).get("shard")
+    if shard is not None:
+        return [Config.SESSION_SHARDS[shard]]
+    urls = [config.get_main_option("sqlalchemy.url")]
+    urls += [url for url in Config.SESSION_SHARDS.values() if url not in urls]
+    return urls
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """Leave the bucket tables of session.partitioned out of autogenerate.
+
+    They are created and dropped at runtime, not by migrations.
+
+    """
+    if type_ == "table":
+        return not is_bucket_table(name)
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -38,38 +67,45 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url")
-    context.configure(
-        url=url,
-        target_metadata=target_metadata,
-        literal_binds=True,
-        dialect_opts={"paramstyle": "named"},
-    )
+    for url in database_urls():
+        context.configure(
+            url=url,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            literal_binds=True,
+            dialect_opts={"paramstyle": "named"},
+        )
 
-    with context.begin_transaction():
-        context.run_migrations()
+        with context.begin_transaction():
+            context.run_migrations()
 
 
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode.
 
     In this scenario we need to create an Engine
-    and associate a connection with the context.
+    and associate a connection with the context,
+    once per database (see database_urls()).
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
+    for url in database_urls():
+        section = config.get_section(config.config_ini_section, {})
+        section["sqlalchemy.url"] = url
+        connectable = engine_from_config(
+            section,
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                include_name=include_name,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,28 @@
+"""session user_id
+
+Revision ID: 7a1c3e9b5d20
+Revises: 3de821723dcd
+Create Date: 2026-10-18 09:12:41.508311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1c3e9b5d20'
+down_revision: Union[str, None] = '3de821723dcd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('fastapi_sessions', sa.Column('user_id', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_fastapi_sessions_user_id'), 'fastapi_sessions', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_fastapi_sessions_user_id'), table_name='fastapi_sessions')
+    op.drop_column('fastapi_sessions', 'user_id')
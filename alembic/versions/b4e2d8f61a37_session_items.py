@@ -0,0 +1,31 @@
+"""session items
+
+Revision ID: b4e2d8f61a37
+Revises: 7a1c3e9b5d20
+Create Date: 2026-10-18 11:47:03.219846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e2d8f61a37'
+down_revision: Union[str, None] = '7a1c3e9b5d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fastapi_session_items',
+    sa.Column('session_key', sa.String(length=40), nullable=False),
+    sa.Column('item_key', sa.String(length=255), nullable=False),
+    sa.Column('item_value', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('session_key', 'item_key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fastapi_session_items')
@@ -0,0 +1,38 @@
+"""session buckets
+
+Revision ID: e91f5a0c2b64
+Revises: b4e2d8f61a37
+Create Date: 2026-10-18 15:26:54.730912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91f5a0c2b64'
+down_revision: Union[str, None] = 'b4e2d8f61a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the bucket tables themselves are created at runtime by
+    # session.partitioned as expiry dates reach them
+    op.create_table('fastapi_session_buckets',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('starts_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('ends_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_index(op.f('ix_fastapi_session_buckets_ends_at'), 'fastapi_session_buckets', ['ends_at'], unique=False)
+
+
+def downgrade() -> None:
+    names = op.get_bind().execute(sa.text('SELECT name FROM fastapi_session_buckets')).scalars().all()
+    for name in names:
+        op.execute(sa.text('DROP TABLE IF EXISTS %s' % name))
+    op.drop_index(op.f('ix_fastapi_session_buckets_ends_at'), table_name='fastapi_session_buckets')
+    op.drop_table('fastapi_session_buckets')
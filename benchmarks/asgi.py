@@ -0,0 +1,97 @@
+"""
+Minimal in-process ASGI client used by the benchmarks: no sockets, no HTTP
+parsing, just the app being called with a scope and message channels.
+"""
+import http.cookies
+
+
+class Client:
+    '''
+    Send HTTP requests straight to an ASGI app and keep cookies between
+    them, like a browser would
+    '''
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.cookies = {}
+
+    async def get(self, path, headers=()):
+        raw_headers = [(b"host", b"testserver")]
+        raw_headers += [(name.encode(), value.encode()) for name, value in headers]
+        if self.cookies:
+            cookie = "; ".join("%s=%s" % item for item in self.cookies.items())
+            raw_headers.append((b"cookie", cookie.encode("latin-1")))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        request_sent = False
+        response = {"status": None, "headers": [], "body": b""}
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+
+        await self.app(scope, receive, send)
+        self._store_cookies(response["headers"])
+        return response
+
+    def _store_cookies(self, headers):
+        for name, value in headers:
+            if name.lower() != b"set-cookie":
+                continue
+            cookie = http.cookies.SimpleCookie()
+            cookie.load(value.decode("latin-1"))
+            for key, morsel in cookie.items():
+                if morsel["max-age"] == "0" or not morsel.value:
+                    self.cookies.pop(key, None)
+                else:
+                    self.cookies[key] = morsel.value
+
+
+async def startup(app):
+    '''
+    Run the app's lifespan startup; return a coroutine function that runs
+    the shutdown
+    '''
+    import asyncio
+
+    events = asyncio.Queue()
+    done = asyncio.Queue()
+    await events.put({"type": "lifespan.startup"})
+
+    async def receive():
+        return await events.get()
+
+    async def send(message):
+        await done.put(message)
+
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+    await done.get()
+
+    async def shutdown():
+        await events.put({"type": "lifespan.shutdown"})
+        await done.get()
+        await task
+
+    return shutdown
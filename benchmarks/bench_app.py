@@ -0,0 +1,180 @@
+"""
+Load test of the FastAPI app from main.py with mixed session traffic.
+
+The app runs in-process over ASGI (no sockets), with two extra routes that
+read and write the session. Each request is drawn from a fixed mix:
+
+    new       visitor without a cookie whose request creates a session
+    read      returning visitor reading their session
+    write     returning visitor updating their session
+    expired   visitor sending the cookie of an expired session
+
+and requests per second plus p50/p95/p99 latency are reported per kind and
+overall, for every --store given (any SessionBase subclass, by dotted
+path). The SQL stores run against a scratch SQLite database.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_app --requests 5000 --concurrency 20 \\
+        --store session.db_adapter.SessionStore --json app.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import Request  # noqa: E402
+
+from main import app  # noqa: E402
+from benchmarks.asgi import Client, startup  # noqa: E402
+from benchmarks.report import latency_summary, write_json  # noqa: E402
+from session.constants import Config  # noqa: E402
+from session.async_db_adapter import async_engine  # noqa: E402
+from session.db_adapter import Base, engine  # noqa: E402
+from session.utils import import_string  # noqa: E402
+
+DEFAULT_STORES = [
+    "session.db_adapter.SessionStore",
+    "session.async_db_adapter.AsyncSessionStore",
+]
+DEFAULT_MIX = "new=1,read=6,write=2,expired=1"
+
+
+@app.get("/bench/read")
+async def bench_read(request: Request):
+    return {"visits": await request.state.session.aget("visits", 0)}
+
+
+@app.get("/bench/write")
+async def bench_write(request: Request):
+    session = request.state.session
+    visits = await session.aget("visits", 0) + 1
+    await session.aset("visits", visits)
+    await session.aset("last_seen", time.time())
+    return {"visits": visits}
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("new", "read", "write", "expired"):
+            raise argparse.ArgumentTypeError("unknown request kind %r" % kind)
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def seed_sessions(store_class, count, expired=False):
+    '''
+    Create sessions directly through the store and return their keys
+    '''
+    keys = []
+    for i in range(count):
+        store = store_class()
+        store["visits"] = i
+        store["profile"] = {"name": "user%d" % i, "roles": ["reader"]}
+        if expired:
+            store.set_expiry(timedelta(seconds=-60))
+        store.save()
+        keys.append(store.session_key)
+    return keys
+
+
+async def run_store(store_path, args, mix):
+    Config.SESSION_ENGINE = store_path
+    store_class = import_string(store_path)
+    rng = random.Random(args.seed)
+    returning = seed_sessions(store_class, args.sessions)
+    expired = seed_sessions(store_class, args.sessions // 10 or 1, expired=True)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+
+    shutdown = await startup(app)
+    latencies = {kind: [] for kind in mix}
+    errors = 0
+    queue = asyncio.Queue()
+    for kind in kinds:
+        queue.put_nowait(kind)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            kind = queue.get_nowait()
+            client = Client(app)
+            path = "/bench/write"
+            if kind == "read":
+                path = "/bench/read"
+                client.cookies[Config.SESSION_KEY_NAME] = rng.choice(returning)
+            elif kind == "write":
+                client.cookies[Config.SESSION_KEY_NAME] = rng.choice(returning)
+            elif kind == "expired":
+                client.cookies[Config.SESSION_KEY_NAME] = rng.choice(expired)
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies[kind].append(time.perf_counter() - start)
+            if response["status"] != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    await shutdown()
+    # pooled async connections belong to this event loop
+    await async_engine.dispose()
+
+    every = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "requests": len(every),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(every) / elapsed,
+        "latency": latency_summary(every),
+        "by_kind": {kind: latency_summary(samples) for kind, samples in latencies.items()},
+    }
+
+
+def report(store_path, result):
+    print(f"{store_path}: {result['requests']} requests in {result['seconds']:.2f}s, "
+          f"{result['rps']:.0f} req/s, {result['errors']} errors")
+    rows = [("all", result["latency"])] + list(result["by_kind"].items())
+    for kind, stats in rows:
+        print(f"  {kind:<8} n={stats['count']:<6} p50 {stats['p50_ms']:7.2f} ms"
+              f"  p95 {stats['p95_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--store", action="append", dest="stores",
+                        help="dotted path of a SessionBase subclass (repeatable)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=500,
+                        help="returning sessions seeded before the run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="write the results to this file ('-' for stdout)")
+    args = parser.parse_args()
+    args.stores = args.stores or DEFAULT_STORES
+    json_path = args.json if args.json in (None, "-") else os.path.abspath(args.json)
+
+    # the SQL stores use a relative sqlite path, so run in a scratch dir
+    os.chdir(tempfile.mkdtemp(prefix="bench_app_"))
+    Base.metadata.create_all(engine)
+
+    results = {}
+    for store_path in args.stores:
+        results[store_path] = asyncio.run(run_store(store_path, args, args.mix))
+        report(store_path, results[store_path])
+
+    if json_path:
+        params = {key: value for key, value in vars(args).items() if key != "json"}
+        write_json(json_path, "app", results, params)
+
+
+if __name__ == "__main__":
+    main()
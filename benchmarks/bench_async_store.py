@@ -0,0 +1,136 @@
+"""
+Compare request latency under concurrent load for the blocking SessionStore
+and the awaitable AsyncSessionStore.
+
+Each simulated request loads an existing session and saves it back, the way
+the middleware does. Alongside the session traffic, a stream of "bystander"
+requests that do no session work measures how long the event loop is held
+up by everybody else.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_async_store --sessions 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# the session engines use a relative sqlite path, so run in a scratch dir
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_async_store_"))
+
+from session.db_adapter import Base, engine, SessionStore  # noqa: E402
+from session.async_db_adapter import AsyncSessionStore  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(samples):
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+    }
+
+
+def seed(store_class, count):
+    '''
+    Save 'count' sessions with the store class about to be measured, and
+    make sure they load back: a session that fails to decode loads as {},
+    which would time the error path instead of a real load
+    '''
+    keys = []
+    for i in range(count):
+        store = store_class()
+        store["counter"] = i
+        store.save()
+        keys.append(store.session_key)
+    loaded = store_class.load_many(keys)
+    assert len(loaded) == count and all(loaded.values()), "seeded sessions don't load back"
+    return keys
+
+
+async def sync_request(key):
+    store = SessionStore(key)
+    store._get_session()
+    store.save()
+
+
+async def async_request(key):
+    store = AsyncSessionStore(key)
+    await store._aget_session()
+    await store.asave()
+
+
+async def bystander(stop, samples, interval=0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run(handler, keys, concurrency, rounds):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, lag = [], []
+
+    async def one(key):
+        async with semaphore:
+            start = time.perf_counter()
+            await handler(key)
+            latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(bystander(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(key) for _ in range(rounds) for key in keys))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await watcher
+
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "session_request": summary(latencies),
+        "bystander_lag": summary(lag or [0.0]),
+    }
+
+
+def report(name, result):
+    print(f"{name}: {result['requests']} requests, {result['rps']:.0f} req/s")
+    for label in ("session_request", "bystander_lag"):
+        stats = result[label]
+        print(
+            f"  {label:<16} p50 {stats['p50_ms']:8.2f} ms"
+            f"  p99 {stats['p99_ms']:8.2f} ms  mean {stats['mean_ms']:8.2f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+
+    keys = seed(SessionStore, args.sessions)
+    report("SessionStore (blocking)", asyncio.run(
+        run(sync_request, keys, args.concurrency, args.rounds)
+    ))
+    keys = seed(AsyncSessionStore, args.sessions)
+    report("AsyncSessionStore", asyncio.run(
+        run(async_request, keys, args.concurrency, args.rounds)
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Microbenchmarks of the per-request helpers of the session layer.
+
+Times SessionBase.encode()/decode() on a small and a large session,
+get_random_string() as used for session keys, and get_expiry_age() /
+get_expiry_date() with the default and a custom expiry. Each figure is the
+best of --repeat runs of --number calls.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_micro --number 20000 --json micro.json
+"""
+import argparse
+import os
+import string
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import write_json  # noqa: E402
+from session.session import SessionBase  # noqa: E402
+from session.utils import get_random_string  # noqa: E402
+
+SMALL = {"_auth_user_id": "48151623", "cart_items": 3}
+LARGE = {
+    "_auth_user_id": "48151623",
+    "history": [{"path": "/item/%d" % i, "at": "2024-01-01T00:00:%02d" % (i % 60)} for i in range(200)],
+    "preferences": {"theme": "dark", "language": "en", "flags": list(range(50))},
+}
+
+
+def session_with(data):
+    store = SessionBase()
+    store._session_cache = dict(data)
+    return store
+
+
+def cases():
+    small, large = session_with(SMALL), session_with(LARGE)
+    small_encoded, large_encoded = small.encode(SMALL), large.encode(LARGE)
+    custom = session_with({"_session_expiry": datetime.now() + timedelta(days=1)})
+    chars = string.ascii_lowercase + string.digits
+    return {
+        "encode_small": lambda: small.encode(SMALL),
+        "encode_large": lambda: large.encode(LARGE),
+        "decode_small": lambda: small.decode(small_encoded),
+        "decode_large": lambda: large.decode(large_encoded),
+        "get_random_string_32": lambda: get_random_string(32, chars),
+        "get_expiry_age_default": small.get_expiry_age,
+        "get_expiry_date_default": small.get_expiry_date,
+        "get_expiry_date_custom": custom.get_expiry_date,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in cases().items():
+        best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+        results[name] = {"us_per_op": best / args.number * 1e6, "ops_per_s": args.number / best}
+        print(f"{name:<26} {results[name]['us_per_op']:8.2f} us/op"
+              f"  {results[name]['ops_per_s']:>11,.0f} ops/s")
+
+    if args.json:
+        write_json(args.json, "micro", results, {"number": args.number, "repeat": args.repeat})
+
+
+if __name__ == "__main__":
+    main()
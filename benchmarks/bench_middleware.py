@@ -0,0 +1,127 @@
+"""
+Request throughput of the session middleware.
+
+Compares the pure ASGI SessionMiddleware against the previous pair of
+@app.middleware("http") functions (reproduced below), on the same FastAPI
+routes, driven in-process without sockets. The signed-cookie store is used
+so that no database I/O is measured.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request  # noqa: E402
+
+from benchmarks.asgi import Client  # noqa: E402
+from session.constants import Config  # noqa: E402
+from session.lazy import LazySession  # noqa: E402
+from session.middleware import SessionMiddleware, session_enabled_for  # noqa: E402
+from session.signed_cookies import SignedCookieSessionStore  # noqa: E402
+
+
+def add_routes(app):
+    @app.get("/anonymous")
+    async def anonymous():
+        return {"ok": True}
+
+    @app.get("/read")
+    async def read(request: Request):
+        return {"visits": await request.state.session.aget("visits", 0)}
+
+    @app.get("/write")
+    async def write(request: Request):
+        session = request.state.session
+        visits = await session.aget("visits", 0) + 1
+        await session.aset("visits", visits)
+        return {"visits": visits}
+
+    return app
+
+
+def legacy_app():
+    app = add_routes(FastAPI())
+
+    async def request_middleware(request, call_next):
+        if session_enabled_for(request.url.path):
+            session_key = request.cookies.get(Config.SESSION_KEY_NAME)
+            request.state.session = LazySession(lambda: SignedCookieSessionStore(session_key))
+        return await call_next(request)
+
+    async def response_middleware(request, call_next):
+        response = await call_next(request)
+        session = getattr(request.state, "session", None)
+        if session is None or not session.is_loaded():
+            return response
+        response.session = session
+        empty = session.is_empty()
+        if Config.SESSION_KEY_NAME in request.cookies and empty:
+            response.delete_cookie(Config.SESSION_KEY_NAME, path=Config.SESSION_COOKIE_PATH)
+            return response
+        if session.accessed:
+            response.headers.add_vary_header("Cookie")
+        if empty or response.status_code >= 500:
+            return response
+        if session.modified:
+            await session.asave()
+        elif session.accessed and Config.SESSION_SAVE_EVERY_REQUEST and session.needs_refresh():
+            await session.atouch()
+        else:
+            return response
+        response.set_cookie(
+            Config.SESSION_KEY_NAME,
+            session.session_key,
+            max_age=session.get_expiry_age(),
+            path=Config.SESSION_COOKIE_PATH,
+            httponly=Config.SESSION_COOKIE_HTTPONLY,
+            samesite=Config.SESSION_COOKIE_SAMESITE,
+        )
+        return response
+
+    # same registration order as the old main.py
+    app.middleware("http")(request_middleware)
+    app.middleware("http")(response_middleware)
+    return app
+
+
+def asgi_app():
+    app = add_routes(FastAPI())
+    app.add_middleware(SessionMiddleware, store_class=SignedCookieSessionStore)
+    return app
+
+
+async def run(app, path, requests):
+    client = Client(app)
+    if path != "/anonymous":
+        await client.get("/write")
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = await client.get(path)
+        assert response["status"] == 200, response
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    apps = [("@app.middleware pair", legacy_app()), ("SessionMiddleware", asgi_app())]
+    print(f"{'':<22} {'/anonymous':>12} {'/read':>12} {'/write':>12}   (req/s)")
+    for name, app in apps:
+        rates = [
+            asyncio.run(run(app, path, args.requests))
+            for path in ("/anonymous", "/read", "/write")
+        ]
+        print(f"{name:<22} " + " ".join(f"{rate:>12,.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
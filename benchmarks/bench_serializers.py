@@ -0,0 +1,79 @@
+"""
+Encode/decode throughput and payload size of the session codecs for a few
+realistic session dicts.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serializers --number 20000
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import serializers  # noqa: E402
+
+
+SESSIONS = {
+    "auth": {
+        "_auth_user_id": "48151623",
+        "_auth_user_backend": "app.auth.backends.PasswordBackend",
+        "_auth_user_hash": "0f3a9c1d2b7e4f5a6c8d9e0f1a2b3c4d5e6f7a8b",
+        "_session_expiry": datetime.now() + timedelta(days=14),
+    },
+    "cart": {
+        "_auth_user_id": "48151623",
+        "currency": "EUR",
+        "cart": [
+            {"sku": "SKU-%05d" % i, "qty": i % 3 + 1, "price": 1999 + i, "title": "Item number %d" % i}
+            for i in range(25)
+        ],
+        "last_seen": datetime.now(),
+    },
+    "wizard": {
+        "step": 7,
+        "answers": {"question_%d" % i: "answer text for question %d " % i * 4 for i in range(60)},
+        "flags": [True, False] * 50,
+    },
+}
+
+CODECS = [
+    ("json (stdlib)", serializers.JSONSerializer(use_orjson=False)),
+]
+if serializers.orjson is not None:
+    CODECS.append(("json (orjson)", serializers.JSONSerializer(use_orjson=True)))
+if serializers.msgpack is not None:
+    CODECS.append(("msgpack", serializers.MsgpackSerializer()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--compress-min-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"{'session':<8} {'codec':<14} {'compress':<9} {'bytes':>7} {'encode/s':>11} {'decode/s':>11}")
+    for session_name, session_dict in SESSIONS.items():
+        for codec_name, codec in CODECS:
+            for threshold in (None, args.compress_min_size):
+                def encode():
+                    return serializers.dumps(session_dict, codec, threshold)
+
+                payload = encode()
+                assert serializers.loads(payload) == session_dict
+
+                encode_rate = args.number / timeit.timeit(encode, number=args.number)
+                decode_rate = args.number / timeit.timeit(
+                    lambda: serializers.loads(payload), number=args.number
+                )
+                print(
+                    f"{session_name:<8} {codec_name:<14} {'yes' if threshold else 'no':<9}"
+                    f" {len(payload):>7} {encode_rate:>11,.0f} {decode_rate:>11,.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
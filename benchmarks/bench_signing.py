@@ -0,0 +1,66 @@
+"""
+Per-request cost of signing and verifying session data.
+
+Compares deriving the HMAC key on every call (salted_hmac) against the
+cached signers returned by get_signer(), and reports the full
+SessionBase.encode()/decode() round trip.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_signing --number 50000
+"""
+import argparse
+import hmac
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session.constants import Config  # noqa: E402
+from session.session import SessionBase  # noqa: E402
+from session.signing import get_signer, salted_hmac  # noqa: E402
+
+SESSION = {
+    "_auth_user_id": "48151623",
+    "_auth_user_backend": "app.auth.backends.PasswordBackend",
+    "_auth_user_hash": "0f3a9c1d2b7e4f5a6c8d9e0f1a2b3c4d5e6f7a8b",
+    "cart_items": 3,
+}
+
+
+def report(name, seconds, number):
+    print(f"{name:<34} {seconds / number * 1e6:8.2f} us/op  {number / seconds:>11,.0f} ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=50000)
+    args = parser.parse_args()
+    number = args.number
+
+    store = SessionBase()
+    salt = store.key_salt
+    payload = store.encode(SESSION).rsplit(":", 1)[0]
+    signer = get_signer(salt)
+    signed = signer.sign(payload)
+
+    def naive_sign():
+        return salted_hmac(salt + "signer", payload, Config.SESSION_SECRET_KEY).digest()
+
+    def naive_verify():
+        expected = salted_hmac(salt + "signer", payload, Config.SESSION_SECRET_KEY).digest()
+        return hmac.compare_digest(expected, expected)
+
+    report("sign, key derived per call", timeit.timeit(naive_sign, number=number), number)
+    report("verify, key derived per call", timeit.timeit(naive_verify, number=number), number)
+    report("sign, cached signer", timeit.timeit(lambda: get_signer(salt).sign(payload), number=number), number)
+    report("verify, cached signer", timeit.timeit(lambda: get_signer(salt).unsign(signed), number=number), number)
+
+    encoded = store.encode(SESSION)
+    report("SessionBase.encode", timeit.timeit(lambda: store.encode(SESSION), number=number), number)
+    report("SessionBase.decode", timeit.timeit(lambda: store.decode(encoded), number=number), number)
+
+
+if __name__ == "__main__":
+    main()
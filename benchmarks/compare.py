@@ -0,0 +1,67 @@
+"""
+Compare two benchmark result files written with --json.
+
+Prints every numeric result present in both files with its relative
+change, flagging changes beyond --threshold percent. Whether higher is
+better is guessed from the name: rates (rps, ops_per_s) should go up,
+times (*_ms, us_per_op, seconds) down.
+
+    python -m benchmarks.compare before.json after.json --threshold 5
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HIGHER_IS_BETTER = ("rps", "ops_per_s")
+
+
+def flatten(results, prefix=""):
+    values = {}
+    for key, value in results.items():
+        name = "%s.%s" % (prefix, key) if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=5.0,
+                        help="percent change reported as a regression or improvement")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print("%s (%s) -> %s (%s)" % (
+        args.before, before["environment"].get("commit"),
+        args.after, after["environment"].get("commit"),
+    ))
+
+    old, new = flatten(before["results"]), flatten(after["results"])
+    regressions = 0
+    for name in sorted(old.keys() & new.keys()):
+        if name.endswith(".count") or name.endswith(".requests"):
+            continue
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        better = change > 0 if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else change < 0
+        flag = ""
+        if abs(change) >= args.threshold:
+            flag = "improved" if better else "REGRESSED"
+            regressions += not better
+        print(f"{name:<70} {old[name]:>12.3f} {new[name]:>12.3f} {change:>+8.1f}%  {flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,97 @@
 import json
 import uvicorn
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from typing import Callable
-from session.db_adapter import SessionStore
+from contextlib import asynccontextmanager
+from session.async_db_adapter import AsyncSessionStore, async_engine
+from session.db_adapter import SessionStore, engine
+from session.singleflight import SingleFlight
+from session.batch import TouchBatcher, WriteBehindQueue
+from session.reaper import SessionReaper
 from session.constants import Config
+from session.utils import import_string
+from session.middleware import SessionMiddleware
+from session.pool import pool_status
+from session import metrics
 
-app = FastAPI()
+
+def session_store_class():
+    # SESSION_ENGINE picks the backend, e.g. the DB store or the stateless
+    # session.signed_cookies.SignedCookieSessionStore
+    return import_string(Config.SESSION_ENGINE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if Config.SESSION_TOUCH_BATCH_INTERVAL:
+        AsyncSessionStore.touch_batcher = TouchBatcher(
+            async_engine, Config.SESSION_TOUCH_BATCH_INTERVAL
+        )
+        AsyncSessionStore.touch_batcher.start()
+    if Config.SESSION_WRITE_BEHIND:
+        AsyncSessionStore.write_behind = WriteBehindQueue(
+            async_engine,
+            max_size=Config.SESSION_WRITE_BEHIND_MAX_SIZE,
+            flush_size=Config.SESSION_WRITE_BEHIND_FLUSH_SIZE,
+            flush_interval=Config.SESSION_WRITE_BEHIND_FLUSH_INTERVAL,
+        )
+        AsyncSessionStore.write_behind.start()
+    reaper = None
+    if Config.SESSION_REAPER_INTERVAL:
+        reaper = SessionReaper(session_store_class(), Config.SESSION_REAPER_INTERVAL)
+        reaper.start()
+    yield
+    if reaper is not None:
+        await reaper.stop()
+    # flush whatever is still buffered before the process exits
+    if AsyncSessionStore.write_behind is not None:
+        await AsyncSessionStore.write_behind.stop()
+        AsyncSessionStore.write_behind = None
+    if AsyncSessionStore.touch_batcher is not None:
+        await AsyncSessionStore.touch_batcher.stop()
+        AsyncSessionStore.touch_batcher = None
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
-def home(request: Request):
-    request.state.session.save()
+async def home(request: Request):
     return str(request.__dict__)
 
 Config.SESSION_KEY_NAME = 'sessionID'
 Config.SESSION_SAVE_EVERY_REQUEST = True
+Config.SESSION_KEY_EXISTS_CHECK = False
 
-# Middleware for adding custom header to requests
-async def request_middleware_handler(request: Request, call_next: Callable) -> Response:
-    session_key = request.cookies.get(Config.SESSION_KEY_NAME)
-    request.state.session = SessionStore(session_key)
-    print(request.state.session.__dict__)
-    # Proceed with the request handling
-    response = await call_next(request)
-    return response
-
-# Middleware for adding custom header to responses
-async def response_middleware_handler(request: Request, call_next: Callable) -> Response:
-    # Execute the request and get the response
-    response = await call_next(request)
-    
-    if hasattr(request.state, 'session'):
-        response.session = request.state.session
-  
-    try:
-        accessed = response.session.accessed
-        modified = response.session.modified
-        empty = response.session.is_empty()
-        
-        print(response.session.__dict__)
-    except AttributeError:
-        raise AttributeError
-        # we should return response here. for develomnet i am raiseing exception here
-    
-    if Config.SESSION_KEY_NAME in request.cookies and empty:
-        response.delete_cookie(Config.SESSION_KEY_NAME)
-
-    else:
-        if accessed:
-            pass
-        if (modified or Config.SESSION_SAVE_EVERY_REQUEST) and not empty:
-            pass
-
-    return response
+# Sessions are attached, persisted and their cookies managed by a single
+# pure ASGI middleware (see session.middleware.SessionMiddleware)
+app.add_middleware(SessionMiddleware)
 
-# Apply middleware for requests
-@app.middleware("http")
-async def request_middleware(request: Request, call_next: Callable) -> Response:
-    # Apply request headers middleware
-    response = await request_middleware_handler(request, call_next)
-    return response
+if Config.SESSION_SINGLE_FLIGHT:
+    SessionStore.single_flight = SingleFlight()
 
-# Apply middleware for responses
-@app.middleware("http")
-async def response_middleware(request: Request, call_next: Callable) -> Response:
-    # Apply response headers middleware
-    response = await response_middleware_handler(request, call_next)
-    return response
+if Config.SESSION_METRICS:
+    app.add_route(Config.SESSION_METRICS_PATH, metrics.metrics_endpoint, include_in_schema=False)
+    # the async engine serves the async store, the sync one SessionStore,
+    # the reaper and the sync routes
+    metrics.registry.add_collector(
+        metrics.stats_collector(
+            "session_db_pool_", lambda: pool_status(async_engine), engine="async"
+        )
+    )
+    metrics.registry.add_collector(
+        metrics.stats_collector("session_db_pool_", lambda: pool_status(engine), engine="sync")
+    )
+    metrics.registry.add_collector(
+        metrics.stats_collector(
+            "session_write_behind_",
+            lambda: AsyncSessionStore.write_behind and AsyncSessionStore.write_behind.stats(),
+        )
+    )
+    metrics.registry.add_collector(
+        metrics.stats_collector(
+            "session_single_flight_",
+            lambda: SessionStore.single_flight and SessionStore.single_flight.stats(),
+        )
+    )
 
 
 
@@ -1,2 +1,4 @@
 from session.db_adapter import Base
-from session.db_adapter import FastAPI_Session
\ No newline at end of file
+from session.db_adapter import FastAPI_Session
+from session.db_adapter import FastAPI_SessionItem
+from session.db_adapter import FastAPI_SessionBucket
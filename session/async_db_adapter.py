@@ -0,0 +1,277 @@
+from session.session import CreateError, UpdateError
+from session import metrics
+from session.db_adapter import SessionStore, FastAPI_Session, upsert_statement
+from sqlalchemy import select, update, insert, and_, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from session.pool import TimedAsyncAdaptedQueuePool, pool_options
+from session.constants import Config
+from session.utils import chunks
+from datetime import datetime
+
+# aiosqlite for local development; point this at "postgresql+asyncpg://..."
+# in production.
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./sqllite.db"
+
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **pool_options()
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+class AsyncSessionStore(SessionStore):
+    '''
+    Implement session store with DB as the backend, using SQLAlchemy's async
+    engine so that the awaitable methods never block the event loop.
+
+    The sync methods inherited from SessionStore keep working, which is
+    useful for code that runs in a worker thread (e.g. sync route handlers).
+    '''
+
+    # optional session.batch.TouchBatcher that coalesces atouch() calls
+    touch_batcher = None
+    # optional session.batch.WriteBehindQueue that buffers asave() calls
+    write_behind = None
+
+    def __init__(self, session_key=None) -> None:
+        super().__init__(session_key)
+
+    async def _aget_session_from_db(self):
+        if self.single_flight is None:
+            return await self._afetch_session()
+        return await self.single_flight.ado(
+            self._flight_key(self.session_key), self._afetch_session
+        )
+
+    async def _afetch_session(self):
+        if self.write_behind is not None:
+            # a queued write is newer than anything in the database
+            values = self.write_behind.get(self.session_key)
+            if values is not None:
+                if values["expire_date"] > datetime.now():
+                    return FastAPI_Session(**values)
+                return None
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(FastAPI_Session).where(and_(
+                        FastAPI_Session.session_key == self.session_key,
+                        FastAPI_Session.expire_date > datetime.now()
+                    ))
+                )
+                return result.scalars().first()
+        except Exception:
+            self._session_key = None
+
+    async def aload(self):
+        s = await self._aget_session_from_db()
+        if s is None:
+            self._session_key = None
+            return {}
+        self._stored_expire_date = s.expire_date
+        return self.decode(s.session_data)
+
+    async def aexists(self, session_key):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(FastAPI_Session.session_key).where(
+                    FastAPI_Session.session_key == session_key
+                )
+            )
+            return result.first() is not None
+
+    async def acreate(self):
+        while True:
+            self._session_key = await self._aget_new_session_key()
+            try:
+                # save immediately to ensure we have a unique entry in the db
+                await self.asave(must_create=True)
+            except CreateError:
+                # key was not unique try again
+                metrics.inc("session_create_retries_total", backend=type(self).__name__)
+                continue
+
+            self.modified = True
+            return
+
+    async def asave(self, must_create=False):
+        '''
+        Async version of SessionStore.save(), with the same must_create
+        semantics.
+        '''
+        if self._session_key is None:
+            return await self.acreate()
+
+        data = await self._aget_session(no_load=must_create)
+        values = self.create_model_values(data)
+
+        if self.write_behind is not None and not must_create:
+            await self.write_behind.put(values)
+            self._stored_expire_date = values["expire_date"]
+            self._forget(values["session_key"])
+            return
+
+        async with AsyncSessionLocal() as db:
+            try:
+                if must_create:
+                    stmt = insert(FastAPI_Session).values(values)
+                else:
+                    stmt = upsert_statement(db.get_bind().dialect.name, values)
+
+                if stmt is not None:
+                    await db.execute(stmt)
+                else:
+                    result = await db.execute(
+                        update(FastAPI_Session)
+                        .where(FastAPI_Session.session_key == values["session_key"])
+                        .values(values)
+                    )
+                    if result.rowcount == 0:
+                        db.add(FastAPI_Session(**values))
+                await db.commit()
+                self._stored_expire_date = values["expire_date"]
+                self._forget(values["session_key"])
+            except exc.IntegrityError:
+                await db.rollback()
+                if must_create:
+                    raise CreateError
+                raise
+            except exc.DatabaseError:
+                await db.rollback()
+                if not must_create:
+                    raise UpdateError
+                raise
+
+    async def atouch(self):
+        if self.session_key is None:
+            await self.asave()
+            return True
+
+        await self._aget_session()
+        expire_date = self.get_expiry_date()
+        if self.write_behind is not None:
+            values = self.write_behind.get(self.session_key)
+            if values is not None:
+                # queue a new row rather than edit the queued one, which a
+                # flush in progress may be writing
+                await self.write_behind.put(dict(values, expire_date=expire_date))
+                self._stored_expire_date = expire_date
+                self._forget(self.session_key)
+                return True
+        if self.touch_batcher is not None:
+            self.touch_batcher.touch(self.session_key, expire_date)
+            self._stored_expire_date = expire_date
+            return True
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(FastAPI_Session)
+                .where(FastAPI_Session.session_key == self.session_key)
+                .values(expire_date=expire_date)
+            )
+            await db.commit()
+        self._forget(self.session_key)
+        if result.rowcount:
+            self._stored_expire_date = expire_date
+        return bool(result.rowcount)
+
+    async def adelete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+
+        if self.write_behind is not None:
+            await self.write_behind.discard(session_key)
+        async with AsyncSessionLocal() as db:
+            await self._adelete_rows(db, [session_key])
+            await db.commit()
+        self._forget(session_key)
+
+    @classmethod
+    async def _adelete_rows(cls, db, session_keys):
+        '''
+        Run the _delete_rows() hook within the async session 'db', so that
+        subclasses deleting from more tables get the same from the async API
+        '''
+        return await db.run_sync(lambda session: cls._delete_rows(session, session_keys))
+
+    @classmethod
+    async def aload_many(cls, session_keys, chunk_size=None):
+        chunk_size = chunk_size or Config.SESSION_BULK_CHUNK_SIZE
+        decode = cls().decode
+        now = datetime.now()
+        loaded = {}
+        async with AsyncSessionLocal() as db:
+            for chunk in chunks(session_keys, chunk_size):
+                rows = await db.execute(
+                    select(FastAPI_Session.session_key, FastAPI_Session.session_data)
+                    .where(FastAPI_Session.session_key.in_(chunk))
+                    .where(FastAPI_Session.expire_date > now)
+                )
+                loaded.update((key, decode(data)) for key, data in rows)
+        if cls.write_behind is not None:
+            # writes still queued are newer than what the database returned
+            for session_key in session_keys:
+                values = cls.write_behind.get(session_key)
+                if values is not None and values["expire_date"] > now:
+                    loaded[session_key] = decode(values["session_data"])
+        return loaded
+
+    @classmethod
+    async def adelete_many(cls, session_keys, chunk_size=None):
+        chunk_size = chunk_size or Config.SESSION_BULK_CHUNK_SIZE
+        session_keys = list(session_keys)
+        if cls.write_behind is not None:
+            await cls.write_behind.discard_many(session_keys)
+        deleted = 0
+        for chunk in chunks(session_keys, chunk_size):
+            async with AsyncSessionLocal() as db:
+                deleted += await cls._adelete_rows(db, chunk)
+                await db.commit()
+            for session_key in chunk:
+                cls._forget(session_key)
+        return deleted
+
+    @classmethod
+    async def akeys_for_user(cls, user_id):
+        async with AsyncSessionLocal() as db:
+            return (await db.scalars(
+                select(FastAPI_Session.session_key)
+                .where(FastAPI_Session.user_id == str(user_id))
+            )).all()
+
+    @classmethod
+    async def adelete_for_user(cls, user_id):
+        if cls.write_behind is not None:
+            await cls.write_behind.discard_many(user_id=user_id)
+        deleted = 0
+        async with AsyncSessionLocal() as db:
+            keys = (await db.scalars(
+                select(FastAPI_Session.session_key)
+                .where(FastAPI_Session.user_id == str(user_id))
+            )).all()
+            for chunk in chunks(keys, Config.SESSION_BULK_CHUNK_SIZE):
+                deleted += await cls._adelete_rows(db, chunk)
+            await db.commit()
+        for session_key in keys:
+            cls._forget(session_key)
+        return deleted
+
+    @classmethod
+    async def aclear_expired(cls, chunk_size=None):
+        chunk_size = chunk_size or Config.SESSION_CLEAR_EXPIRED_CHUNK_SIZE
+        now = datetime.now()
+        deleted = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                keys = (await db.scalars(cls.expired_keys_query(now, chunk_size))).all()
+                if keys:
+                    await cls._adelete_rows(db, keys)
+                    await db.commit()
+            deleted += len(keys)
+            if len(keys) < chunk_size:
+                return deleted
@@ -0,0 +1,274 @@
+from session.db_adapter import FastAPI_Session, upsert_statement
+from sqlalchemy import update, insert, bindparam
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFlusher:
+    '''
+    Base class for buffers that an asyncio task flushes every
+    'flush_interval' seconds, or earlier when wake() is called.
+    Subclasses implement flush().
+
+    After a failed flush the task waits twice as long before the next one
+    (up to 'max_retry_delay' seconds) and ignores wake() meanwhile, so an
+    unreachable database isn't retried in a tight loop.
+    '''
+
+    max_retry_delay = 30
+
+    def __init__(self, engine, flush_interval) -> None:
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    async def flush(self):
+        raise NotImplementedError
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _sleep(self, delay, wakeable):
+        deadline = asyncio.get_running_loop().time() + delay
+        while not self._stopping:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+            self._wakeup.clear()
+            if wakeable:
+                return
+
+    async def _run(self):
+        retry_delay = None
+        while True:
+            if retry_delay is None:
+                await self._sleep(self.flush_interval, wakeable=True)
+            else:
+                await self._sleep(retry_delay, wakeable=False)
+            # stop() does the last flush itself
+            if self._stopping:
+                return
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing %s failed", self.__class__.__name__)
+                retry_delay = min((retry_delay or self.flush_interval) * 2, self.max_retry_delay)
+            else:
+                retry_delay = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        '''
+        Stop the background task and flush what is still pending
+        '''
+        if self._task is not None:
+            # not task.cancel(): a cancel racing with wake() can be
+            # swallowed by wait_for(), leaving the task running forever
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+class TouchBatcher(BackgroundFlusher):
+    '''
+    Coalesce expiry refreshes from many requests into one statement.
+
+    touch() only records the new expire_date for a key (the latest one wins);
+    a background task flushes everything recorded in the last
+    'flush_interval' seconds as a single executemany UPDATE on the async
+    engine.
+    '''
+
+    def __init__(self, engine, flush_interval=0.2) -> None:
+        super().__init__(engine, flush_interval)
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, session_key, expire_date):
+        current = self._pending.get(session_key)
+        if current is None or expire_date > current:
+            self._pending[session_key] = expire_date
+
+    async def flush(self):
+        '''
+        Write every pending expiry in one UPDATE. Return the number of keys
+        flushed.
+        '''
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        table = FastAPI_Session.__table__
+        stmt = (
+            update(table)
+            .where(table.c.session_key == bindparam("b_session_key"))
+            .values(expire_date=bindparam("b_expire_date"))
+        )
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(stmt, [
+                    {"b_session_key": session_key, "b_expire_date": expire_date}
+                    for session_key, expire_date in pending.items()
+                ])
+        except Exception:
+            # keep them for the next flush, unless a newer touch came in
+            for session_key, expire_date in pending.items():
+                self._pending.setdefault(session_key, expire_date)
+            raise
+        return len(pending)
+
+
+class WriteBehindQueue(BackgroundFlusher):
+    '''
+    Buffer session saves in memory and write them in batches.
+
+    Saves are keyed by session_key, so only the last write for a session is
+    kept. The queue is flushed as multi-row upserts in a single transaction
+    when it reaches 'flush_size' rows or every 'flush_interval' seconds.
+    When it holds 'max_size' sessions, counting those being flushed, put()
+    waits for a flush to make room (backpressure) instead of growing without
+    bounds.
+    '''
+
+    def __init__(self, engine, max_size=10000, flush_size=500, flush_interval=0.5) -> None:
+        super().__init__(engine, flush_interval)
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self._pending = {}
+        self._flushing = {}
+        self._space = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.flush_seconds_last = 0.0
+        self.backpressure_waits = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def get(self, session_key):
+        '''
+        Return the not yet persisted row values for session_key, if any, so
+        that reads see the latest write
+        '''
+        values = self._pending.get(session_key)
+        if values is None:
+            values = self._flushing.get(session_key)
+        return values
+
+    async def discard(self, session_key):
+        '''
+        Drop a queued write (e.g. before deleting the session). Waits for an
+        in-progress flush, so a flushed write can't resurrect the row after
+        the caller deletes it.
+        '''
+        async with self._lock:
+            self._pending.pop(session_key, None)
+
+    async def discard_many(self, session_keys=(), user_id=None):
+        '''
+        Drop the queued writes of the given sessions, and of every session
+        of 'user_id' if given
+        '''
+        async with self._lock:
+            for session_key in session_keys:
+                self._pending.pop(session_key, None)
+            if user_id is not None:
+                user_id = str(user_id)
+                for session_key in [
+                    key for key, values in self._pending.items()
+                    if values.get("user_id") == user_id
+                ]:
+                    del self._pending[session_key]
+
+    def _is_full(self, session_key):
+        # rows being flushed count too: a failed flush puts them back
+        if session_key in self._pending or session_key in self._flushing:
+            return False
+        return len(self._pending) + len(self._flushing) >= self.max_size
+
+    async def put(self, values):
+        session_key = values["session_key"]
+        while self._is_full(session_key):
+            self.backpressure_waits += 1
+            self._space.clear()
+            self.wake()
+            await self._space.wait()
+        self._pending[session_key] = values
+        if len(self._pending) >= self.flush_size:
+            self.wake()
+
+    async def flush(self):
+        '''
+        Write everything queued so far in one transaction. Return the number
+        of rows written.
+        '''
+        async with self._lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            rows = list(self._flushing.values())
+            start = time.perf_counter()
+            try:
+                async with self.engine.begin() as conn:
+                    dialect_name = conn.dialect.name
+                    for i in range(0, len(rows), self.flush_size):
+                        await self._write(conn, dialect_name, rows[i:i + self.flush_size])
+            except Exception:
+                # put them back, unless a newer save came in meanwhile
+                for session_key, values in self._flushing.items():
+                    self._pending.setdefault(session_key, values)
+                raise
+            finally:
+                self._flushing = {}
+                self._space.set()
+
+            elapsed = time.perf_counter() - start
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_last = elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            return len(rows)
+
+    async def _write(self, conn, dialect_name, rows):
+        stmt = upsert_statement(dialect_name, rows)
+        if stmt is not None:
+            await conn.execute(stmt)
+            return
+        table = FastAPI_Session.__table__
+        for values in rows:
+            result = await conn.execute(
+                update(table).where(table.c.session_key == values["session_key"]).values(values)
+            )
+            if result.rowcount == 0:
+                await conn.execute(insert(table).values(values))
+
+    def stats(self):
+        return {
+            "depth": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_seconds_last": self.flush_seconds_last,
+            "flush_seconds_max": self.flush_seconds_max,
+            "flush_seconds_avg": self.flush_seconds_total / self.flushes if self.flushes else 0.0,
+            "backpressure_waits": self.backpressure_waits,
+        }
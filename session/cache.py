@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class LRUCache:
+    '''
+    Bounded, thread-safe in-memory LRU cache of encoded session data.
+
+    Every entry carries a deadline: the earlier of "now + timeout" and the
+    session's own expire_date, so a cached session never outlives the row it
+    was read from.
+    '''
+
+    def __init__(self, max_entries=10000, timeout=300) -> None:
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        # membership test that doesn't count towards hits/misses
+        with self._lock:
+            entry = self._data.get(key)
+        return entry is not None and entry[1] > time.time()
+
+    def get(self, key):
+        '''
+        Return the cached value for key, or None on a miss
+        '''
+        now = time.time()
+        with self._lock:
+            try:
+                value, deadline = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if deadline <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def version(self, key):
+        # entries are only replaced within this process, so there is no
+        # concurrent writer to detect (see SharedMemoryCache.version)
+        return None
+
+    def set(self, key, value, expire_date=None, version=None):
+        deadline = time.time() + self.timeout
+        if expire_date is not None:
+            deadline = min(deadline, expire_date.timestamp())
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,172 @@
+from session.db_adapter import SessionStore
+from session.async_db_adapter import AsyncSessionStore
+from session.cache import LRUCache
+from session.constants import Config
+from session import metrics
+
+
+class CachedStoreMixin:
+    '''
+    Read-through, write-through cache in front of a DB session store.
+
+    Loads are served from an in-process LRU cache when possible and fall back
+    to the database on a miss; saves update the cache after the database
+    write and deletes invalidate it.
+    '''
+
+    cache = LRUCache(Config.SESSION_CACHE_MAX_ENTRIES, Config.SESSION_CACHE_TIMEOUT)
+    # the encoded session data as last read from or written to the
+    # database, so filling the cache doesn't encode the session again
+    _stored_session_data = None
+
+    def _load_from_cache(self):
+        entry = self.cache.get(self.session_key)
+        if entry is None:
+            metrics.inc("session_cache_misses_total", backend=type(self).__name__)
+            return None
+        metrics.inc("session_cache_hits_total", backend=type(self).__name__)
+        session_data, self._stored_expire_date = entry
+        self._stored_session_data = session_data
+        return self.decode(session_data)
+
+    def _cache_row(self, s, version=None):
+        if s is None:
+            self._session_key = None
+            return {}
+        # 'version' keeps a row read before a concurrent save from
+        # replacing the newer cached entry
+        self.cache.set(
+            s.session_key, (s.session_data, s.expire_date), s.expire_date, version
+        )
+        self._stored_expire_date = s.expire_date
+        self._stored_session_data = s.session_data
+        return self.decode(s.session_data)
+
+    def create_model_values(self, data):
+        values = super().create_model_values(data)
+        self._stored_session_data = values["session_data"]
+        return values
+
+    def _cache_current(self):
+        session_data = self._stored_session_data
+        if session_data is None:
+            session_data = self.encode(self._session)
+        expire_date = self._stored_expire_date or self.get_expiry_date()
+        self.cache.set(self.session_key, (session_data, expire_date), expire_date)
+
+    def _uncache_failed_save(self):
+        # don't keep serving what may no longer match the database
+        self._stored_session_data = None
+        if self.session_key is not None:
+            self.cache.delete(self.session_key)
+
+    def load(self):
+        data = self._load_from_cache()
+        if data is not None:
+            return data
+        version = self.cache.version(self.session_key)
+        return self._cache_row(self._get_session_from_db(), version)
+
+    def exists(self, session_key):
+        return session_key in self.cache or super().exists(session_key)
+
+    def save(self, must_create=False):
+        try:
+            super().save(must_create)
+        except Exception:
+            self._uncache_failed_save()
+            raise
+        self._cache_current()
+
+    def touch(self):
+        if not super().touch():
+            self.cache.delete(self.session_key)
+            return False
+        self._cache_current()
+        return True
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        super().delete(session_key)
+        self.cache.delete(session_key)
+
+    @classmethod
+    def delete_many(cls, session_keys, chunk_size=None):
+        session_keys = list(session_keys)
+        deleted = super().delete_many(session_keys, chunk_size)
+        for session_key in session_keys:
+            cls.cache.delete(session_key)
+        return deleted
+
+    @classmethod
+    def delete_for_user(cls, user_id):
+        session_keys = cls.keys_for_user(user_id)
+        deleted = super().delete_for_user(user_id)
+        for session_key in session_keys:
+            cls.cache.delete(session_key)
+        return deleted
+
+
+class CachedSessionStore(CachedStoreMixin, SessionStore):
+    '''
+    Implement session store with DB as the backend and an in-process cache
+    in front of it
+    '''
+
+
+class AsyncCachedSessionStore(CachedStoreMixin, AsyncSessionStore):
+    '''
+    Async version of CachedSessionStore, using the async engine on misses
+    '''
+
+    async def aload(self):
+        data = self._load_from_cache()
+        if data is not None:
+            return data
+        version = self.cache.version(self.session_key)
+        return self._cache_row(await self._aget_session_from_db(), version)
+
+    async def aexists(self, session_key):
+        return session_key in self.cache or await super().aexists(session_key)
+
+    async def asave(self, must_create=False):
+        try:
+            await super().asave(must_create)
+        except Exception:
+            self._uncache_failed_save()
+            raise
+        self._cache_current()
+
+    async def atouch(self):
+        if not await super().atouch():
+            self.cache.delete(self.session_key)
+            return False
+        self._cache_current()
+        return True
+
+    async def adelete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        await super().adelete(session_key)
+        self.cache.delete(session_key)
+
+    @classmethod
+    async def adelete_many(cls, session_keys, chunk_size=None):
+        session_keys = list(session_keys)
+        deleted = await super().adelete_many(session_keys, chunk_size)
+        for session_key in session_keys:
+            cls.cache.delete(session_key)
+        return deleted
+
+    @classmethod
+    async def adelete_for_user(cls, user_id):
+        session_keys = await cls.akeys_for_user(user_id)
+        deleted = await super().adelete_for_user(user_id)
+        for session_key in session_keys:
+            cls.cache.delete(session_key)
+        return deleted
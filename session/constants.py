@@ -1,4 +1,123 @@
 class Config:
+    # dotted path of the session store class used by the middleware
+    SESSION_ENGINE = 'session.async_db_adapter.AsyncSessionStore'
     SESSION_KEY_NAME = 'sessionID'
+    # probe the store with exists() before handing out a new session key;
+    # stores whose create() retries on CreateError don't need it
+    SESSION_KEY_EXISTS_CHECK = True
     SESSION_SAVE_EVERY_REQUEST = True
-    SESSION_COOKIE_AGE = 10000
\ No newline at end of file
+    SESSION_COOKIE_AGE = 10000
+    SESSION_COOKIE_PATH = '/'
+    SESSION_COOKIE_DOMAIN = None
+    SESSION_COOKIE_SECURE = False
+    SESSION_COOKIE_HTTPONLY = True
+    SESSION_COOKIE_SAMESITE = 'lax'
+    # with SESSION_SAVE_EVERY_REQUEST, only push the expiry forward once it
+    # would move by at least this many seconds
+    SESSION_REFRESH_INTERVAL = 60
+    # path prefixes that bypass session handling entirely (static files,
+    # health checks); if SESSION_PATHS is set, only paths under one of its
+    # prefixes get a session
+    SESSION_EXEMPT_PATHS = ('/static', '/health')
+    SESSION_PATHS = None
+    # codec used to encode session data ('json' or 'msgpack', see
+    # session.serializers); payloads of at least SESSION_COMPRESS_MIN_SIZE
+    # bytes are zlib compressed (None disables compression)
+    SESSION_SERIALIZER = 'json'
+    SESSION_COMPRESS_MIN_SIZE = 1024
+
+    # secret used to sign session data; values signed with any of the
+    # fallback keys are still accepted, which allows rotating the secret
+    SESSION_SECRET_KEY = 'insecure-change-me'
+    SESSION_SECRET_KEY_FALLBACKS = []
+    # when set, expiry-only refreshes are coalesced and flushed every
+    # SESSION_TOUCH_BATCH_INTERVAL seconds (see session.batch.TouchBatcher)
+    SESSION_TOUCH_BATCH_INTERVAL = None
+
+    # write-behind mode: buffer saves in memory and flush them in batches
+    # (see session.batch.WriteBehindQueue)
+    SESSION_WRITE_BEHIND = False
+    SESSION_WRITE_BEHIND_MAX_SIZE = 10000
+    SESSION_WRITE_BEHIND_FLUSH_SIZE = 500
+    SESSION_WRITE_BEHIND_FLUSH_INTERVAL = 0.5
+
+    # concurrent loads of the same session share one query (see
+    # session.singleflight)
+    SESSION_SINGLE_FLIGHT = False
+
+    # clear_expired() deletes at most this many rows per statement
+    SESSION_CLEAR_EXPIRED_CHUNK_SIZE = 1000
+    # bulk operations (load_many, delete_many) put at most this many keys
+    # in one IN (...) list
+    SESSION_BULK_CHUNK_SIZE = 500
+    # session data key holding the id of the logged-in user; its value is
+    # copied to the indexed user_id column so that all the sessions of a
+    # user can be found (delete_for_user)
+    SESSION_USER_ID_KEY = '_auth_user_id'
+    # per-key layout (session.items): values larger than this many bytes
+    # are not read by load() but fetched when first accessed
+    SESSION_ITEM_DEFER_SIZE = 4096
+    # time-partitioned layout (session.partitioned): one table per 'day' or
+    # per 'hour' of expire_date, dropped whole once its range is over
+    SESSION_PARTITION_SIZE = 'day'
+    # a lookup that misses re-reads the bucket registry at most this often
+    # (seconds), to find buckets created by other processes
+    SESSION_PARTITION_REFRESH_INTERVAL = 5
+    # run clear_expired() every SESSION_REAPER_INTERVAL seconds from the app
+    # lifespan (see session.reaper); None disables the reaper
+    SESSION_REAPER_INTERVAL = None
+
+    # record store latencies, errors, cache hits and payload sizes (see
+    # session.metrics) and serve them at SESSION_METRICS_PATH
+    SESSION_METRICS = False
+    SESSION_METRICS_PATH = '/metrics'
+
+    # connection pool used by the DB session backends
+    SESSION_DB_POOL_SIZE = 5
+    SESSION_DB_MAX_OVERFLOW = 10
+    SESSION_DB_POOL_TIMEOUT = 30
+    SESSION_DB_POOL_RECYCLE = 1800
+    SESSION_DB_POOL_PRE_PING = True
+
+    # sharded DB backend (session.sharding.ShardedSessionStore): shard name
+    # -> database URL. Keys are placed by consistent hashing on the shard
+    # names, so keep the names stable when moving a shard to another URL
+    SESSION_SHARDS = {}
+    SESSION_SHARD_VNODES = 128
+
+    # read replicas of the session database (session.replicas): URLs that
+    # load()/exists() are sent to, picked 'round_robin' or 'least_busy'.
+    # Sessions written by this process within the last
+    # SESSION_READ_YOUR_WRITES_WINDOW seconds are read from the primary;
+    # a failing replica is skipped for SESSION_REPLICA_RETRY_AFTER seconds
+    SESSION_DB_REPLICAS = []
+    SESSION_REPLICA_POLICY = 'round_robin'
+    SESSION_READ_YOUR_WRITES_WINDOW = 5
+    SESSION_REPLICA_RETRY_AFTER = 30
+
+    # in-process cache in front of the DB backend (session.cached_db)
+    SESSION_CACHE_MAX_ENTRIES = 10000
+    SESSION_CACHE_TIMEOUT = 300
+    # host-wide cache shared by the worker processes (session.shm_cache):
+    # file to map (None: a file in /dev/shm or the temp dir named after the
+    # user, working directory and database URL), number of slots and bytes
+    # per slot; sessions larger than a slot are not cached
+    SESSION_SHM_CACHE_PATH = None
+    SESSION_SHM_CACHE_SLOTS = 8192
+    SESSION_SHM_CACHE_SLOT_SIZE = 4096
+
+    # append-only local log backend (session.log_store): directory, fsync
+    # policy ('always', 'interval' or 'never'), segment size in bytes, and
+    # compaction once SESSION_LOG_COMPACT_RATIO of the log is garbage,
+    # checked every SESSION_LOG_COMPACT_INTERVAL seconds
+    SESSION_LOG_DIR = './session_log'
+    SESSION_LOG_FSYNC = 'interval'
+    SESSION_LOG_FSYNC_INTERVAL = 1.0
+    SESSION_LOG_SEGMENT_SIZE = 64 * 1024 * 1024
+    SESSION_LOG_COMPACT_RATIO = 0.5
+    SESSION_LOG_COMPACT_INTERVAL = 60
+
+    # redis session backend (session.redis_adapter)
+    SESSION_REDIS_URL = 'redis://localhost:6379/0'
+    SESSION_REDIS_MAX_CONNECTIONS = 50
+    SESSION_REDIS_KEY_PREFIX = 'session:'
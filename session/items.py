@@ -0,0 +1,330 @@
+"""
+Session store keeping every session key on its own row.
+
+ItemizedSessionStore keeps the fastapi_sessions row for the expiry and the
+user id, and stores each session key in fastapi_session_items with its own
+signed value. A save writes only the keys that were set or deleted since
+the load (see SessionBase.changes()). Changing a counter in a session that
+also holds a large cart therefore rewrites one small row instead of
+re-encoding everything.
+
+load() fetches every key in one query but leaves out the values larger
+than SESSION_ITEM_DEFER_SIZE bytes. Those values are fetched on first
+access, or ahead of time with fetch_items()/afetch_items().
+
+    Config.SESSION_ENGINE = "session.items.ItemizedSessionStore"
+
+Needs the fastapi_session_items table (alembic upgrade head).
+"""
+from session.db_adapter import (
+    SessionStore, FastAPI_Session, FastAPI_SessionItem, session_scope, upsert_statement,
+)
+from session.session import CreateError, UpdateError
+from session.constants import Config
+from session.utils import chunks
+from sqlalchemy import and_, case, delete, exc, func, insert, select, update
+from datetime import datetime
+import asyncio
+
+DEFERRED = object()
+
+
+class DeferredItems(dict):
+    '''
+    Session dict in which some values are only fetched when first read.
+
+    Deferred keys are present with the DEFERRED placeholder as value; every
+    accessor returning values replaces the placeholders it meets by calling
+    fetch(keys), which returns {key: value}.
+    '''
+
+    def __init__(self, data, fetch) -> None:
+        super().__init__(data)
+        self._fetch = fetch
+
+    def deferred_keys(self, keys=None):
+        if keys is None:
+            return [key for key, value in dict.items(self) if value is DEFERRED]
+        return [key for key in keys if dict.get(self, key) is DEFERRED]
+
+    def resolve(self, keys=None):
+        keys = self.deferred_keys(keys)
+        if keys:
+            fetched = self._fetch(keys)
+            for key in keys:
+                if key in fetched:
+                    dict.__setitem__(self, key, fetched[key])
+                else:
+                    # deleted by another request in the meantime
+                    dict.__delitem__(self, key)
+
+    def __getitem__(self, key):
+        if dict.__getitem__(self, key) is DEFERRED:
+            self.resolve([key])
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if dict.get(self, key) is DEFERRED:
+            self.resolve([key])
+        return dict.get(self, key, default)
+
+    def pop(self, key, *args):
+        if dict.get(self, key) is DEFERRED:
+            self.resolve([key])
+        return dict.pop(self, key, *args)
+
+    def setdefault(self, key, default=None):
+        if dict.get(self, key) is DEFERRED:
+            self.resolve([key])
+        return dict.setdefault(self, key, default)
+
+    def values(self):
+        self.resolve()
+        return dict.values(self)
+
+    def items(self):
+        self.resolve()
+        return dict.items(self)
+
+    def copy(self):
+        self.resolve()
+        return dict(self)
+
+
+class ItemizedSessionStore(SessionStore):
+    '''
+    Implement session store with DB as the backend, one row per session
+    key, writing only the keys that changed (see session.items)
+    '''
+
+    item_table = FastAPI_SessionItem.__table__
+
+    def _encode_item(self, key, value):
+        # the key is signed together with the value, so a value can't be
+        # moved to another key
+        return self.encode({key: value})
+
+    def _decode_item(self, key, item_value):
+        return self.decode(item_value).get(key)
+
+    def load(self):
+        session_key = self.session_key
+        defer_size = Config.SESSION_ITEM_DEFER_SIZE
+        table = self.item_table
+        try:
+            with self._unit_of_work(session_key) as session:
+                expire_date = session.scalar(
+                    select(FastAPI_Session.expire_date).where(and_(
+                        FastAPI_Session.session_key == session_key,
+                        FastAPI_Session.expire_date > datetime.now(),
+                    ))
+                )
+                rows = [] if expire_date is None else session.execute(
+                    select(table.c.item_key, case(
+                        (func.length(table.c.item_value) <= defer_size, table.c.item_value),
+                        else_=None,
+                    )).where(table.c.session_key == session_key)
+                ).all()
+        except Exception:
+            expire_date = None
+        if expire_date is None:
+            self._session_key = None
+            return {}
+        self._stored_expire_date = expire_date
+        self.reset_changes()
+        return DeferredItems(
+            {
+                key: DEFERRED if value is None else self._decode_item(key, value)
+                for key, value in rows
+            },
+            self.fetch_items,
+        )
+
+    def fetch_items(self, keys):
+        '''
+        Fetch the values of the given keys from the database and return
+        {key: value} for those that exist
+        '''
+        table = self.item_table
+        session_key = self.session_key
+        fetched = {}
+        with self._unit_of_work(session_key) as session:
+            for chunk in chunks(keys, Config.SESSION_BULK_CHUNK_SIZE):
+                rows = session.execute(
+                    select(table.c.item_key, table.c.item_value).where(and_(
+                        table.c.session_key == session_key,
+                        table.c.item_key.in_(chunk),
+                    ))
+                )
+                fetched.update((key, self._decode_item(key, value)) for key, value in rows)
+        return fetched
+
+    async def afetch_items(self, keys=None):
+        '''
+        Resolve deferred values (all of them by default) without blocking
+        the event loop, ahead of reading them from an async route
+        '''
+        data = await self._aget_session()
+        if isinstance(data, DeferredItems) and data.deferred_keys(keys):
+            await asyncio.to_thread(data.resolve, keys)
+
+    # The async accessors fetch the deferred values they return in a worker
+    # thread first, so DeferredItems never queries from the event loop.
+
+    async def aget(self, key, default=None):
+        await self.afetch_items([key])
+        return await super().aget(key, default)
+
+    async def asetdefault(self, key, value):
+        await self.afetch_items([key])
+        return await super().asetdefault(key, value)
+
+    async def avalues(self):
+        await self.afetch_items()
+        return await super().avalues()
+
+    async def aitems(self):
+        await self.afetch_items()
+        return await super().aitems()
+
+    def pop(self, key, default=None, fetch=True):
+        '''
+        Remove key and return its value. Pass fetch=False when the value is
+        not used: a deferred value is then dropped without being fetched,
+        and None is returned. (del session[key] never fetches either.)
+        '''
+        if not fetch:
+            if key in self._session:
+                del self[key]
+            return None
+        return super().pop(key, default)
+
+    async def apop(self, key, default=None, fetch=True):
+        if not fetch:
+            data = await self._aget_session()
+            if key in data:
+                del data[key]
+                self._key_deleted(key)
+            return None
+        await self.afetch_items([key])
+        return await super().apop(key, default)
+
+    def _item_rows(self, data, keys):
+        session_key = self.session_key
+        return [
+            {
+                "session_key": session_key,
+                "item_key": key,
+                "item_value": self._encode_item(key, data[key]),
+            }
+            for key in keys
+        ]
+
+    def create_model_values(self, data):
+        # the data itself lives in the item rows
+        user_id = data.get(Config.SESSION_USER_ID_KEY)
+        return dict(
+            session_key = self._get_or_create_session_key(),
+            session_data = None,
+            expire_date = self.get_expiry_date(),
+            user_id = None if user_id is None else str(user_id),
+        )
+
+    def save(self, must_create=False):
+        '''
+        Write the session row and the item rows that changed. A new,
+        cleared or never loaded session is written in full; otherwise only
+        the keys set or deleted since the load are.
+        '''
+        if self._session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        changed, deleted, cleared = self.changes()
+        full = must_create or cleared or self._stored_expire_date is None
+        if full:
+            changed, deleted = set(data), set()
+        values = self.create_model_values(data)
+        session_key = values["session_key"]
+        table = self.item_table
+
+        try:
+            with self._unit_of_work(session_key) as session:
+                dialect_name = session.get_bind().dialect.name
+                if must_create:
+                    session.execute(insert(FastAPI_Session).values(values))
+                else:
+                    stmt = upsert_statement(dialect_name, values)
+                    if stmt is not None:
+                        session.execute(stmt)
+                    elif not session.execute(
+                        update(FastAPI_Session)
+                        .where(FastAPI_Session.session_key == session_key)
+                        .values(values)
+                    ).rowcount:
+                        session.execute(insert(FastAPI_Session).values(values))
+                if full and not must_create:
+                    session.execute(delete(table).where(table.c.session_key == session_key))
+                for chunk in chunks(deleted, Config.SESSION_BULK_CHUNK_SIZE):
+                    session.execute(delete(table).where(and_(
+                        table.c.session_key == session_key,
+                        table.c.item_key.in_(chunk),
+                    )))
+                for chunk in chunks(sorted(changed), Config.SESSION_BULK_CHUNK_SIZE):
+                    rows = self._item_rows(data, chunk)
+                    if not full:
+                        stmt = upsert_statement(dialect_name, rows, table)
+                        if stmt is not None:
+                            session.execute(stmt)
+                            continue
+                        session.execute(delete(table).where(and_(
+                            table.c.session_key == session_key,
+                            table.c.item_key.in_(chunk),
+                        )))
+                    session.execute(insert(table).values(rows))
+                session.commit()
+            self._stored_expire_date = values["expire_date"]
+            self.reset_changes()
+        except exc.IntegrityError:
+            if must_create:
+                raise CreateError
+            raise
+        except exc.DatabaseError:
+            if not must_create:
+                raise UpdateError
+            raise
+
+    @classmethod
+    def _delete_rows(cls, session, session_keys):
+        session.execute(
+            delete(cls.item_table).where(cls.item_table.c.session_key.in_(session_keys))
+        )
+        return super()._delete_rows(session, session_keys)
+
+    @classmethod
+    def load_many(cls, session_keys, chunk_size=None):
+        chunk_size = chunk_size or Config.SESSION_BULK_CHUNK_SIZE
+        decode_item = cls()._decode_item
+        table = cls.item_table
+        now = datetime.now()
+        loaded = {}
+        for factory, keys in cls._factories_for_keys(session_keys).items():
+            with session_scope(factory) as session:
+                for chunk in chunks(keys, chunk_size):
+                    live = session.scalars(
+                        select(FastAPI_Session.session_key)
+                        .where(FastAPI_Session.session_key.in_(chunk))
+                        .where(FastAPI_Session.expire_date > now)
+                    ).all()
+                    loaded.update((session_key, {}) for session_key in live)
+                    rows = session.execute(
+                        select(table.c.session_key, table.c.item_key, table.c.item_value)
+                        .where(table.c.session_key.in_(live))
+                    )
+                    for session_key, key, value in rows:
+                        loaded[session_key][key] = decode_item(key, value)
+        return loaded
+
+    @classmethod
+    def delete_for_user(cls, user_id):
+        return cls.delete_many(cls.keys_for_user(user_id))
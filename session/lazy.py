@@ -0,0 +1,48 @@
+class LazySession:
+    '''
+    Stand-in for a session store that only builds the store on first use.
+
+    Requests that never touch the session never instantiate (let alone load
+    or save) a store; is_loaded() tells the middleware whether there is
+    anything to persist.
+    '''
+
+    def __init__(self, factory) -> None:
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_wrapped", None)
+
+    def _setup(self):
+        wrapped = self._wrapped
+        if wrapped is None:
+            wrapped = self._factory()
+            object.__setattr__(self, "_wrapped", wrapped)
+        return wrapped
+
+    def is_loaded(self):
+        return self._wrapped is not None
+
+    def __getattr__(self, name):
+        return getattr(self._setup(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._setup(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._setup(), name)
+
+    def __getitem__(self, key):
+        return self._setup()[key]
+
+    def __setitem__(self, key, value):
+        self._setup()[key] = value
+
+    def __delitem__(self, key):
+        del self._setup()[key]
+
+    def __contains__(self, key):
+        return key in self._setup()
+
+    def __repr__(self):
+        if self._wrapped is None:
+            return "<LazySession: not loaded>"
+        return "<LazySession: %r>" % self._wrapped
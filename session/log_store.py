@@ -0,0 +1,581 @@
+"""
+Log-structured session storage in local files, for single-node deployments.
+
+Sessions are appended as records to segment files in SESSION_LOG_DIR and
+found through an in-memory index (session_key -> record location); values
+are read through mmap. Nothing is ever rewritten in place: a save appends
+a new record, a delete appends a tombstone.
+
+Durability follows SESSION_LOG_FSYNC:
+
+    'always'    a save returns once its record is fsynced; concurrent saves
+                share one fsync (group commit)
+    'interval'  a background thread fsyncs every SESSION_LOG_FSYNC_INTERVAL
+                seconds, so a crash loses at most that much
+    'never'     leave it to the OS
+
+The active segment is sealed once it reaches SESSION_LOG_SEGMENT_SIZE
+bytes. Compaction rewrites the sealed segments into one, keeping only the
+live, unexpired records; it runs in the background when at least
+SESSION_LOG_COMPACT_RATIO of the log is garbage, and clear_expired()
+runs it on demand. After compaction and on close() the index is written
+to a checkpoint file, so a restart only replays what was appended since.
+
+The log belongs to one process (an exclusive lock on the directory
+enforces it): run a single worker, or use a database backend.
+
+    Config.SESSION_ENGINE = "session.log_store.LogSessionStore"
+"""
+from session.session import SessionBase, CreateError
+from session.constants import Config
+from datetime import datetime
+from threading import Condition, Event, RLock, Thread
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# crc32 of the rest of the record, expire timestamp, flags, key length,
+# data length; followed by the key and the data
+RECORD = struct.Struct("<IdBHI")
+FLAG_DELETE = 1
+SEGMENT_NAME = re.compile(r"^segment-(\d{8})-(\d{4})\.log$")
+CHECKPOINT_MAGIC = b"FASLCKP1"
+# magic, segment id, segment generation, offset, number of entries
+CHECKPOINT_HEADER = struct.Struct("<8sIHQI")
+# segment id, generation, record offset, record length, expire timestamp,
+# key length
+CHECKPOINT_ENTRY = struct.Struct("<IHQIdH")
+
+
+def segment_name(segment):
+    return "segment-%08d-%04d.log" % segment
+
+
+class SessionLog:
+    '''
+    Append-only log of session records with an in-memory index.
+
+    Segments are named by (id, generation); replay goes in that order and
+    later records win. Compacting the sealed segments up to id N produces
+    segment (N, generation + 1), which sorts after them but before any
+    segment written since.
+    '''
+
+    def __init__(self, directory, fsync="interval", fsync_interval=1.0,
+                 segment_size=64 * 1024 * 1024, compact_ratio=0.5,
+                 compact_interval=60) -> None:
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError("unknown fsync policy %r" % fsync)
+        self.directory = directory
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.compact_interval = compact_interval
+        os.makedirs(directory, exist_ok=True)
+        self._dir_lock = open(os.path.join(directory, "LOCK"), "a+")
+        try:
+            fcntl.flock(self._dir_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._dir_lock.close()
+            raise RuntimeError("session log %s is in use by another process" % directory)
+
+        self._lock = RLock()
+        self._synced = Condition(self._lock)
+        self._syncing = False
+        # bytes appended since startup, and how many of them are fsynced
+        self._appended = 0
+        self._synced_upto = 0
+        # key -> (segment, record offset, record length, expire timestamp)
+        self.index = {}
+        self._maps = {}
+        self.live_bytes = 0
+        self.total_bytes = 0
+        self.compactions = 0
+        self._stop = Event()
+        self._threads = []
+        self._recover()
+
+    # recovery
+
+    def _segments(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2))))
+        return sorted(found)
+
+    def _path(self, segment):
+        return os.path.join(self.directory, segment_name(segment))
+
+    def _recover(self):
+        segments = self._segments()
+        start_segment, start_offset = self._load_checkpoint(segments)
+        for segment in segments:
+            if start_segment is not None and segment < start_segment:
+                continue
+            offset = start_offset if segment == start_segment else 0
+            self._replay(segment, offset, truncate=segment == segments[-1])
+        for segment in segments:
+            self.total_bytes += os.path.getsize(self._path(segment))
+        self.live_bytes = sum(entry[2] for entry in self.index.values())
+        self._open_active(segments[-1] if segments else (1, 0))
+
+    def _load_checkpoint(self, segments):
+        '''
+        Load the index from the checkpoint file; return the position to
+        replay from, or (None, 0) to replay everything
+        '''
+        path = os.path.join(self.directory, "checkpoint")
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            body, crc = raw[:-4], struct.unpack("<I", raw[-4:])[0]
+            if zlib.crc32(body) != crc:
+                raise ValueError("checkpoint checksum mismatch")
+            magic, seg_id, gen, offset, count = CHECKPOINT_HEADER.unpack_from(body)
+            if magic != CHECKPOINT_MAGIC:
+                raise ValueError("not a checkpoint file")
+            index = {}
+            position = CHECKPOINT_HEADER.size
+            for _ in range(count):
+                entry_seg, entry_gen, rec_offset, rec_len, expire_ts, key_len = (
+                    CHECKPOINT_ENTRY.unpack_from(body, position)
+                )
+                position += CHECKPOINT_ENTRY.size
+                key = body[position:position + key_len].decode()
+                position += key_len
+                index[key] = ((entry_seg, entry_gen), rec_offset, rec_len, expire_ts)
+        except FileNotFoundError:
+            return None, 0
+        except (ValueError, struct.error, IndexError):
+            logger.warning("Ignoring unreadable session log checkpoint", exc_info=True)
+            return None, 0
+        sizes = {segment: os.path.getsize(self._path(segment)) for segment in segments}
+        if (seg_id, gen) not in sizes or any(
+            entry[0] not in sizes or entry[1] + entry[2] > sizes[entry[0]]
+            for entry in index.values()
+        ):
+            # stale (its segments were compacted away) or ahead of the data
+            return None, 0
+        self.index = index
+        return (seg_id, gen), offset
+
+    def _replay(self, segment, offset, truncate=False):
+        path = self._path(segment)
+        with open(path, "rb") as f:
+            data = f.read()
+        end = len(data)
+        while offset < end:
+            if offset + RECORD.size > end:
+                break
+            crc, expire_ts, flags, key_len, data_len = RECORD.unpack_from(data, offset)
+            length = RECORD.size + key_len + data_len
+            if offset + length > end or zlib.crc32(data[offset + 4:offset + length]) != crc:
+                break
+            key_start = offset + RECORD.size
+            key = data[key_start:key_start + key_len].decode()
+            if flags & FLAG_DELETE:
+                self.index.pop(key, None)
+            else:
+                self.index[key] = (segment, offset, length, expire_ts)
+            offset += length
+        if offset < end:
+            if truncate:
+                logger.warning("Truncating torn tail of %s at offset %d", path, offset)
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+            else:
+                logger.error("Corrupt record in sealed segment %s at offset %d", path, offset)
+
+    def _open_active(self, segment):
+        self.active = segment
+        self._fd = os.open(self._path(segment), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._end = os.fstat(self._fd).st_size
+
+    # reads
+
+    def _map(self, segment, needed):
+        mm = self._maps.get(segment)
+        if mm is None or len(mm) < needed:
+            if mm is not None:
+                mm.close()
+            with open(self._path(segment), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mm
+        return mm
+
+    def _read(self, entry):
+        segment, offset, length, _ = entry
+        mm = self._map(segment, offset + length)
+        _, _, _, key_len, data_len = RECORD.unpack_from(mm, offset)
+        start = offset + RECORD.size + key_len
+        return mm[start:start + data_len]
+
+    def get(self, key):
+        '''
+        Return (data, expire timestamp) for a live key, or None
+        '''
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is None or entry[3] <= time.time():
+                return None
+            return self._read(entry), entry[3]
+
+    def __contains__(self, key):
+        entry = self.index.get(key)
+        return entry is not None and entry[3] > time.time()
+
+    # writes
+
+    def _append(self, key, data, expire_ts, flags=0):
+        encoded_key = key.encode()
+        body = RECORD.pack(0, expire_ts, flags, len(encoded_key), len(data))[4:] + encoded_key + data
+        record = struct.pack("<I", zlib.crc32(body)) + body
+        if self._end and self._end + len(record) > self.segment_size:
+            self._seal()
+        offset = self._end
+        os.write(self._fd, record)
+        self._end += len(record)
+        self._appended += len(record)
+        self.total_bytes += len(record)
+        old = self.index.pop(key, None)
+        if old is not None:
+            self.live_bytes -= old[2]
+        if not flags & FLAG_DELETE:
+            self.index[key] = (self.active, offset, len(record), expire_ts)
+            self.live_bytes += len(record)
+        return self._appended
+
+    def _seal(self):
+        # the fsync in progress (if any) must not see its descriptor closed
+        while self._syncing:
+            self._synced.wait()
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._synced_upto = self._appended
+        self._open_active((self.active[0] + 1, 0))
+
+    def _sync_to(self, position):
+        '''
+        Wait until the log is fsynced up to 'position', with the lock held.
+        Whoever finds no fsync in progress releases the lock and syncs
+        everything appended so far, for all the writers waiting meanwhile.
+        '''
+        while self._synced_upto < position:
+            if self._syncing:
+                self._synced.wait()
+                continue
+            self._syncing = True
+            target, fd = self._appended, self._fd
+            self._lock.release()
+            try:
+                os.fsync(fd)
+            finally:
+                self._lock.acquire()
+                self._syncing = False
+                self._synced_upto = max(self._synced_upto, target)
+                self._synced.notify_all()
+
+    def _commit(self, position):
+        if self.fsync == "always":
+            self._sync_to(position)
+
+    def put(self, key, data, expire_ts, must_create=False):
+        with self._lock:
+            if must_create and key in self:
+                raise CreateError
+            self._commit(self._append(key, data, expire_ts))
+
+    def touch(self, key, expire_ts):
+        '''
+        Rewrite a live record with a new expiry; return False if the key is
+        gone
+        '''
+        with self._lock:
+            current = self.get(key)
+            if current is None:
+                return False
+            self._commit(self._append(key, current[0], expire_ts))
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self.index:
+                self._commit(self._append(key, b"", 0.0, FLAG_DELETE))
+
+    def sync(self):
+        with self._lock:
+            self._sync_to(self._appended)
+
+    # compaction and checkpoints
+
+    def garbage_ratio(self):
+        now = time.time()
+        expired = sum(entry[2] for entry in self.index.values() if entry[3] <= now)
+        garbage = self.total_bytes - self.live_bytes + expired
+        return garbage / self.total_bytes if self.total_bytes else 0.0
+
+    def compact(self):
+        '''
+        Seal the active segment and rewrite every sealed segment into one,
+        dropping overwritten, deleted and expired records. Return the number
+        of expired sessions dropped.
+        '''
+        with self._lock:
+            if self._end:
+                self._seal()
+            sealed = [segment for segment in self._segments() if segment < self.active]
+            if not sealed:
+                return 0
+            output = (sealed[-1][0], sealed[-1][1] + 1)
+            now = time.time()
+            entries = [
+                (key, entry) for key, entry in self.index.items()
+                if entry[0] in sealed
+            ]
+        expired = 0
+        moved = {}
+        tmp_path = self._path(output) + ".tmp"
+        # sealed segments are immutable, so copying needs no lock
+        with open(tmp_path, "wb") as out:
+            position = 0
+            for key, entry in entries:
+                if entry[3] <= now:
+                    expired += 1
+                    continue
+                segment, offset, length, expire_ts = entry
+                with self._lock:
+                    record = self._map(segment, offset + length)[offset:offset + length]
+                out.write(record)
+                moved[key] = (entry, (output, position, length, expire_ts))
+                position += length
+            out.flush()
+            os.fsync(out.fileno())
+        with self._lock:
+            os.replace(tmp_path, self._path(output))
+            for key, entry in entries:
+                if self.index.get(key) != entry:
+                    continue  # written again since
+                if key in moved:
+                    self.index[key] = moved[key][1]
+                else:
+                    del self.index[key]
+                    self.live_bytes -= entry[2]
+            for segment in sealed:
+                mm = self._maps.pop(segment, None)
+                if mm is not None:
+                    mm.close()
+                self.total_bytes -= os.path.getsize(self._path(segment))
+                os.remove(self._path(segment))
+            self.total_bytes += position
+            self.compactions += 1
+            self.checkpoint()
+        return expired
+
+    def checkpoint(self):
+        '''
+        Write the index to the checkpoint file (atomically), so a restart
+        only replays the records appended after this point
+        '''
+        with self._lock:
+            # the index must not point past what a crash would leave
+            self._sync_to(self._appended)
+            parts = [CHECKPOINT_HEADER.pack(
+                CHECKPOINT_MAGIC, self.active[0], self.active[1], self._end, len(self.index)
+            )]
+            for key, (segment, offset, length, expire_ts) in self.index.items():
+                encoded = key.encode()
+                parts.append(CHECKPOINT_ENTRY.pack(
+                    segment[0], segment[1], offset, length, expire_ts, len(encoded)
+                ))
+                parts.append(encoded)
+            body = b"".join(parts)
+        path = os.path.join(self.directory, "checkpoint")
+        with open(path + ".tmp", "wb") as f:
+            f.write(body + struct.pack("<I", zlib.crc32(body)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    # background work
+
+    def start(self):
+        '''
+        Start the background fsync (policy 'interval') and compaction threads
+        '''
+        if self._threads:
+            return
+        if self.fsync == "interval":
+            self._threads.append(Thread(target=self._run_fsync, daemon=True))
+        if self.compact_interval:
+            self._threads.append(Thread(target=self._run_compaction, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _run_fsync(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                if self._synced_upto < self._appended:
+                    self.sync()
+            except Exception:
+                logger.exception("Syncing the session log failed")
+
+    def _run_compaction(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                if self.garbage_ratio() >= self.compact_ratio:
+                    self.compact()
+            except Exception:
+                logger.exception("Compacting the session log failed")
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._lock:
+            self.checkpoint()
+            os.close(self._fd)
+            for mm in self._maps.values():
+                mm.close()
+            self._maps.clear()
+        self._dir_lock.close()
+
+    def stats(self):
+        return {
+            "keys": len(self.index),
+            "segments": len(self._segments()),
+            "total_bytes": self.total_bytes,
+            "live_bytes": self.live_bytes,
+            "garbage_ratio": self.garbage_ratio(),
+            "compactions": self.compactions,
+        }
+
+
+class LogSessionStore(SessionBase):
+    '''
+    Implement session store with an append-only local log as the backend
+    (see session.log_store)
+    '''
+
+    # opened from the SESSION_LOG_* settings on first use
+    log = None
+    _log_lock = RLock()
+
+    def __init__(self, session_key=None) -> None:
+        super().__init__(session_key)
+
+    @classmethod
+    def get_log(cls):
+        if cls.log is None:
+            with cls._log_lock:
+                if cls.log is None:
+                    log = SessionLog(
+                        Config.SESSION_LOG_DIR,
+                        fsync=Config.SESSION_LOG_FSYNC,
+                        fsync_interval=Config.SESSION_LOG_FSYNC_INTERVAL,
+                        segment_size=Config.SESSION_LOG_SEGMENT_SIZE,
+                        compact_ratio=Config.SESSION_LOG_COMPACT_RATIO,
+                        compact_interval=Config.SESSION_LOG_COMPACT_INTERVAL,
+                    )
+                    log.start()
+                    cls.log = log
+        return cls.log
+
+    def load(self):
+        found = self.get_log().get(self.session_key) if self.session_key else None
+        if found is None:
+            self._session_key = None
+            return {}
+        data, expire_ts = found
+        self._stored_expire_date = datetime.fromtimestamp(expire_ts)
+        return self.decode(data.decode())
+
+    def exists(self, session_key):
+        return session_key in self.get_log()
+
+    def create(self):
+        while True:
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        expire_date = self.get_expiry_date()
+        self.get_log().put(
+            self.session_key, self.encode(data).encode(), expire_date.timestamp(), must_create
+        )
+        self._stored_expire_date = expire_date
+
+    def touch(self):
+        if self.session_key is None:
+            self.save()
+            return True
+        expire_date = self.get_expiry_date()
+        if not self.get_log().touch(self.session_key, expire_date.timestamp()):
+            return False
+        self._stored_expire_date = expire_date
+        return True
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self.get_log().delete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        '''
+        Compact the log, which drops expired sessions; return how many
+        '''
+        return cls.get_log().compact()
+
+    # Reads only touch memory, and so do writes unless every write waits
+    # for its fsync: only then is a worker thread worth its overhead.
+
+    async def aload(self):
+        return self.load()
+
+    async def aexists(self, session_key):
+        return self.exists(session_key)
+
+    def _blocking(self):
+        return self.get_log().fsync == "always"
+
+    async def asave(self, must_create=False):
+        if self._blocking():
+            return await asyncio.to_thread(self.save, must_create)
+        return self.save(must_create)
+
+    async def acreate(self):
+        if self._blocking():
+            return await asyncio.to_thread(self.create)
+        return self.create()
+
+    async def atouch(self):
+        if self._blocking():
+            return await asyncio.to_thread(self.touch)
+        return self.touch()
+
+    async def adelete(self, session_key=None):
+        if self._blocking():
+            return await asyncio.to_thread(self.delete, session_key)
+        return self.delete(session_key)
@@ -0,0 +1,286 @@
+"""
+Instrumentation of the session stores.
+
+Every SessionBase subclass gets its storage methods (load, save, exists,
+create, delete, touch, clear_expired and their async variants) wrapped so
+that, when SESSION_METRICS is on, each call records its latency and any
+exception it raises. Stores also report create retries, cache hits and
+misses and encoded payload sizes.
+
+Events go to every registered hook, a callable taking
+(kind, name, value, labels) where kind is "counter" or "histogram". The
+default hook is the in-process Registry, which renders the Prometheus
+text format (see metrics_endpoint):
+
+    >>> add_hook(lambda kind, name, value, labels: print(name, value, labels))
+
+With SESSION_METRICS off (the default) the wrappers only check the setting
+and call through.
+"""
+from session.constants import Config
+from contextvars import ContextVar
+from threading import Lock
+import asyncio
+import functools
+import time
+
+# storage methods that are timed, mapped to the operation label they report
+OPERATIONS = {
+    "load": "load",
+    "save": "save",
+    "exists": "exists",
+    "create": "create",
+    "delete": "delete",
+    "touch": "touch",
+    "clear_expired": "clear_expired",
+    "aload": "load",
+    "asave": "save",
+    "aexists": "exists",
+    "acreate": "create",
+    "adelete": "delete",
+    "atouch": "touch",
+    "aclear_expired": "clear_expired",
+}
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+METRICS = {
+    "session_operation_seconds": ("histogram", "Latency of session store operations"),
+    "session_operation_errors_total": ("counter", "Session store operations that raised"),
+    "session_create_retries_total": ("counter", "Session keys that collided on create and were redrawn"),
+    "session_cache_hits_total": ("counter", "Session loads served from the in-process cache"),
+    "session_cache_misses_total": ("counter", "Session loads that missed the in-process cache"),
+    "session_payload_bytes": ("histogram", "Size of encoded session data"),
+}
+
+BUCKETS = {
+    "session_payload_bytes": SIZE_BUCKETS,
+}
+
+# set while an instrumented operation runs, so that the store methods it
+# calls internally (e.g. create() -> save()) aren't recorded twice
+_active = ContextVar("session_metrics_active", default=False)
+
+
+class Registry:
+    '''
+    In-process store of counters and histograms, rendered in the Prometheus
+    text exposition format.
+
+    Collectors are callables returning (name, value, labels) tuples that are
+    reported as gauges at render time, for state owned by other components
+    (connection pool, write-behind queue, ...).
+    '''
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._collectors = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def record(self, kind, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if kind == "counter":
+                self.counters[key] = self.counters.get(key, 0) + value
+                return
+            buckets = BUCKETS.get(name, LATENCY_BUCKETS)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0, 0.0]
+            counts = histogram[0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            histogram[1] += 1
+            histogram[2] += value
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        self._collectors.remove(collector)
+
+    def render(self):
+        '''
+        Return every metric in the Prometheus text format
+        '''
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                help_text = METRICS.get(name, (kind, name))[1]
+                lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s %s" % (name, kind))
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+        for (name, labels), (counts, count, total) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS.get(name, LATENCY_BUCKETS), counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", _number(bound)),)
+                lines.append("%s_bucket%s %d" % (name, _labels(bucket_labels), cumulative))
+            lines.append("%s_bucket%s %d" % (name, _labels(labels + (("le", "+Inf"),)), count))
+            lines.append("%s_sum%s %s" % (name, _labels(labels), _number(total)))
+            lines.append("%s_count%s %d" % (name, _labels(labels), count))
+        for collector in list(self._collectors):
+            for name, value, labels in collector():
+                describe(name, "gauge")
+                lines.append("%s%s %s" % (name, _labels(tuple(sorted(labels.items()))), _number(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+
+
+def _number(value):
+    if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+        value = int(value)
+    return str(value)
+
+
+registry = Registry()
+hooks = [registry.record]
+
+
+def add_hook(hook):
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    hooks.remove(hook)
+
+
+def enabled():
+    return Config.SESSION_METRICS
+
+
+def inc(name, amount=1, **labels):
+    if Config.SESSION_METRICS:
+        for hook in hooks:
+            hook("counter", name, amount, labels)
+
+
+def observe(name, value, **labels):
+    if Config.SESSION_METRICS:
+        for hook in hooks:
+            hook("histogram", name, value, labels)
+
+
+def stats_collector(prefix, get_stats, **labels):
+    '''
+    Return a collector reporting every numeric value of the dict returned by
+    get_stats() (e.g. pool_status() or WriteBehindQueue.stats()) as a gauge
+    named prefix + key. get_stats() may return None when there is nothing
+    to report.
+    '''
+    def collect():
+        stats = get_stats() or {}
+        return [
+            (prefix + key, value, labels)
+            for key, value in stats.items()
+            if isinstance(value, (int, float))
+        ]
+    return collect
+
+
+def _backend(owner):
+    return owner.__name__ if isinstance(owner, type) else type(owner).__name__
+
+
+def _record(operation, owner, start, error):
+    backend = _backend(owner)
+    observe("session_operation_seconds", time.perf_counter() - start,
+            operation=operation, backend=backend)
+    if error is not None:
+        inc("session_operation_errors_total", operation=operation,
+            backend=backend, error=type(error).__name__)
+
+
+def instrument(func, operation):
+    '''
+    Wrap a store method (sync or async, bound to an instance or a class) so
+    that it reports its latency as 'operation'
+    '''
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(owner, *args, **kwargs):
+            if not Config.SESSION_METRICS or _active.get():
+                return await func(owner, *args, **kwargs)
+            token = _active.set(True)
+            start = time.perf_counter()
+            error = None
+            try:
+                return await func(owner, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _active.reset(token)
+                _record(operation, owner, start, error)
+    else:
+        @functools.wraps(func)
+        def wrapper(owner, *args, **kwargs):
+            if not Config.SESSION_METRICS or _active.get():
+                return func(owner, *args, **kwargs)
+            token = _active.set(True)
+            start = time.perf_counter()
+            error = None
+            try:
+                return func(owner, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _active.reset(token)
+                _record(operation, owner, start, error)
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_class(cls):
+    '''
+    Instrument the storage methods defined by cls itself (inherited ones
+    are already wrapped on the class defining them)
+    '''
+    for name, operation in OPERATIONS.items():
+        attr = cls.__dict__.get(name)
+        if attr is None:
+            continue
+        if isinstance(attr, classmethod):
+            if not getattr(attr.__func__, "_instrumented", False):
+                setattr(cls, name, classmethod(instrument(attr.__func__, operation)))
+        elif callable(attr) and not getattr(attr, "_instrumented", False):
+            setattr(cls, name, instrument(attr, operation))
+
+
+async def metrics_endpoint(request):
+    '''
+    Route returning the registry in the Prometheus text format; mount it
+    with app.add_route(Config.SESSION_METRICS_PATH, metrics_endpoint)
+    '''
+    from starlette.responses import PlainTextResponse
+
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,131 @@
+from session.constants import Config
+from session.lazy import LazySession
+from session.utils import import_string
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+import http.cookies
+
+
+def _path_matches(path, prefixes):
+    return any(
+        path == prefix or path.startswith(prefix.rstrip('/') + '/')
+        for prefix in prefixes
+    )
+
+
+def session_enabled_for(path):
+    '''
+    Paths under SESSION_EXEMPT_PATHS never get a session; when SESSION_PATHS
+    is set, only paths under one of its prefixes do.
+    '''
+    if _path_matches(path, Config.SESSION_EXEMPT_PATHS):
+        return False
+    return Config.SESSION_PATHS is None or _path_matches(path, Config.SESSION_PATHS)
+
+
+def session_cookie_header(value, max_age):
+    '''
+    Return the Set-Cookie header value for the session cookie
+    '''
+    cookie = http.cookies.SimpleCookie()
+    cookie[Config.SESSION_KEY_NAME] = value
+    morsel = cookie[Config.SESSION_KEY_NAME]
+    morsel["max-age"] = max_age
+    morsel["path"] = Config.SESSION_COOKIE_PATH
+    if max_age <= 0:
+        morsel["expires"] = "Thu, 01 Jan 1970 00:00:00 GMT"
+    if Config.SESSION_COOKIE_DOMAIN is not None:
+        morsel["domain"] = Config.SESSION_COOKIE_DOMAIN
+    if Config.SESSION_COOKIE_SECURE:
+        morsel["secure"] = True
+    if Config.SESSION_COOKIE_HTTPONLY:
+        morsel["httponly"] = True
+    if Config.SESSION_COOKIE_SAMESITE is not None:
+        morsel["samesite"] = Config.SESSION_COOKIE_SAMESITE
+    return cookie.output(header="").strip()
+
+
+class SessionMiddleware:
+    '''
+    Pure ASGI session middleware.
+
+    Reads the session cookie from the raw request headers and attaches a
+    LazySession to the scope (available as request.state.session and
+    request.session). When the response starts, it persists the session
+    if the route used it and sets, refreshes or deletes the cookie by
+    rewriting the http.response.start headers.
+
+    'store_class' is the session store class (or its dotted path); by
+    default SESSION_ENGINE is used.
+    '''
+
+    def __init__(self, app, store_class=None) -> None:
+        self.app = app
+        if isinstance(store_class, str):
+            store_class = import_string(store_class)
+        self.store_class = store_class
+
+    def get_store_class(self):
+        return self.store_class or import_string(Config.SESSION_ENGINE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not session_enabled_for(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        session_key = self._session_key_from_headers(scope["headers"])
+        store_class = self.get_store_class()
+        session = LazySession(lambda: store_class(session_key))
+        scope.setdefault("state", {})["session"] = session
+        scope["session"] = session
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and session.is_loaded():
+                await self.process_response(
+                    session._wrapped, session_key is not None, message
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _session_key_from_headers(self, headers):
+        for name, value in headers:
+            if name == b"cookie":
+                cookies = cookie_parser(value.decode("latin-1"))
+                if Config.SESSION_KEY_NAME in cookies:
+                    return cookies[Config.SESSION_KEY_NAME]
+        return None
+
+    async def process_response(self, session, had_cookie, message):
+        '''
+        Persist the session if needed and update the cookie headers of the
+        http.response.start message. The middleware owns persistence: it
+        writes only when the data changed, and otherwise at most bumps the
+        expiry once per refresh interval.
+        '''
+        headers = MutableHeaders(scope=message)
+        accessed = session.accessed
+        modified = session.modified
+        empty = session.is_empty()
+
+        if had_cookie and empty:
+            headers.append("set-cookie", session_cookie_header("", 0))
+            return
+
+        if accessed:
+            headers.add_vary_header("Cookie")
+        if empty or message["status"] >= 500:
+            return
+        if modified:
+            await session.asave()
+        elif accessed and Config.SESSION_SAVE_EVERY_REQUEST and session.needs_refresh():
+            if not await session.atouch():
+                # deleted elsewhere (e.g. logged out) while we were working
+                headers.append("set-cookie", session_cookie_header("", 0))
+                return
+        else:
+            return
+        headers.append(
+            "set-cookie",
+            session_cookie_header(session.session_key, session.get_expiry_age()),
+        )
@@ -0,0 +1,486 @@
+"""
+Session storage partitioned by expiry time.
+
+PartitionedSessionStore stores each session in a bucket table chosen by its
+expire_date: one table per day or per hour (SESSION_PARTITION_SIZE), named
+fastapi_sessions_d20261018 or fastapi_sessions_h2026101814. The
+fastapi_session_buckets registry lists the buckets with the time range
+each one covers. Once a bucket's range is over, every session in it has
+expired, so clear_expired() drops the whole table instead of deleting rows.
+The cost no longer grows with the number of sessions, and no expire_date
+index has to be maintained.
+
+Lookups probe only the live buckets, those whose range ends in the future,
+by primary key. A save or touch that moves the expiry into another bucket
+moves the row there in the same transaction.
+
+Bucket tables are created on first use, and the bucket after the one
+being written is registered ahead of time. Other processes find them in
+the registry: a lookup that misses re-reads it first, at most once every
+SESSION_PARTITION_REFRESH_INTERVAL seconds.
+
+    Config.SESSION_ENGINE = "session.partitioned.PartitionedSessionStore"
+
+Needs the fastapi_session_buckets table (alembic upgrade head).
+"""
+from session.db_adapter import (
+    SessionStore, FastAPI_Session, FastAPI_SessionBucket, session_scope, upsert_statement,
+)
+from session.session import CreateError, UpdateError
+from session.constants import Config
+from session.utils import chunks
+from sqlalchemy import (
+    Column, DateTime, MetaData, String, Table, Text, delete, exc, func, insert,
+    literal, select, union_all, update,
+)
+from sqlalchemy.schema import CreateIndex, CreateTable, DropTable
+from datetime import datetime, timedelta
+from threading import Lock
+import re
+import time
+
+BUCKET_TABLE = re.compile(r"^fastapi_sessions_[dh]\d+$")
+SIZES = {
+    "day": ("d%Y%m%d", timedelta(days=1)),
+    "hour": ("h%Y%m%d%H", timedelta(hours=1)),
+}
+
+
+def is_bucket_table(name):
+    return bool(BUCKET_TABLE.match(name))
+
+
+class Buckets:
+    '''
+    The bucket tables known from the registry, and the bucket a given
+    expire_date belongs to
+    '''
+
+    def __init__(self, size="day", refresh_interval=5) -> None:
+        if size not in SIZES:
+            raise ValueError("unknown partition size %r" % size)
+        self.size = size
+        self.length = SIZES[size][1]
+        self.refresh_interval = refresh_interval
+        self.metadata = MetaData()
+        self._ranges = {}
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._lock = Lock()
+
+    def bounds(self, expire_date):
+        '''
+        Return (name, starts_at, ends_at) of the bucket of 'expire_date'
+        '''
+        name_format, length = SIZES[self.size]
+        expire_date = expire_date.replace(tzinfo=None)
+        if self.size == "day":
+            start = expire_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            start = expire_date.replace(minute=0, second=0, microsecond=0)
+        return "fastapi_sessions_" + start.strftime(name_format), start, start + length
+
+    def name_for(self, expire_date):
+        return self.bounds(expire_date)[0]
+
+    def table(self, name):
+        with self._lock:
+            table = self.metadata.tables.get(name)
+            if table is None:
+                table = Table(
+                    name, self.metadata,
+                    Column("session_key", String(40), primary_key=True, nullable=False),
+                    Column("session_data", Text),
+                    Column("expire_date", DateTime(timezone=True), nullable=False),
+                    Column("user_id", String(64), index=True, nullable=True),
+                )
+            return table
+
+    def refresh(self, session):
+        '''
+        Re-read the registry; return the names of the buckets it added
+        '''
+        rows = session.execute(select(
+            FastAPI_SessionBucket.name, FastAPI_SessionBucket.starts_at, FastAPI_SessionBucket.ends_at,
+        )).all()
+        ranges = {name: (starts_at, ends_at) for name, starts_at, ends_at in rows}
+        with self._lock:
+            added = [name for name in ranges if name not in self._ranges]
+            self._ranges = ranges
+            self._loaded = True
+            self._refreshed_at = time.monotonic()
+        return added
+
+    def refresh_if_stale(self, session):
+        '''
+        refresh() unless the registry was read less than refresh_interval
+        seconds ago, in which case nothing is added
+        '''
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return []
+        return self.refresh(session)
+
+    def live(self, session, now):
+        '''
+        Return the tables of the buckets whose range ends after 'now'
+        '''
+        if not self._loaded:
+            self.refresh(session)
+        return [
+            self.table(name)
+            for name, (_, ends_at) in sorted(self._ranges.items())
+            if ends_at.replace(tzinfo=None) > now
+        ]
+
+    def expired(self, session, now):
+        self.refresh(session)
+        return [
+            name for name, (_, ends_at) in sorted(self._ranges.items())
+            if ends_at.replace(tzinfo=None) <= now
+        ]
+
+    def ensure(self, factory, expire_date):
+        '''
+        Return the table of the bucket of 'expire_date', creating and
+        registering it in its own transaction if needed
+        '''
+        name, starts_at, ends_at = self.bounds(expire_date)
+        table = self.table(name)
+        if name in self._ranges:
+            return table
+        with session_scope(factory) as session:
+            connection = session.connection()
+            connection.execute(CreateTable(table, if_not_exists=True))
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+            stmt = upsert_statement(
+                connection.dialect.name,
+                {"name": name, "starts_at": starts_at, "ends_at": ends_at},
+                FastAPI_SessionBucket.__table__,
+            )
+            if stmt is None:
+                stmt = insert(FastAPI_SessionBucket).values(name=name, starts_at=starts_at, ends_at=ends_at)
+            try:
+                session.execute(stmt)
+                session.commit()
+            except exc.IntegrityError:
+                # registered by another process in the meantime
+                session.rollback()
+        with self._lock:
+            self._ranges[name] = (starts_at, ends_at)
+        return table
+
+    def forget(self, name):
+        with self._lock:
+            self._ranges.pop(name, None)
+            table = self.metadata.tables.get(name)
+            if table is not None:
+                self.metadata.remove(table)
+
+
+class PartitionedSessionStore(SessionStore):
+    '''
+    Implement session store with DB as the backend, sessions being stored
+    in one table per expiry day or hour (see session.partitioned)
+    '''
+
+    # built from SESSION_PARTITION_SIZE on first use
+    buckets = None
+    _buckets_lock = Lock()
+
+    @classmethod
+    def get_buckets(cls):
+        if cls.buckets is None:
+            with cls._buckets_lock:
+                if cls.buckets is None:
+                    cls.buckets = Buckets(
+                        Config.SESSION_PARTITION_SIZE, Config.SESSION_PARTITION_REFRESH_INTERVAL,
+                    )
+        return cls.buckets
+
+    @classmethod
+    def _ensure(cls, expire_date):
+        '''
+        Return the bucket table for 'expire_date', registering the following
+        bucket as well: other processes then learn about a bucket (on their
+        next registry refresh) before anyone writes to it
+        '''
+        buckets = cls.get_buckets()
+        factory = cls._factory()
+        buckets.ensure(factory, expire_date + buckets.length)
+        return buckets.ensure(factory, expire_date)
+
+    @classmethod
+    def _factory(cls):
+        return next(iter(cls._all_factories()))
+
+    @classmethod
+    def _probe(cls, session, tables, session_keys, now):
+        '''
+        Return the live rows of the given sessions found in 'tables'
+        '''
+        if not tables:
+            return []
+        selects = [
+            select(table.c.session_key, table.c.session_data, table.c.expire_date, table.c.user_id)
+            .where(table.c.session_key.in_(session_keys))
+            .where(table.c.expire_date > now)
+            for table in tables
+        ]
+        return session.execute(union_all(*selects) if len(selects) > 1 else selects[0]).all()
+
+    @classmethod
+    def _find(cls, session, session_keys):
+        '''
+        Return {session_key: row} for the given sessions, probing the live
+        buckets and, for the keys not found, the buckets other processes
+        registered since the last look at the registry
+        '''
+        buckets = cls.get_buckets()
+        now = datetime.now()
+        try:
+            rows = cls._probe(session, buckets.live(session, now), session_keys, now)
+        except exc.DBAPIError:
+            # a bucket was dropped by another process
+            session.rollback()
+            buckets.refresh(session)
+            rows = cls._probe(session, buckets.live(session, now), session_keys, now)
+        found = {}
+        # a row moved concurrently by two processes may briefly exist twice:
+        # the one expiring last is the newest
+        for row in sorted(rows, key=lambda row: row.expire_date.replace(tzinfo=None)):
+            found[row.session_key] = row
+        missing = [key for key in session_keys if key not in found]
+        if missing:
+            added = set(buckets.refresh_if_stale(session))
+            tables = [table for table in buckets.live(session, now) if table.name in added]
+            for row in cls._probe(session, tables, missing, now):
+                found[row.session_key] = row
+        return found
+
+    def _fetch_session(self):
+        session_key = self.session_key
+        try:
+            with self._unit_of_work(session_key) as session:
+                return self._find(session, [session_key]).get(session_key)
+        except Exception:
+            self._session_key = None
+
+    def exists(self, session_key):
+        with self._unit_of_work(session_key) as session:
+            return session_key in self._find(session, [session_key])
+
+    def _old_tables(self, session, target):
+        '''
+        Return the bucket tables the session may still be in besides
+        'target': the one of the stored expire_date when known, else every
+        live bucket
+        '''
+        buckets = self.get_buckets()
+        if self._stored_expire_date is not None:
+            name = buckets.name_for(self._stored_expire_date)
+            return [] if name == target.name else [buckets.table(name)]
+        return [
+            table for table in buckets.live(session, datetime.now())
+            if table.name != target.name
+        ]
+
+    def save(self, must_create=False):
+        '''
+        Write the session to the bucket of its expire_date, removing it from
+        the bucket it was in before if that changed
+        '''
+        if self._session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        values = self.create_model_values(data)
+        session_key = values["session_key"]
+        target = self._ensure(values["expire_date"])
+
+        try:
+            with self._unit_of_work(session_key) as session:
+                if must_create:
+                    if self._find(session, [session_key]):
+                        raise CreateError
+                    session.execute(insert(target).values(values))
+                else:
+                    stmt = upsert_statement(session.get_bind().dialect.name, values, target)
+                    if stmt is not None:
+                        session.execute(stmt)
+                    elif not session.execute(
+                        update(target).where(target.c.session_key == session_key).values(values)
+                    ).rowcount:
+                        session.execute(insert(target).values(values))
+                    for table in self._old_tables(session, target):
+                        session.execute(delete(table).where(table.c.session_key == session_key))
+                session.commit()
+            self._stored_expire_date = values["expire_date"]
+            self._forget(session_key)
+        except exc.IntegrityError:
+            if must_create:
+                raise CreateError
+            raise
+        except exc.DatabaseError:
+            if not must_create:
+                raise UpdateError
+            raise
+
+    def touch(self):
+        '''
+        Update the expire_date in place when it stays in the same bucket;
+        otherwise move the row to the new bucket with INSERT ... SELECT.
+        The row is expected in the bucket of the stored expire_date; if
+        another request moved it, it is looked up in every live bucket.
+        Return False if the row is gone.
+        '''
+        if self.session_key is None or self._stored_expire_date is None:
+            self.save()
+            return True
+
+        session_key = self.session_key
+        expire_date = self.get_expiry_date()
+        buckets = self.get_buckets()
+        target = self._ensure(expire_date)
+        source = buckets.table(buckets.name_for(self._stored_expire_date))
+        with self._unit_of_work(session_key) as session:
+            moved = self._move(session, session_key, source, target, expire_date)
+            if not moved:
+                row = self._find(session, [session_key]).get(session_key)
+                if row is not None:
+                    source = buckets.table(buckets.name_for(row.expire_date))
+                    moved = self._move(session, session_key, source, target, expire_date)
+            session.commit()
+        self._forget(session_key)
+        if moved:
+            self._stored_expire_date = expire_date
+        return bool(moved)
+
+    @staticmethod
+    def _move(session, session_key, source, target, expire_date):
+        '''
+        Set the expire_date of the session's row in 'source', moving it to
+        'target' if that is another bucket. Return whether the row was there.
+        '''
+        if source is target:
+            return session.execute(
+                update(target).where(target.c.session_key == session_key)
+                .values(expire_date=expire_date)
+            ).rowcount
+        moved = session.execute(
+            insert(target).from_select(
+                ["session_key", "session_data", "expire_date", "user_id"],
+                select(
+                    source.c.session_key, source.c.session_data,
+                    literal(expire_date, DateTime(timezone=True)), source.c.user_id,
+                ).where(source.c.session_key == session_key),
+            )
+        ).rowcount
+        session.execute(delete(source).where(source.c.session_key == session_key))
+        return moved
+
+    @classmethod
+    def _delete_rows(cls, session, session_keys):
+        deleted = 0
+        for table in cls.get_buckets().live(session, datetime.now()):
+            deleted += session.execute(
+                delete(table).where(table.c.session_key.in_(session_keys))
+            ).rowcount
+        return deleted
+
+    @classmethod
+    def load_many(cls, session_keys, chunk_size=None):
+        chunk_size = chunk_size or Config.SESSION_BULK_CHUNK_SIZE
+        decode = cls().decode
+        loaded = {}
+        with session_scope(cls._factory()) as session:
+            for chunk in chunks(session_keys, chunk_size):
+                loaded.update(
+                    (key, decode(row.session_data))
+                    for key, row in cls._find(session, chunk).items()
+                )
+        return loaded
+
+    @classmethod
+    def keys_for_user(cls, user_id):
+        with session_scope(cls._factory()) as session:
+            return [
+                key
+                for table in cls.get_buckets().live(session, datetime.now())
+                for key in session.scalars(
+                    select(table.c.session_key).where(table.c.user_id == str(user_id))
+                )
+            ]
+
+    @classmethod
+    def delete_for_user(cls, user_id):
+        deleted = 0
+        with session_scope(cls._factory()) as session:
+            for table in cls.get_buckets().live(session, datetime.now()):
+                deleted += session.execute(
+                    delete(table).where(table.c.user_id == str(user_id))
+                ).rowcount
+            session.commit()
+        return deleted
+
+    @classmethod
+    def clear_expired(cls, chunk_size=None):
+        '''
+        Drop the buckets whose time range is over, all of their sessions
+        having expired. Return the number of sessions removed, like the
+        other stores.
+        '''
+        buckets = cls.get_buckets()
+        deleted = 0
+        with session_scope(cls._factory()) as session:
+            for name in buckets.expired(session, datetime.now()):
+                table = buckets.table(name)
+                # one count per bucket, still far cheaper than deleting rows
+                count = session.scalar(select(func.count()).select_from(table))
+                session.execute(DropTable(table, if_exists=True))
+                session.execute(delete(FastAPI_SessionBucket).where(FastAPI_SessionBucket.name == name))
+                session.commit()
+                buckets.forget(name)
+                deleted += count
+        return deleted
+
+    @classmethod
+    def import_sessions(cls, chunk_size=None):
+        '''
+        Move the live sessions of the fastapi_sessions table into buckets,
+        when switching an existing deployment to this store. Return the
+        number of moved sessions.
+        '''
+        chunk_size = chunk_size or Config.SESSION_BULK_CHUNK_SIZE
+        buckets = cls.get_buckets()
+        factory = cls._factory()
+        moved = 0
+        while True:
+            with session_scope(factory) as session:
+                rows = session.execute(
+                    select(
+                        FastAPI_Session.session_key, FastAPI_Session.session_data,
+                        FastAPI_Session.expire_date, FastAPI_Session.user_id,
+                    )
+                    .where(FastAPI_Session.expire_date > datetime.now())
+                    .limit(chunk_size)
+                ).all()
+            if not rows:
+                return moved
+            grouped = {}
+            for row in rows:
+                grouped.setdefault(buckets.name_for(row.expire_date), []).append(row._asdict())
+            tables = {
+                name: buckets.ensure(factory, values[0]["expire_date"])
+                for name, values in grouped.items()
+            }
+            with session_scope(factory) as session:
+                dialect_name = session.get_bind().dialect.name
+                for name, values in grouped.items():
+                    stmt = upsert_statement(dialect_name, values, tables[name])
+                    session.execute(stmt if stmt is not None else insert(tables[name]).values(values))
+                session.execute(delete(FastAPI_Session).where(
+                    FastAPI_Session.session_key.in_([row.session_key for row in rows])
+                ))
+                session.commit()
+            moved += len(rows)
@@ -0,0 +1,106 @@
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from session.constants import Config
+from threading import Lock
+import time
+
+
+class PoolStats:
+    '''
+    Checkout wait-time statistics for a connection pool
+    '''
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total": self.wait_total,
+                "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+                "wait_max": self.wait_max,
+            }
+
+
+class TimedPoolMixin:
+    '''
+    Measure how long each checkout waits for a free connection
+    '''
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        # keep the counters when the pool is recreated (e.g. after invalidation)
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_status(engine):
+    '''
+    Return the current pool occupancy and checkout wait statistics of an
+    engine, to help sizing the pool for the request rate.
+    '''
+    pool = getattr(engine, "sync_engine", engine).pool
+    status = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.as_dict())
+    return status
+
+
+def pool_options():
+    '''
+    Engine keyword arguments built from the SESSION_DB_POOL_* settings
+    '''
+    return {
+        "pool_size": Config.SESSION_DB_POOL_SIZE,
+        "max_overflow": Config.SESSION_DB_MAX_OVERFLOW,
+        "pool_timeout": Config.SESSION_DB_POOL_TIMEOUT,
+        "pool_recycle": Config.SESSION_DB_POOL_RECYCLE,
+        "pool_pre_ping": Config.SESSION_DB_POOL_PRE_PING,
+    }
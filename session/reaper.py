@@ -0,0 +1,82 @@
+"""
+Remove expired sessions, either periodically from the app lifespan
+(SessionReaper) or once from cron:
+
+    python -m session.reaper [--store session.db_adapter.SessionStore] [--chunk-size 1000]
+"""
+from session.utils import import_string
+import argparse
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    '''
+    Periodically call clear_expired() on a session store class from an
+    asyncio task
+    '''
+
+    def __init__(self, store_class, interval=3600) -> None:
+        self.store_class = store_class
+        self.interval = interval
+        self.last_run = None
+        self._task = None
+
+    async def run_once(self):
+        '''
+        Clear expired sessions once. Return the rows deleted and the seconds
+        it took.
+        '''
+        start = time.perf_counter()
+        deleted = await self.store_class.aclear_expired() or 0
+        elapsed = time.perf_counter() - start
+        self.last_run = {"deleted": deleted, "seconds": elapsed}
+        logger.info("Deleted %d expired sessions in %.3fs", deleted, elapsed)
+        return deleted, elapsed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Clearing expired sessions failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove expired sessions.")
+    parser.add_argument(
+        "--store", default="session.db_adapter.SessionStore",
+        help="dotted path of the session store class",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="rows deleted per statement (SQL stores)",
+    )
+    args = parser.parse_args(argv)
+
+    store_class = import_string(args.store)
+    kwargs = {"chunk_size": args.chunk_size} if args.chunk_size else {}
+    start = time.perf_counter()
+    deleted = store_class.clear_expired(**kwargs) or 0
+    print("Deleted %d expired sessions in %.3fs" % (deleted, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
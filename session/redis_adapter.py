@@ -0,0 +1,214 @@
+from session.session import SessionBase, CreateError
+from session import metrics
+from session.constants import Config
+from datetime import datetime, timedelta
+import redis
+import redis.asyncio as aioredis
+
+pool = redis.ConnectionPool.from_url(
+    Config.SESSION_REDIS_URL,
+    max_connections=Config.SESSION_REDIS_MAX_CONNECTIONS,
+    decode_responses=True,
+)
+async_pool = aioredis.ConnectionPool.from_url(
+    Config.SESSION_REDIS_URL,
+    max_connections=Config.SESSION_REDIS_MAX_CONNECTIONS,
+    decode_responses=True,
+)
+
+
+class RedisSessionStore(SessionBase):
+    '''
+    Implement session store with a Redis-protocol key-value server as the
+    backend. Sessions are written with an expiry (SETEX semantics), so the
+    server drops them on its own and clear_expired() is a no-op.
+    '''
+
+    client = redis.Redis(connection_pool=pool)
+    key_prefix = Config.SESSION_REDIS_KEY_PREFIX
+    # shared by the sync and async stores, which use the same keyspace
+    key_salt = "session.redis"
+
+    def __init__(self, session_key=None) -> None:
+        super().__init__(session_key)
+
+    @classmethod
+    def _key(cls, session_key):
+        return cls.key_prefix + session_key
+
+    def _loaded(self, data, ttl):
+        if data is None:
+            self._session_key = None
+            return {}
+        if ttl is not None and ttl >= 0:
+            self._stored_expire_date = datetime.now() + timedelta(seconds=ttl)
+        return self.decode(data)
+
+    def load(self):
+        # fetch the data and its remaining TTL in one round trip
+        key = self._key(self.session_key)
+        return self._loaded(*self.client.pipeline(transaction=False).get(key).ttl(key).execute())
+
+    def exists(self, session_key):
+        return bool(self.client.exists(self._key(session_key)))
+
+    def create(self):
+        while True:
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                metrics.inc("session_create_retries_total", backend=type(self).__name__)
+                continue
+
+            self.modified = True
+            return
+
+    def _set_args(self, must_create):
+        data = self._get_session(no_load=must_create)
+        return (
+            self._key(self._get_or_create_session_key()),
+            self.encode(data),
+        ), dict(ex=max(self.get_expiry_age(), 1), nx=must_create)
+
+    def save(self, must_create=False):
+        '''
+        Write the session with its expiry in a single SET ... EX command.
+        With 'must_create', SET NX makes the write fail (raising CreateError)
+        if the key is already taken.
+        '''
+        if self.session_key is None:
+            return self.create()
+        args, kwargs = self._set_args(must_create)
+        if not self.client.set(*args, **kwargs) and must_create:
+            raise CreateError
+        self._stored_expire_date = datetime.now() + timedelta(seconds=kwargs["ex"])
+
+    def touch(self):
+        '''
+        Reset the key's TTL with EXPIRE, without rewriting the data
+        '''
+        if self.session_key is None:
+            self.save()
+            return True
+        ttl = max(self.get_expiry_age(), 1)
+        if self.session_key is None:
+            # loading the session found nothing under the key
+            return False
+        if not self.client.expire(self._key(self.session_key), ttl):
+            return False
+        self._stored_expire_date = datetime.now() + timedelta(seconds=ttl)
+        return True
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self.client.delete(self._key(session_key))
+
+    @classmethod
+    def clear_expired(cls):
+        # keys expire on the server
+        pass
+
+    @classmethod
+    def load_many(cls, session_keys):
+        '''
+        Return {session_key: session dict} for the keys that exist, fetched
+        in one pipelined round trip
+        '''
+        session_keys = list(session_keys)
+        decode = cls().decode
+        pipe = cls.client.pipeline(transaction=False)
+        for session_key in session_keys:
+            pipe.get(cls._key(session_key))
+        return {
+            session_key: decode(data)
+            for session_key, data in zip(session_keys, pipe.execute())
+            if data is not None
+        }
+
+    @classmethod
+    def delete_many(cls, session_keys):
+        '''
+        Delete the given sessions in one round trip, returning how many
+        existed
+        '''
+        keys = [cls._key(session_key) for session_key in session_keys]
+        return cls.client.delete(*keys) if keys else 0
+
+
+class AsyncRedisSessionStore(RedisSessionStore):
+    '''
+    Async version of RedisSessionStore, using redis.asyncio on the same
+    keyspace
+    '''
+
+    aclient = aioredis.Redis(connection_pool=async_pool)
+
+    async def aload(self):
+        key = self._key(self.session_key)
+        return self._loaded(*await self.aclient.pipeline(transaction=False).get(key).ttl(key).execute())
+
+    async def aexists(self, session_key):
+        return bool(await self.aclient.exists(self._key(session_key)))
+
+    async def acreate(self):
+        while True:
+            self._session_key = await self._aget_new_session_key()
+            try:
+                await self.asave(must_create=True)
+            except CreateError:
+                metrics.inc("session_create_retries_total", backend=type(self).__name__)
+                continue
+
+            self.modified = True
+            return
+
+    async def asave(self, must_create=False):
+        if self.session_key is None:
+            return await self.acreate()
+        await self._aget_session(no_load=must_create)
+        args, kwargs = self._set_args(must_create)
+        if not await self.aclient.set(*args, **kwargs) and must_create:
+            raise CreateError
+        self._stored_expire_date = datetime.now() + timedelta(seconds=kwargs["ex"])
+
+    async def atouch(self):
+        if self.session_key is None:
+            await self.asave()
+            return True
+        await self._aget_session()
+        ttl = max(self.get_expiry_age(), 1)
+        if self.session_key is None:
+            return False
+        if not await self.aclient.expire(self._key(self.session_key), ttl):
+            return False
+        self._stored_expire_date = datetime.now() + timedelta(seconds=ttl)
+        return True
+
+    async def adelete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        await self.aclient.delete(self._key(session_key))
+
+    @classmethod
+    async def aload_many(cls, session_keys):
+        session_keys = list(session_keys)
+        decode = cls().decode
+        pipe = cls.aclient.pipeline(transaction=False)
+        for session_key in session_keys:
+            pipe.get(cls._key(session_key))
+        return {
+            session_key: decode(data)
+            for session_key, data in zip(session_keys, await pipe.execute())
+            if data is not None
+        }
+
+    @classmethod
+    async def adelete_many(cls, session_keys):
+        keys = [cls._key(session_key) for session_key in session_keys]
+        return await cls.aclient.delete(*keys) if keys else 0
@@ -0,0 +1,160 @@
+"""
+Pluggable codecs for session data.
+
+An encoded payload is text of the form "<tag>[flags]:<body>". The tag
+records which serializer produced it, so payloads written with different
+codecs can be read side by side (e.g. while migrating). The flag "z" marks
+zlib compression and "b" a base64 body; binary and compressed bodies are
+always unpadded urlsafe base64. Plain JSON payloads written before codecs
+existed are still accepted.
+"""
+from session.constants import Config
+from datetime import datetime
+import base64
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+DATETIME_TAG = "__datetime__"
+_DEFAULT = object()
+
+
+def _encode_default(obj):
+    if isinstance(obj, datetime):
+        return {DATETIME_TAG: obj.isoformat()}
+    raise TypeError("Object of type %s is not serializable" % type(obj).__name__)
+
+
+def _decode_hook(obj):
+    if len(obj) == 1 and DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[DATETIME_TAG])
+    return obj
+
+
+def _decode_tree(obj):
+    # orjson has no object_hook, so restore tagged values in place afterwards
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if isinstance(value, (dict, list)):
+                obj[key] = _decode_tree(value)
+        return _decode_hook(obj)
+    for i, value in enumerate(obj):
+        if isinstance(value, (dict, list)):
+            obj[i] = _decode_tree(value)
+    return obj
+
+
+class JSONSerializer:
+    '''
+    JSON codec, using orjson when it is installed
+    '''
+
+    tag = "j"
+    binary = False
+
+    def __init__(self, use_orjson=None) -> None:
+        self.use_orjson = orjson is not None if use_orjson is None else use_orjson
+
+    def dumps(self, obj):
+        if self.use_orjson:
+            return orjson.dumps(
+                obj, default=_encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        return json.dumps(obj, default=_encode_default, separators=(",", ":")).encode()
+
+    def loads(self, data):
+        if self.use_orjson:
+            obj = orjson.loads(data)
+            # only walk the tree when there is something to restore
+            return _decode_tree(obj) if DATETIME_TAG.encode() in data else obj
+        return json.loads(data, object_hook=_decode_hook)
+
+
+class MsgpackSerializer:
+    '''
+    Binary msgpack codec (requires the msgpack package)
+    '''
+
+    tag = "m"
+    binary = True
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, default=_encode_default, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, object_hook=_decode_hook, raw=False)
+
+
+SERIALIZERS = {
+    "json": JSONSerializer(),
+    "msgpack": MsgpackSerializer(),
+}
+_BY_TAG = {serializer.tag: serializer for serializer in SERIALIZERS.values()}
+
+
+def get_serializer(name=None):
+    return SERIALIZERS[name or Config.SESSION_SERIALIZER]
+
+
+def dumps(obj, serializer=None, compress_min_size=_DEFAULT, urlsafe=False):
+    '''
+    Encode obj to a tagged text payload. Bodies of at least
+    'compress_min_size' bytes (default SESSION_COMPRESS_MIN_SIZE, None to
+    disable) are zlib compressed when that makes them smaller. With
+    'urlsafe' the payload only uses characters that are safe in URLs and
+    cookie values.
+    '''
+    serializer = serializer or get_serializer()
+    if compress_min_size is _DEFAULT:
+        compress_min_size = Config.SESSION_COMPRESS_MIN_SIZE
+
+    data = serializer.dumps(obj)
+    compressed = False
+    if compress_min_size is not None and len(data) >= compress_min_size:
+        packed = zlib.compress(data)
+        if len(packed) < len(data):
+            data, compressed = packed, True
+
+    flags = "z" if compressed else ""
+    if compressed or serializer.binary or urlsafe:
+        body = base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+        if not (compressed or serializer.binary):
+            flags += "b"
+    else:
+        body = data.decode()
+    return serializer.tag + flags + ":" + body
+
+
+def loads(payload):
+    '''
+    Decode a payload produced by dumps() with any registered codec. Raise
+    ValueError for unknown tags.
+    '''
+    if payload[:1] in ("{", "["):
+        return json.loads(payload, object_hook=_decode_hook)
+
+    head, _, body = payload.partition(":")
+    tag, flags = head[:1], head[1:]
+    try:
+        serializer = _BY_TAG[tag]
+    except KeyError:
+        raise ValueError("Unknown session serializer tag %r" % tag)
+
+    compressed = "z" in flags
+    if compressed or serializer.binary or "b" in flags:
+        data = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+    else:
+        data = body.encode()
+    if compressed:
+        data = zlib.decompress(data)
+    return serializer.loads(data)
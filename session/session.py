@@ -1,7 +1,13 @@
 from session.utils import get_random_string
+from session import serializers
+from session import metrics
+from session.signing import get_signer, BadSignature
 from datetime import datetime, timedelta, timezone
-import json
+import asyncio
 from session.constants import Config
+import logging
+
+logger = logging.getLogger(__name__)
 
 class CreateError(Exception):
     """
@@ -22,10 +28,24 @@ class SessionBase:
     Base class for sesison implementation
     '''
 
+    # codec from session.serializers; None means SESSION_SERIALIZER
+    serializer = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # time the storage methods each backend defines (see session.metrics)
+        metrics.instrument_class(cls)
+
     def __init__(self, session_key=None) -> None:
         self._session_key = session_key
         self.accessed = False
         self.modified = False
+        # expiry currently persisted for this session, if the backend knows it
+        self._stored_expire_date = None
+        # keys set or deleted since the data was loaded (see changes())
+        self._changed_keys = set()
+        self._deleted_keys = set()
+        self._cleared = False
 
     def __contains__(self, key):
         return key in self._session
@@ -35,11 +55,39 @@ class SessionBase:
     
     def __setitem__(self, key, value):
         self._session[key] = value
-        self.modified = True
+        self._key_set(key)
 
     def __delitem__(self, key):
         del self._session[key]
+        self._key_deleted(key)
+
+    def _key_set(self, key):
+        self._changed_keys.add(key)
+        self._deleted_keys.discard(key)
         self.modified = True
+
+    def _key_deleted(self, key):
+        self._deleted_keys.add(key)
+        self._changed_keys.discard(key)
+        self.modified = True
+
+    def changes(self):
+        '''
+        Return (changed keys, deleted keys, cleared): the keys assigned and
+        the keys removed since the data was loaded, and whether the whole
+        session was cleared (in which case only a full rewrite is correct).
+        Mutating a value in place (e.g. appending to a stored list) is not
+        tracked; assign it back to mark the key as changed.
+        '''
+        return set(self._changed_keys), set(self._deleted_keys), self._cleared
+
+    def reset_changes(self):
+        '''
+        Forget the tracked changes, once a backend has persisted them
+        '''
+        self._changed_keys.clear()
+        self._deleted_keys.clear()
+        self._cleared = False
     
     @property
     def key_salt(self):
@@ -49,7 +97,8 @@ class SessionBase:
         return self._session.get(key, default)
     
     def pop(self, key, default=None):
-        self.modified = self.modified or key in self._session
+        if key in self._session:
+            self._key_deleted(key)
         args = () if default is None else (default, )
         return self._session.pop(key, *args)
     
@@ -57,21 +106,39 @@ class SessionBase:
         if key in self._session:
             return self._session[key]
         else:
-            self.modified = True
+            self._key_set(key)
             self._session[key] = value
             return value
         
     def encode(self, session_dict):
-        # TODO: implement actual encoding with salt, serializer etc.
-        return json.dumps(session_dict)
+        '''
+        Return the given session dictionary serialized and signed
+        '''
+        session_data = get_signer(self.key_salt).sign(
+            serializers.dumps(session_dict, self.serializer)
+        )
+        if Config.SESSION_METRICS:
+            metrics.observe("session_payload_bytes", len(session_data),
+                            backend=type(self).__name__)
+        return session_data
     
     def decode(self, session_data):
-        # TODO: return actual decoded session data after accepting the encrypted signing data
-        # raise exception in case of bad signature or any other exception etc and retrun empty dictionary
-        return session_data
+        '''
+        Verify and decode session data. A bad signature or any other
+        decoding error results in an empty session.
+        '''
+        try:
+            return serializers.loads(get_signer(self.key_salt).unsign(session_data))
+        except BadSignature:
+            logger.warning("Session data corrupted")
+        except Exception:
+            pass
+        return {}
     
     def update(self, dict_):
         self._session.update(dict_)
+        for key in dict_:
+            self._key_set(key)
         self.modified = True
     
     def has_key(self, key):
@@ -94,6 +161,9 @@ class SessionBase:
         self._session_cache = {}
         self.accessed = True
         self.modified = True
+        self._changed_keys.clear()
+        self._deleted_keys.clear()
+        self._cleared = True
 
     def is_empty(self):
         '''
@@ -105,10 +175,14 @@ class SessionBase:
             return True
     
     def _get_new_session_key(self):
-        "Return session key that is not being used."
+        '''
+        Return session key that is not being used. With
+        SESSION_KEY_EXISTS_CHECK off the exists() probe is skipped and
+        uniqueness is left to create()'s must_create retry.
+        '''
         while True:
             session_key = get_random_string(32)
-            if not self.exists(session_key):
+            if not Config.SESSION_KEY_EXISTS_CHECK or not self.exists(session_key):
                 return session_key
 
     def _get_or_create_session_key(self):
@@ -155,6 +229,73 @@ class SessionBase:
 
     _session = property(_get_session)
 
+    async def _aget_session(self, no_load=False):
+        """
+        Async counterpart of _get_session(): the storage is only touched
+        through the awaitable aload() so the event loop is never blocked.
+        """
+        self.accessed = True
+        try:
+            return self._session_cache
+        except AttributeError:
+            if self.session_key is None or no_load:
+                self._session_cache = {}
+            else:
+                self._session_cache = await self.aload()
+        return self._session_cache
+
+    async def aget(self, key, default=None):
+        return (await self._aget_session()).get(key, default)
+
+    async def aset(self, key, value):
+        (await self._aget_session())[key] = value
+        self._key_set(key)
+
+    async def apop(self, key, default=None):
+        session = await self._aget_session()
+        if key in session:
+            self._key_deleted(key)
+        args = () if default is None else (default, )
+        return session.pop(key, *args)
+
+    async def asetdefault(self, key, value):
+        session = await self._aget_session()
+        if key in session:
+            return session[key]
+        self._key_set(key)
+        session[key] = value
+        return value
+
+    async def aupdate(self, dict_):
+        (await self._aget_session()).update(dict_)
+        for key in dict_:
+            self._key_set(key)
+        self.modified = True
+
+    async def ahas_key(self, key):
+        return key in (await self._aget_session())
+
+    async def akeys(self):
+        return (await self._aget_session()).keys()
+
+    async def avalues(self):
+        return (await self._aget_session()).values()
+
+    async def aitems(self):
+        return (await self._aget_session()).items()
+
+    async def _aget_new_session_key(self):
+        "Return session key that is not being used."
+        while True:
+            session_key = get_random_string(32)
+            if not Config.SESSION_KEY_EXISTS_CHECK or not await self.aexists(session_key):
+                return session_key
+
+    async def _aget_or_create_session_key(self):
+        if self._session_key is None:
+            self._session_key = await self._aget_new_session_key()
+        return self._session_key
+
     def get_session_cookie_age(self):
         return Config.SESSION_COOKIE_AGE
 
@@ -208,6 +349,30 @@ class SessionBase:
         expiry = expiry or self.get_session_cookie_age()
         return modification + timedelta(seconds=expiry)
 
+    def needs_refresh(self, interval=None):
+        '''
+        Return True when persisting the session now would push its stored
+        expiry forward by at least 'interval' seconds (default
+        SESSION_REFRESH_INTERVAL). Always True if the stored expiry is unknown.
+        '''
+        if self._stored_expire_date is None:
+            return True
+        if interval is None:
+            interval = Config.SESSION_REFRESH_INTERVAL
+        moved = self.get_expiry_date().timestamp() - self._stored_expire_date.timestamp()
+        return moved >= interval
+
+    def touch(self):
+        '''
+        Push the stored expiry forward without rewriting the session data.
+        Return False if the session no longer exists in the storage.
+
+        Backends that can't update the expiry on its own fall back to a full
+        save().
+        '''
+        self.save()
+        return True
+
     def set_expiry(self, value):
         """
         Set a custom expiration for the session. ``value`` can be an integer,
@@ -232,8 +397,6 @@ class SessionBase:
             return
         if isinstance(value, timedelta):
             value = datetime.now() + value
-        if isinstance(value, datetime):
-            value = value.isoformat()
         self["_session_expiry"] = value
 
     # Methods that the child class needs to implement
@@ -289,4 +452,31 @@ class SessionBase:
         NotImplementedError. If it isn't necessary, because the backend has
         a built-in expiration mechanism, it should be a no-op.
         """
-        raise NotImplementedError("This backend does not support clear_expired().")
\ No newline at end of file
+        raise NotImplementedError("This backend does not support clear_expired().")
+
+    # Async variants of the storage methods. By default they run the sync
+    # implementation in a worker thread; backends with a native async driver
+    # should override them.
+
+    async def aexists(self, session_key):
+        return await asyncio.to_thread(self.exists, session_key)
+
+    async def acreate(self):
+        return await asyncio.to_thread(self.create)
+
+    async def asave(self, must_create=False):
+        return await asyncio.to_thread(self.save, must_create)
+
+    async def adelete(self, session_key=None):
+        return await asyncio.to_thread(self.delete, session_key)
+
+    async def aload(self):
+        return await asyncio.to_thread(self.load)
+
+    async def atouch(self):
+        await self._aget_session()
+        return await asyncio.to_thread(self.touch)
+
+    @classmethod
+    async def aclear_expired(cls):
+        return await asyncio.to_thread(cls.clear_expired)
@@ -0,0 +1,147 @@
+"""
+Session storage spread over several databases.
+
+Each session key lives on exactly one shard, picked by consistent hashing
+of the key over the shard names (SESSION_SHARDS), so adding or removing a
+shard only moves the keys that hash to it: about 1/N of them. Sessions
+whose key moved are simply not found on their new shard, which makes
+their holders start a new session; they are removed from the old shard by
+clear_expired() once they expire.
+
+    Config.SESSION_SHARDS = {
+        "s0": "sqlite:///./sessions_0.db",
+        "s1": "sqlite:///./sessions_1.db",
+    }
+    Config.SESSION_ENGINE = "session.sharding.ShardedSessionStore"
+
+Migrate every shard with `alembic upgrade head` (see alembic/env.py).
+"""
+from session.db_adapter import SessionStore, create_session_engine, session_scope
+from session.constants import Config
+from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+import bisect
+import hashlib
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    '''
+    Consistent hash ring mapping keys to node names.
+
+    Every node is placed on the ring 'vnodes' times; a key belongs to the
+    first node point at or after its own hash.
+    '''
+
+    def __init__(self, nodes=(), vnodes=128) -> None:
+        self.vnodes = vnodes
+        self._points = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._nodes))
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            point = _hash("%s#%d" % (node, i))
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node):
+        kept = [(p, n) for p, n in zip(self._points, self._nodes) if n != node]
+        self._points = [p for p, _ in kept]
+        self._nodes = [n for _, n in kept]
+
+    def get(self, key):
+        if not self._points:
+            raise LookupError("the hash ring has no nodes")
+        index = bisect.bisect_left(self._points, _hash(key))
+        if index == len(self._points):
+            index = 0
+        return self._nodes[index]
+
+
+class Shards:
+    '''
+    The engines and sessionmakers of a set of named shards, plus the hash
+    ring placing session keys on them
+    '''
+
+    def __init__(self, urls, vnodes=None) -> None:
+        self.urls = dict(urls)
+        self.engines = {name: create_session_engine(url) for name, url in self.urls.items()}
+        self.factories = {
+            name: sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            for name, engine in self.engines.items()
+        }
+        self.ring = HashRing(self.urls, vnodes or Config.SESSION_SHARD_VNODES)
+
+    def shard_for(self, session_key):
+        return self.ring.get(session_key)
+
+    def factory_for(self, session_key):
+        return self.factories[self.shard_for(session_key)]
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose()
+
+
+class ShardedSessionStore(SessionStore):
+    '''
+    Implement session store with several DBs as the backend, each session
+    key being routed to one of them (see session.sharding)
+    '''
+
+    # built from SESSION_SHARDS on first use; assign a Shards instance to
+    # use another set
+    shards = None
+    _shards_lock = Lock()
+
+    @classmethod
+    def get_shards(cls):
+        if cls.shards is None:
+            with cls._shards_lock:
+                if cls.shards is None:
+                    if not Config.SESSION_SHARDS:
+                        raise LookupError("SESSION_SHARDS is empty")
+                    cls.shards = Shards(Config.SESSION_SHARDS)
+        return cls.shards
+
+    def _unit_of_work(self, session_key):
+        return session_scope(self.get_shards().factory_for(session_key))
+
+    @classmethod
+    def _factories_for_keys(cls, session_keys):
+        shards = cls.get_shards()
+        grouped = {}
+        for session_key in session_keys:
+            grouped.setdefault(shards.factory_for(session_key), []).append(session_key)
+        return grouped
+
+    @classmethod
+    def _all_factories(cls):
+        return list(cls.get_shards().factories.values())
+
+    @classmethod
+    def clear_expired(cls, chunk_size=None):
+        """
+        Delete expired sessions from every shard, all shards in parallel.
+        Return the total number of deleted rows.
+        """
+        chunk_size = chunk_size or Config.SESSION_CLEAR_EXPIRED_CHUNK_SIZE
+        now = datetime.now()
+        factories = cls._all_factories()
+        with ThreadPoolExecutor(max_workers=len(factories)) as executor:
+            return sum(executor.map(
+                lambda factory: cls._clear_expired_in(factory, chunk_size, now),
+                factories,
+            ))
@@ -0,0 +1,326 @@
+"""
+Session cache shared by every worker process of a host.
+
+The cache is a fixed-size hash table in a memory-mapped file (on /dev/shm
+when available). Each session key maps to one slot holding the encoded
+session data, the expire_date and a deadline. A save or delete on one
+worker rewrites or clears the slot for all of them, so no worker keeps
+serving data another one has replaced.
+
+Every slot starts with a generation counter used as a seqlock. Writers
+take a per-slot lock (a threading lock plus an fcntl record lock) and make
+the generation odd while they write and even again when done. Readers
+take no lock: they read the generation, the entry, then the generation
+again, and retry when it was odd or changed (a torn read). The generation
+also lets a worker that missed, read the database and then wants to fill
+the cache detect that someone wrote the slot in the meantime, so an older
+row never replaces a newer save (see SharedMemoryCache.version()).
+
+Entries whose key or data don't fit in a slot are not cached.
+
+The file is only created and mapped on first use. Unless
+SESSION_SHM_CACHE_PATH is set, its name is derived from the user, the
+working directory and the database URL, so that other apps on the host
+don't share it, and includes the layout (slots x slot size), so workers
+started with another layout use another file instead of resizing one still
+mapped by the others.
+
+    Config.SESSION_ENGINE = "session.shm_cache.AsyncSharedCachedSessionStore"
+"""
+from session.cached_db import CachedStoreMixin, AsyncCachedSessionStore
+from session.db_adapter import SessionStore, SQLALCHEMY_DATABASE_URL
+from session.constants import Config
+from datetime import datetime, timezone
+from threading import Lock
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+MAGIC = b"FASESHM1"
+# magic, number of slots, slot size
+FILE_HEADER = struct.Struct("<8sII")
+# generation, key hash, deadline, expire_date timestamp, flags, key length,
+# data length
+SLOT_HEADER = struct.Struct("<QQddBHI")
+GENERATION = struct.Struct("<Q")
+KEY_SIZE = 64
+FLAG_AWARE = 1
+READ_RETRIES = 4
+
+
+def default_path(slots, slot_size):
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    # the workers of one deployment share the file, other apps don't
+    deployment = "%d:%s:%s" % (os.getuid(), os.getcwd(), SQLALCHEMY_DATABASE_URL)
+    digest = hashlib.blake2b(deployment.encode(), digest_size=6).hexdigest()
+    return os.path.join(
+        directory, "fastapi_sessions-%s-%dx%d.cache" % (digest, slots, slot_size)
+    )
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class SharedMemoryCache:
+    '''
+    Cross-process cache of (session_data, expire_date) entries, with the
+    same interface as session.cache.LRUCache.
+
+    'slots' fixed slots of 'slot_size' bytes each; a key can only live in
+    the slot its hash selects, so a colliding key evicts the previous one.
+    The file is opened on first use.
+    '''
+
+    def __init__(self, path=None, slots=8192, slot_size=4096, timeout=300) -> None:
+        self.path = path or default_path(slots, slot_size)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.timeout = timeout
+        self.max_data = slot_size - SLOT_HEADER.size - KEY_SIZE
+        if self.max_data <= 0:
+            raise ValueError("slot_size %d is too small" % slot_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._locks = [Lock() for _ in range(64)]
+        self._open_lock = Lock()
+        self._fd = None
+        self._mm = None
+
+    def _map(self):
+        mm = self._mm
+        if mm is None:
+            with self._open_lock:
+                if self._mm is None:
+                    self._open()
+                mm = self._mm
+        return mm
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = FILE_HEADER.size + self.slots * self.slot_size
+        expected = FILE_HEADER.pack(MAGIC, self.slots, self.slot_size)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, FILE_HEADER.size, 0)
+                if not header.strip(b"\0"):
+                    # new file: only ever grown, never shrunk, since other
+                    # workers may map it
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                    os.pwrite(fd, expected, 0)
+                elif header != expected or os.fstat(fd).st_size < size:
+                    raise RuntimeError(
+                        "%s holds a session cache with another layout; remove it "
+                        "once no worker uses it, or set another SESSION_SHM_CACHE_PATH"
+                        % self.path
+                    )
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            mm = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        # _fd first: a thread seeing _mm set goes straight to using both
+        self._fd = fd
+        self._mm = mm
+
+    def _slot(self, key):
+        hashed = _hash(key)
+        return hashed, hashed % self.slots
+
+    def _offset(self, slot):
+        return FILE_HEADER.size + slot * self.slot_size
+
+    def _read(self, key):
+        '''
+        Return (generation, entry) for key, entry being None when the slot
+        holds no live entry for it
+        '''
+        encoded = key.encode()
+        hashed, slot = self._slot(encoded)
+        offset = self._offset(slot)
+        mm = self._map()
+        for _ in range(READ_RETRIES):
+            generation = GENERATION.unpack_from(mm, offset)[0]
+            if generation & 1:
+                continue
+            _, slot_hash, deadline, expire_ts, flags, key_len, data_len = SLOT_HEADER.unpack_from(mm, offset)
+            entry = None
+            if slot_hash == hashed and key_len and deadline > time.time():
+                start = offset + SLOT_HEADER.size
+                if mm[start:start + key_len] == encoded:
+                    start += KEY_SIZE
+                    entry = (mm[start:start + data_len], expire_ts, flags)
+            if GENERATION.unpack_from(mm, offset)[0] == generation:
+                return generation, entry
+        # a writer kept the slot busy: treat it as a miss, with a version
+        # that never matches
+        return -1, None
+
+    def _write(self, key, write, expected=None):
+        '''
+        Run write(hashed, offset) with the slot of key locked and its
+        generation odd. With 'expected', do nothing unless the generation
+        still matches. Return whether the slot was written.
+        '''
+        hashed, slot = self._slot(key.encode())
+        return self._write_slot(slot, lambda offset: write(hashed, offset), expected)
+
+    def _write_slot(self, slot, write, expected=None):
+        offset = self._offset(slot)
+        self._map()
+        # the thread lock must follow the slot, like the fcntl lock: the
+        # latter doesn't exclude threads of the same process
+        with self._locks[slot % len(self._locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset)
+            try:
+                generation = GENERATION.unpack_from(self._mm, offset)[0]
+                if expected is not None and generation != expected:
+                    return False
+                GENERATION.pack_into(self._mm, offset, generation + 1)
+                try:
+                    write(offset)
+                finally:
+                    GENERATION.pack_into(self._mm, offset, generation + 2)
+                return True
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset)
+
+    def __len__(self):
+        self._map()
+        now = time.time()
+        return sum(
+            1 for slot in range(self.slots)
+            if self._live(self._offset(slot), now)
+        )
+
+    def _live(self, offset, now):
+        _, _, deadline, _, _, key_len, _ = SLOT_HEADER.unpack_from(self._mm, offset)
+        return key_len and deadline > now
+
+    def __contains__(self, key):
+        # membership test that doesn't count towards hits/misses
+        return self._read(key)[1] is not None
+
+    def version(self, key):
+        '''
+        Return the generation of the slot of key, to pass to set() when
+        filling the cache from a database read
+        '''
+        return self._read(key)[0]
+
+    def get(self, key):
+        '''
+        Return the cached (session_data, expire_date) for key, or None on a
+        miss
+        '''
+        entry = self._read(key)[1]
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        data, expire_ts, flags = entry
+        tz = timezone.utc if flags & FLAG_AWARE else None
+        return data.decode(), datetime.fromtimestamp(expire_ts, tz)
+
+    def set(self, key, value, expire_date=None, version=None):
+        '''
+        Store value, a (session_data, expire_date) tuple. With 'version'
+        (from version()), skip the write if the slot changed since.
+        '''
+        session_data, value_expire = value
+        data = session_data.encode()
+        encoded_key = key.encode()
+        if len(data) > self.max_data or len(encoded_key) > KEY_SIZE:
+            self.delete(key)
+            return
+        deadline = time.time() + self.timeout
+        if expire_date is not None:
+            deadline = min(deadline, expire_date.timestamp())
+        flags = FLAG_AWARE if value_expire.tzinfo is not None else 0
+
+        def write(hashed, offset):
+            _, slot_hash, old_deadline, _, _, key_len, _ = SLOT_HEADER.unpack_from(self._mm, offset)
+            if key_len and slot_hash != hashed and old_deadline > time.time():
+                self.evictions += 1
+            SLOT_HEADER.pack_into(
+                self._mm, offset, GENERATION.unpack_from(self._mm, offset)[0], hashed,
+                deadline, value_expire.timestamp(), flags, len(encoded_key), len(data),
+            )
+            start = offset + SLOT_HEADER.size
+            self._mm[start:start + len(encoded_key)] = encoded_key
+            start += KEY_SIZE
+            self._mm[start:start + len(data)] = data
+
+        self._write(key, write, version)
+
+    def delete(self, key):
+        def write(hashed, offset):
+            _, slot_hash, _, _, _, key_len, _ = SLOT_HEADER.unpack_from(self._mm, offset)
+            if slot_hash == hashed:
+                self._clear_slot(offset)
+
+        self._write(key, write)
+
+    def _clear_slot(self, offset):
+        generation = GENERATION.unpack_from(self._mm, offset)[0]
+        SLOT_HEADER.pack_into(self._mm, offset, generation, 0, 0.0, 0.0, 0, 0, 0)
+
+    def clear(self):
+        for slot in range(self.slots):
+            self._write_slot(slot, self._clear_slot)
+
+    def stats(self):
+        # hits, misses and evictions are counted per process
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._open_lock:
+            if self._mm is not None:
+                self._mm.close()
+                os.close(self._fd)
+                self._mm = self._fd = None
+
+
+def shared_cache():
+    '''
+    Build the host-wide cache from the SESSION_SHM_CACHE_* settings (the
+    file itself is only mapped on first use)
+    '''
+    return SharedMemoryCache(
+        Config.SESSION_SHM_CACHE_PATH,
+        Config.SESSION_SHM_CACHE_SLOTS,
+        Config.SESSION_SHM_CACHE_SLOT_SIZE,
+        Config.SESSION_CACHE_TIMEOUT,
+    )
+
+
+class SharedCachedSessionStore(CachedStoreMixin, SessionStore):
+    '''
+    Implement session store with DB as the backend and a cache shared by
+    all the worker processes of the host in front of it
+    '''
+
+    cache = shared_cache()
+
+
+class AsyncSharedCachedSessionStore(AsyncCachedSessionStore):
+    '''
+    Async version of SharedCachedSessionStore
+    '''
+
+    cache = SharedCachedSessionStore.cache
@@ -0,0 +1,130 @@
+from session.session import SessionBase
+from session.signing import TimestampSigner, get_signer
+from session import serializers
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# browsers drop cookies larger than this
+MAX_COOKIE_SIZE = 4093
+
+
+class SignedCookieSessionStore(SessionBase):
+    '''
+    Implement session store that keeps the whole session in the cookie.
+
+    The "session key" is the encoded session data, timestamped and HMAC
+    signed with a key salted with key_salt, so no server-side storage is
+    touched at all. Expiry comes from the signature timestamp instead of an
+    expire_date column.
+    '''
+
+    # zlib compress payloads of at least this many bytes (None disables)
+    compress_min_size = 256
+
+    def __init__(self, session_key=None) -> None:
+        super().__init__(session_key)
+
+    def _signer(self):
+        return get_signer(self.key_salt, TimestampSigner)
+
+    def load(self):
+        '''
+        Verify the cookie and decode its data. A tampered or expired cookie
+        results in a new, empty session.
+        '''
+        try:
+            payload, timestamp = self._signer().unsign(
+                self.session_key,
+                max_age=self.get_session_cookie_age(),
+                return_timestamp=True,
+            )
+            data = serializers.loads(payload)
+        except Exception:
+            self._session_key = None
+            self.create()
+            return {}
+        self._stored_expire_date = datetime.fromtimestamp(timestamp) + timedelta(
+            seconds=self.get_session_cookie_age()
+        )
+        return data
+
+    def create(self):
+        '''
+        To create a new key, we simply make sure that the modified flag is set
+        so that the cookie is set on the client for the current request.
+        '''
+        self.modified = True
+
+    def save(self, must_create=False):
+        '''
+        To save, get the session key as a securely signed string and then set
+        the modified flag so that the cookie is set on the client for the
+        current request.
+        '''
+        self._session_key = self._signed_payload()
+        self._stored_expire_date = self.get_expiry_date()
+        self.modified = True
+
+    def exists(self, session_key=None):
+        '''
+        This method makes sense when you're talking to a shared resource, but
+        it doesn't matter when you're storing the information in the client's
+        cookie.
+        '''
+        return False
+
+    def delete(self, session_key=None):
+        '''
+        To delete, clear the session key and the underlying data structure
+        and set the modified flag so that the cookie is set on the client for
+        the current request.
+        '''
+        self._session_key = ''
+        self._session_cache = {}
+        self.modified = True
+
+    def _signed_payload(self):
+        payload = serializers.dumps(
+            self._session,
+            self.serializer,
+            compress_min_size=self.compress_min_size,
+            urlsafe=True,
+        )
+        signed = self._signer().sign(payload)
+        if len(signed) > MAX_COOKIE_SIZE:
+            logger.warning(
+                "Signed session cookie is %d bytes, browsers may drop it", len(signed)
+            )
+        return signed
+
+    @classmethod
+    def clear_expired(cls):
+        pass
+
+    # nothing above does I/O, so the async API calls the sync methods directly
+
+    async def aload(self):
+        return self.load()
+
+    async def aexists(self, session_key=None):
+        return False
+
+    async def acreate(self):
+        self.create()
+
+    async def asave(self, must_create=False):
+        await self._aget_session()
+        self.save(must_create)
+
+    async def adelete(self, session_key=None):
+        self.delete(session_key)
+
+    async def atouch(self):
+        await self.asave()
+        return True
+
+    @classmethod
+    async def aclear_expired(cls):
+        pass
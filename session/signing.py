@@ -0,0 +1,160 @@
+"""
+HMAC signing of values, with optional timestamps, and key rotation.
+
+Values are signed with the current SESSION_SECRET_KEY and verified against it
+and every key in SESSION_SECRET_KEY_FALLBACKS, so a secret can be rotated
+without invalidating everything signed with the previous one.
+
+Keys are derived once per signer and the keyed HMAC objects are kept, so
+signing or verifying on the hot path only copies a precomputed HMAC state;
+get_signer() caches signers per salt.
+
+    >>> signer = get_signer("some-salt")
+    >>> value = signer.sign("hello")
+    >>> signer.unsign(value)
+    'hello'
+"""
+from session.constants import Config
+from functools import lru_cache
+import base64
+import hashlib
+import hmac
+import time
+
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+class BadSignature(Exception):
+    """
+    Signature does not match.
+    """
+    pass
+
+
+class SignatureExpired(BadSignature):
+    """
+    Signature timestamp is older than required max_age.
+    """
+    pass
+
+
+def b62_encode(s):
+    if s == 0:
+        return "0"
+    encoded = ""
+    while s > 0:
+        s, remainder = divmod(s, 62)
+        encoded = BASE62_ALPHABET[remainder] + encoded
+    return encoded
+
+
+def b62_decode(s):
+    decoded = 0
+    for digit in s:
+        decoded = decoded * 62 + BASE62_ALPHABET.index(digit)
+    return decoded
+
+
+def salted_hmac(key_salt, value, secret):
+    """
+    Return the HMAC-SHA256 of 'value', using a key derived from 'key_salt'
+    and 'secret'.
+    """
+    mac = keyed_hmac(key_salt, secret)
+    mac.update(value.encode())
+    return mac
+
+
+def keyed_hmac(key_salt, secret):
+    """
+    Return an HMAC-SHA256 object keyed with a key derived from 'key_salt'
+    and 'secret', ready to be copied and fed values.
+    """
+    key = hashlib.sha256((key_salt + secret).encode()).digest()
+    return hmac.new(key, digestmod=hashlib.sha256)
+
+
+class Signer:
+    '''
+    Sign values as "<value><sep><signature>"
+    '''
+
+    def __init__(self, key=None, sep=":", salt=None, fallback_keys=None) -> None:
+        self.key = key or Config.SESSION_SECRET_KEY
+        self.fallback_keys = (
+            fallback_keys
+            if fallback_keys is not None
+            else Config.SESSION_SECRET_KEY_FALLBACKS
+        )
+        self.sep = sep
+        self.salt = salt or "%s.%s" % (self.__class__.__module__, self.__class__.__name__)
+        # derive every key once; signing only copies these
+        self._macs = [
+            keyed_hmac(self.salt + "signer", secret)
+            for secret in [self.key, *self.fallback_keys]
+        ]
+
+    def _signature(self, value, mac):
+        mac = mac.copy()
+        mac.update(value.encode())
+        return base64.urlsafe_b64encode(mac.digest()).rstrip(b"=")
+
+    def signature(self, value):
+        return self._signature(value, self._macs[0]).decode("ascii")
+
+    def sign(self, value):
+        return "%s%s%s" % (value, self.sep, self.signature(value))
+
+    def unsign(self, signed_value):
+        if self.sep not in signed_value:
+            raise BadSignature('No "%s" found in value' % self.sep)
+        value, sig = signed_value.rsplit(self.sep, 1)
+        sig = sig.encode()
+        for mac in self._macs:
+            if hmac.compare_digest(sig, self._signature(value, mac)):
+                return value
+        raise BadSignature('Signature "%s" does not match' % sig.decode())
+
+
+class TimestampSigner(Signer):
+    '''
+    Sign values together with the time of signing, so that unsign() can
+    reject values older than 'max_age' seconds
+    '''
+
+    def timestamp(self):
+        return b62_encode(int(time.time()))
+
+    def sign(self, value):
+        value = "%s%s%s" % (value, self.sep, self.timestamp())
+        return super().sign(value)
+
+    def unsign(self, value, max_age=None, return_timestamp=False):
+        result = super().unsign(value)
+        value, timestamp = result.rsplit(self.sep, 1)
+        timestamp = b62_decode(timestamp)
+        if max_age is not None:
+            age = time.time() - timestamp
+            if age > max_age:
+                raise SignatureExpired("Signature age %s > %s seconds" % (age, max_age))
+        if return_timestamp:
+            return value, timestamp
+        return value
+
+
+@lru_cache(maxsize=128)
+def _cached_signer(signer_class, salt, key, fallback_keys):
+    return signer_class(key=key, salt=salt, fallback_keys=list(fallback_keys))
+
+
+def get_signer(salt, signer_class=Signer):
+    """
+    Return a shared signer for 'salt' using the current secret keys. The
+    keys are part of the cache key, so changing them takes effect at once.
+    """
+    return _cached_signer(
+        signer_class,
+        salt,
+        Config.SESSION_SECRET_KEY,
+        tuple(Config.SESSION_SECRET_KEY_FALLBACKS),
+    )
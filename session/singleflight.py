@@ -0,0 +1,116 @@
+"""
+Coalesce concurrent loads of the same session.
+
+A page fires many parallel requests (assets, XHRs) carrying the same
+session cookie, and each of them loads the session from the database. With
+SessionStore.single_flight set, concurrent loads of one session key in this
+process share a single in-flight query: the first caller runs it and the
+others wait for its result, whether they run in threads (sync stores) or
+on the event loop (async stores).
+
+What is shared is the database row, never the session dict: every store
+decodes its own copy, so a request modifying its session can't leak the
+change to another one. A save, touch or delete forgets the key once it is
+written, so a load starting after a write never joins a query issued
+before it.
+
+    Config.SESSION_SINGLE_FLIGHT = True
+"""
+from threading import Event, Lock
+import asyncio
+
+
+class _Call:
+    '''
+    A query in flight in a thread, waited for by the followers
+    '''
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    Run at most one call per key at a time; concurrent callers with the
+    same key get the result (or the exception) of the call in flight.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.calls = 0
+        self.executions = 0
+
+    def do(self, key, fn):
+        '''
+        Return fn(), or the result of the fn() already running for key in
+        another thread
+        '''
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        '''
+        Return await fn(), or the result of the fn() already running for
+        key on this event loop
+        '''
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(key)
+            if task is None or task.get_loop() is not loop:
+                task = loop.create_task(fn())
+                self.executions += 1
+                self._tasks[key] = task
+                task.add_done_callback(lambda t: self._done(key, t))
+        # a cancelled caller must not cancel the query of the others
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def forget(self, key):
+        '''
+        Make the next call for key run on its own instead of joining the
+        one in flight (whose result may predate a write)
+        '''
+        with self._lock:
+            self._calls.pop(key, None)
+            self._tasks.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            coalesced = self.calls - self.executions
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": coalesced,
+                "coalesce_ratio": coalesced / self.calls if self.calls else 0.0,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
@@ -1,9 +1,23 @@
 import secrets
+from functools import lru_cache
+from importlib import import_module
 
 
 RANDOM_STRING_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
 
 
+@lru_cache(maxsize=16)
+def _byte_mapping(allowed_chars):
+    """
+    Return a bytes.translate() table mapping random bytes onto allowed_chars,
+    and the bytes to drop so that every character stays equally likely.
+    """
+    n = len(allowed_chars)
+    limit = 256 - 256 % n
+    table = bytes(ord(allowed_chars[i % n]) for i in range(256))
+    return table, bytes(range(limit, 256))
+
+
 def get_random_string(length, allowed_chars=RANDOM_STRING_CHARS):
     """
     Return a securely generated random string.
@@ -14,5 +28,47 @@ def get_random_string(length, allowed_chars=RANDOM_STRING_CHARS):
     For example, with default `allowed_chars` (26+26+10), this gives:
       * length: 12, bit length =~ 71 bits
       * length: 22, bit length =~ 131 bits
+
+    Draws all the randomness with one secrets.token_bytes() call (plus a
+    rare top-up) and maps it with bytes.translate(), rejecting the bytes
+    that would bias the result.
     """
-    return "".join(secrets.choice(allowed_chars) for i in range(length))
\ No newline at end of file
+    if len(allowed_chars) > 256 or not allowed_chars.isascii():
+        return "".join(secrets.choice(allowed_chars) for i in range(length))
+
+    table, rejected = _byte_mapping(allowed_chars)
+    result = b""
+    while len(result) < length:
+        missing = length - len(result)
+        # a little extra so that rejected bytes rarely need another draw
+        result += secrets.token_bytes(missing + missing // 8 + 4).translate(table, rejected)
+    return result[:length].decode("ascii")
+
+
+def chunks(items, size):
+    """
+    Yield successive lists of at most 'size' items from 'items'.
+    """
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def import_string(dotted_path):
+    """
+    Import a dotted module path and return the attribute/class designated by
+    the last name in the path. Raise ImportError if the import failed.
+    """
+    try:
+        module_path, class_name = dotted_path.rsplit(".", 1)
+    except ValueError as err:
+        raise ImportError("%s doesn't look like a module path" % dotted_path) from err
+
+    module = import_module(module_path)
+    try:
+        return getattr(module, class_name)
+    except AttributeError as err:
+        raise ImportError(
+            'Module "%s" does not define a "%s" attribute/class'
+            % (module_path, class_name)
+        ) from err
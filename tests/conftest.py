@@ -0,0 +1,17 @@
+import pytest
+
+from session import db_adapter
+from session.db_adapter import Base, SessionLocal, create_session_engine
+
+
+@pytest.fixture
+def db(tmp_path):
+    '''
+    Point the DB session stores at a fresh database for one test
+    '''
+    engine = create_session_engine("sqlite:///%s" % (tmp_path / "sessions.db"))
+    Base.metadata.create_all(engine)
+    SessionLocal.configure(bind=engine)
+    yield engine
+    SessionLocal.configure(bind=db_adapter.engine)
+    engine.dispose()
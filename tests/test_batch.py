@@ -0,0 +1,191 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from session.batch import TouchBatcher, WriteBehindQueue
+from session.db_adapter import Base, FastAPI_Session
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    return "sqlite+aiosqlite:///%s" % (tmp_path / "sessions.db")
+
+
+async def open_engine(db_url):
+    engine = create_async_engine(db_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+async def stored(engine):
+    table = FastAPI_Session.__table__
+    async with engine.connect() as conn:
+        result = await conn.execute(select(table.c.session_key, table.c.expire_date))
+        return {session_key: expire_date for session_key, expire_date in result}
+
+
+def row(session_key, expire_date=None):
+    return {
+        "session_key": session_key,
+        "session_data": "data",
+        "expire_date": expire_date or datetime(2100, 1, 1),
+        "user_id": None,
+    }
+
+
+class FailingEngine:
+    '''
+    Stands in for an unreachable database: every transaction fails, after
+    'gate' is set if one is given
+    '''
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.attempts = 0
+
+    @asynccontextmanager
+    async def begin(self):
+        self.attempts += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        raise ConnectionError("database unreachable")
+        yield
+
+
+def test_write_behind_flushes_on_stop(db_url):
+    async def scenario():
+        engine = await open_engine(db_url)
+        queue = WriteBehindQueue(engine, flush_interval=60)
+        queue.start()
+        await queue.put(row("a"))
+        await queue.put(row("b"))
+        await queue.stop()
+        return await stored(engine), len(queue)
+
+    rows, depth = run(scenario())
+    assert set(rows) == {"a", "b"}
+    assert depth == 0
+
+
+def test_write_behind_flushes_at_flush_size(db_url):
+    async def scenario():
+        engine = await open_engine(db_url)
+        queue = WriteBehindQueue(engine, flush_size=3, flush_interval=60)
+        queue.start()
+        for session_key in "abc":
+            await queue.put(row(session_key))
+        for _ in range(50):
+            if queue.flushes:
+                break
+            await asyncio.sleep(0.01)
+        rows = await stored(engine)
+        await queue.stop()
+        return rows
+
+    assert set(run(scenario())) == {"a", "b", "c"}
+
+
+def test_stop_right_after_wake(db_url):
+    # the put() reaching flush_size wakes the flusher in the same loop
+    # iteration as stop(): stop() must still return and flush everything
+    async def scenario():
+        engine = await open_engine(db_url)
+        queue = WriteBehindQueue(engine, max_size=5, flush_size=3, flush_interval=60)
+        queue.start()
+        await asyncio.sleep(0.05)
+        for session_key in "abc":
+            await queue.put(row(session_key))
+        await asyncio.wait_for(queue.stop(), 5)
+        return await stored(engine)
+
+    assert set(run(scenario())) == {"a", "b", "c"}
+
+
+def test_write_behind_keeps_last_write():
+    queue = WriteBehindQueue(engine=None)
+
+    async def scenario():
+        await queue.put(row("a", datetime(2100, 1, 1)))
+        await queue.put(row("a", datetime(2100, 1, 2)))
+
+    run(scenario())
+    assert len(queue) == 1
+    assert queue.get("a")["expire_date"] == datetime(2100, 1, 2)
+
+
+def test_failed_flush_backs_off():
+    engine = FailingEngine()
+    queue = WriteBehindQueue(engine, max_size=2, flush_size=2, flush_interval=0.01)
+    queue.max_retry_delay = 0.08
+
+    async def scenario():
+        queue.start()
+        await queue.put(row("a"))
+        await queue.put(row("b"))
+        # blocked on backpressure, wakes the flusher on every failed flush
+        blocked = asyncio.create_task(queue.put(row("c")))
+        await asyncio.sleep(0.4)
+        blocked.cancel()
+        queue._task.cancel()
+
+    run(scenario())
+    # 0.01, 0.02, 0.04, 0.08, 0.08, ... instead of a tight loop
+    assert 2 <= engine.attempts <= 10
+    assert set(queue._pending) == {"a", "b"}
+
+
+def test_failed_flush_does_not_overfill_the_queue():
+    gate = asyncio.Event()
+    engine = FailingEngine(gate)
+    queue = WriteBehindQueue(engine, max_size=2, flush_size=2, flush_interval=60)
+
+    async def scenario():
+        await queue.put(row("a"))
+        await queue.put(row("b"))
+        flush = asyncio.create_task(queue.flush())
+        await asyncio.sleep(0)
+        # the rows being flushed still take up room
+        put = asyncio.create_task(queue.put(row("c")))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+        gate.set()
+        with pytest.raises(ConnectionError):
+            await flush
+        await asyncio.sleep(0.01)
+        put.cancel()
+
+    run(scenario())
+    assert set(queue._pending) == {"a", "b"}
+
+
+def test_touch_batcher_flushes_on_stop(db_url):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    async def scenario():
+        engine = await open_engine(db_url)
+        queue = WriteBehindQueue(engine)
+        await queue.put(row("a", now))
+        await queue.put(row("b", now))
+        await queue.flush()
+
+        batcher = TouchBatcher(engine, flush_interval=60)
+        batcher.start()
+        batcher.touch("a", now + timedelta(hours=2))
+        batcher.touch("a", now + timedelta(hours=1))
+        batcher.touch("b", now + timedelta(hours=3))
+        batcher.wake()
+        await asyncio.wait_for(batcher.stop(), 5)
+        return await stored(engine), len(batcher)
+
+    rows, pending = run(scenario())
+    assert rows == {"a": now + timedelta(hours=2), "b": now + timedelta(hours=3)}
+    assert pending == 0
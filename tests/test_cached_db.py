@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import pytest
+
+from session.cache import LRUCache
+from session.cached_db import CachedSessionStore
+from session.db_adapter import SessionStore
+
+
+@pytest.fixture(autouse=True)
+def cache(db, monkeypatch):
+    cache = LRUCache(100, 300)
+    monkeypatch.setattr(CachedSessionStore, "cache", cache)
+    return cache
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    calls = []
+    encode = CachedSessionStore.encode
+
+    def counting_encode(self, session_dict):
+        calls.append(dict(session_dict))
+        return encode(self, session_dict)
+
+    monkeypatch.setattr(CachedSessionStore, "encode", counting_encode)
+    return calls
+
+
+def test_save_encodes_once(cache, encodes):
+    store = CachedSessionStore()
+    store["user"] = "alice"
+    store.save()
+    assert len(encodes) == 1
+    assert cache.get(store.session_key)[0] == store.encode({"user": "alice"})
+
+
+def test_load_is_served_from_cache(cache):
+    store = CachedSessionStore()
+    store["user"] = "alice"
+    store.save()
+    SessionStore(store.session_key).delete()
+    # the database row is gone, the cache still has it
+    assert CachedSessionStore(store.session_key)["user"] == "alice"
+
+
+def test_touch_caches_stored_data(cache, encodes):
+    store = CachedSessionStore()
+    store["user"] = "alice"
+    store.save()
+    loaded = CachedSessionStore(store.session_key)
+    loaded.load()
+    cache.delete(store.session_key)
+    loaded["user"] = "unsaved"
+    loaded.set_expiry(timedelta(days=1))
+    assert loaded.touch()
+    # the cache matches the database, not the unsaved change
+    assert CachedSessionStore(store.session_key)["user"] == "alice"
+    assert len(encodes) == 1
+
+
+def test_failed_save_evicts(cache, monkeypatch):
+    store = CachedSessionStore()
+    store["user"] = "alice"
+    store.save()
+
+    def failing_save(self, must_create=False):
+        self.create_model_values(self._session)
+        raise RuntimeError("database unreachable")
+
+    monkeypatch.setattr(SessionStore, "save", failing_save)
+    store["user"] = "bob"
+    with pytest.raises(RuntimeError):
+        store.save()
+    assert cache.get(store.session_key) is None
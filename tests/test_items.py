@@ -0,0 +1,202 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import select, update
+
+from session.constants import Config
+from session.db_adapter import FastAPI_Session, FastAPI_SessionItem, session_scope
+from session.items import DEFERRED, ItemizedSessionStore
+
+BIG = "x" * 200
+
+
+@pytest.fixture(autouse=True)
+def small_defer_size(db, monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_ITEM_DEFER_SIZE", 100)
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    '''
+    Record the keys and thread of every fetch_items() call
+    '''
+    calls = []
+    fetch_items = ItemizedSessionStore.fetch_items
+
+    def recording_fetch(self, keys):
+        calls.append((sorted(keys), threading.get_ident()))
+        return fetch_items(self, keys)
+
+    monkeypatch.setattr(ItemizedSessionStore, "fetch_items", recording_fetch)
+    return calls
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def saved(**data):
+    store = ItemizedSessionStore()
+    store.update(data)
+    store.save()
+    return store
+
+
+def item_rows(session_key):
+    table = FastAPI_SessionItem.__table__
+    with session_scope() as session:
+        return dict(session.execute(
+            select(table.c.item_key, table.c.item_value).where(table.c.session_key == session_key)
+        ).all())
+
+
+def overwrite_item(session_key, key, value):
+    '''
+    Change an item row behind the store's back, to see whether a save
+    rewrites it
+    '''
+    table = FastAPI_SessionItem.__table__
+    with session_scope() as session:
+        session.execute(
+            update(table).where(table.c.session_key == session_key).where(table.c.item_key == key)
+            .values(item_value=ItemizedSessionStore()._encode_item(key, value))
+        )
+        session.commit()
+
+
+def test_save_load():
+    store = saved(user="alice", count=1)
+    assert set(item_rows(store.session_key)) == {"user", "count"}
+    loaded = ItemizedSessionStore(store.session_key)
+    assert loaded["user"] == "alice" and loaded["count"] == 1
+    with session_scope() as session:
+        row = session.get(FastAPI_Session, store.session_key)
+        assert row.session_data is None
+
+
+def test_save_writes_only_changes():
+    store = saved(user="alice", count=1, cart=["apple"])
+    overwrite_item(store.session_key, "cart", ["changed elsewhere"])
+    loaded = ItemizedSessionStore(store.session_key)
+    loaded["count"] = 2
+    del loaded["user"]
+    loaded.save()
+    assert set(item_rows(store.session_key)) == {"count", "cart"}
+    reloaded = ItemizedSessionStore(store.session_key)
+    assert reloaded["count"] == 2
+    # not rewritten from the stale copy loaded above
+    assert reloaded["cart"] == ["changed elsewhere"]
+
+
+def test_cleared_session_is_written_in_full():
+    store = saved(user="alice", count=1)
+    loaded = ItemizedSessionStore(store.session_key)
+    loaded.clear()
+    loaded["fresh"] = True
+    loaded.save()
+    assert set(item_rows(store.session_key)) == {"fresh"}
+
+
+def test_item_moved_to_another_key_is_rejected():
+    store = saved(a="value a", b="value b")
+    table = FastAPI_SessionItem.__table__
+    rows = item_rows(store.session_key)
+    with session_scope() as session:
+        session.execute(
+            update(table).where(table.c.session_key == store.session_key)
+            .where(table.c.item_key == "b").values(item_value=rows["a"])
+        )
+        session.commit()
+    assert ItemizedSessionStore(store.session_key).get("b") is None
+
+
+def test_large_values_are_deferred(fetches):
+    store = saved(small=1, big=BIG, bigger=BIG * 2)
+    loaded = ItemizedSessionStore(store.session_key)
+    data = loaded._get_session()
+    assert dict.get(data, "small") == 1
+    assert dict.get(data, "big") is DEFERRED
+    assert fetches == []
+    assert loaded["big"] == BIG
+    assert fetches[0][0] == ["big"]
+    # the other deferred values are fetched together
+    assert dict(loaded.items()) == {"small": 1, "big": BIG, "bigger": BIG * 2}
+    assert [keys for keys, _ in fetches] == [["big"], ["bigger"]]
+
+
+def test_deferred_value_deleted_meanwhile():
+    store = saved(big=BIG)
+    loaded = ItemizedSessionStore(store.session_key)
+    loaded.load()
+    other = ItemizedSessionStore(store.session_key)
+    del other["big"]
+    other.save()
+    assert loaded.get("big") is None
+    assert "big" not in loaded
+
+
+def test_pop_without_fetch(fetches):
+    store = saved(big=BIG, small=1)
+    loaded = ItemizedSessionStore(store.session_key)
+    assert loaded.pop("big", fetch=False) is None
+    assert loaded.pop("missing", fetch=False) is None
+    loaded.save()
+    assert fetches == []
+    assert set(item_rows(store.session_key)) == {"small"}
+
+
+def test_pop_fetches_by_default(fetches):
+    store = saved(big=BIG)
+    loaded = ItemizedSessionStore(store.session_key)
+    assert loaded.pop("big") == BIG
+    assert len(fetches) == 1
+
+
+def test_async_accessors_fetch_off_the_event_loop(fetches):
+    store = saved(big=BIG, bigger=BIG * 2)
+
+    async def scenario():
+        loaded = ItemizedSessionStore(store.session_key)
+        value = await loaded.aget("big")
+        items = dict(await loaded.aitems())
+        return value, items, threading.get_ident()
+
+    value, items, loop_thread = run(scenario())
+    assert value == BIG
+    assert items == {"big": BIG, "bigger": BIG * 2}
+    assert len(fetches) == 2
+    assert all(thread != loop_thread for _, thread in fetches)
+
+
+def test_async_pop_without_fetch(fetches):
+    store = saved(big=BIG)
+
+    async def scenario():
+        loaded = ItemizedSessionStore(store.session_key)
+        popped = await loaded.apop("big", fetch=False)
+        await loaded.asave()
+        return popped
+
+    assert run(scenario()) is None
+    assert fetches == []
+    assert item_rows(store.session_key) == {}
+
+
+def test_delete_removes_items():
+    store = saved(user="alice")
+    other = saved(user="bob")
+    store.delete()
+    assert item_rows(store.session_key) == {}
+    run(ItemizedSessionStore().adelete(other.session_key))
+    assert item_rows(other.session_key) == {}
+
+
+def test_load_many_and_delete_many():
+    stores = [saved(i=i, big=BIG) for i in range(3)]
+    keys = [store.session_key for store in stores]
+    assert ItemizedSessionStore.load_many(keys) == {
+        key: {"i": i, "big": BIG} for i, key in enumerate(keys)
+    }
+    ItemizedSessionStore.delete_many(keys)
+    assert all(item_rows(key) == {} for key in keys)
@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from session import log_store
+from session.log_store import LogSessionStore, SessionLog
+from session.session import CreateError
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / "log")
+
+
+def open_log(log_dir, **kwargs):
+    kwargs.setdefault("fsync", "never")
+    kwargs.setdefault("compact_interval", 0)
+    return SessionLog(log_dir, **kwargs)
+
+
+def crash(log):
+    '''
+    Drop the log like a killed process would: no checkpoint, no fsync
+    '''
+    os.close(log._fd)
+    for mm in log._maps.values():
+        mm.close()
+    log._dir_lock.close()
+
+
+def later(seconds=3600):
+    return time.time() + seconds
+
+
+def segment_paths(log_dir):
+    return sorted(
+        os.path.join(log_dir, name) for name in os.listdir(log_dir)
+        if log_store.SEGMENT_NAME.match(name)
+    )
+
+
+def test_put_get_delete(log_dir):
+    log = open_log(log_dir)
+    expire_ts = later()
+    log.put("a", b"data", expire_ts)
+    assert log.get("a") == (b"data", expire_ts)
+    assert "a" in log
+    log.delete("a")
+    assert log.get("a") is None
+    log.close()
+
+
+def test_expired_record_is_not_returned(log_dir):
+    log = open_log(log_dir)
+    log.put("a", b"data", time.time() - 1)
+    assert log.get("a") is None
+    assert "a" not in log
+    assert not log.touch("a", later())
+    log.close()
+
+
+def test_must_create_collision(log_dir):
+    log = open_log(log_dir)
+    log.put("a", b"first", later())
+    with pytest.raises(CreateError):
+        log.put("a", b"second", later(), must_create=True)
+    assert log.get("a")[0] == b"first"
+    log.close()
+
+
+def test_restart_from_checkpoint(log_dir, monkeypatch):
+    log = open_log(log_dir)
+    log.put("a", b"before", later())
+    log.put("b", b"deleted", later())
+    log.delete("b")
+    log.close()
+
+    replayed = []
+    replay = SessionLog._replay
+
+    def recording_replay(self, segment, offset, truncate=False):
+        replayed.append(offset)
+        return replay(self, segment, offset, truncate)
+
+    monkeypatch.setattr(SessionLog, "_replay", recording_replay)
+    log = open_log(log_dir)
+    # everything was in the checkpoint: nothing before its offset is read
+    assert replayed and replayed[0] > 0
+    assert log.get("a")[0] == b"before"
+    assert log.get("b") is None
+    log.put("c", b"after", later())
+    crash(log)
+
+    log = open_log(log_dir)
+    assert log.get("a")[0] == b"before"
+    assert log.get("c")[0] == b"after"
+    assert log.get("b") is None
+    log.close()
+
+
+def test_corrupt_checkpoint_replays_everything(log_dir):
+    log = open_log(log_dir)
+    log.put("a", b"data", later())
+    log.close()
+    path = os.path.join(log_dir, "checkpoint")
+    with open(path, "r+b") as f:
+        f.seek(10)
+        f.write(b"\xff")
+    log = open_log(log_dir)
+    assert log.get("a")[0] == b"data"
+    log.close()
+
+
+def test_checkpoint_ahead_of_data_is_ignored(log_dir):
+    log = open_log(log_dir)
+    log.put("a", b"kept", later())
+    size = os.path.getsize(segment_paths(log_dir)[-1])
+    log.put("b", b"lost", later())
+    log.close()
+    # the segment lost its last record, the checkpoint still points at it
+    with open(segment_paths(log_dir)[-1], "r+b") as f:
+        f.truncate(size)
+    log = open_log(log_dir)
+    assert log.get("a")[0] == b"kept"
+    assert log.get("b") is None
+    log.close()
+
+
+def test_torn_tail_is_truncated(log_dir):
+    log = open_log(log_dir)
+    log.put("a", b"complete", later())
+    log.put("b", b"torn", later())
+    crash(log)
+    path = segment_paths(log_dir)[-1]
+    size = os.path.getsize(path)
+    # the crash interrupted the write of the last record
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)
+
+    log = open_log(log_dir)
+    assert log.get("a")[0] == b"complete"
+    assert log.get("b") is None
+    good = os.path.getsize(path)
+    assert good < size - 3
+    # appends continue right after the last complete record
+    log.put("c", b"new", later())
+    crash(log)
+    log = open_log(log_dir)
+    assert log.get("a")[0] == b"complete"
+    assert log.get("c")[0] == b"new"
+    log.close()
+
+
+def test_segments_are_sealed_at_segment_size(log_dir):
+    log = open_log(log_dir, segment_size=256)
+    for i in range(20):
+        log.put("key%d" % i, b"x" * 50, later())
+    assert len(segment_paths(log_dir)) > 1
+    assert all(log.get("key%d" % i)[0] == b"x" * 50 for i in range(20))
+    log.close()
+
+
+def test_compaction_drops_deleted_and_expired(log_dir):
+    log = open_log(log_dir, segment_size=256)
+    log.put("kept", b"old", later())
+    log.put("kept", b"new", later())
+    log.put("deleted", b"data", later())
+    log.delete("deleted")
+    log.put("expired", b"data", later(0.05))
+    for i in range(10):
+        log.put("filler%d" % i, b"x" * 50, later())
+        log.delete("filler%d" % i)
+    time.sleep(0.1)
+    segments = len(segment_paths(log_dir))
+    assert log.garbage_ratio() > 0.5
+
+    assert log.compact() == 1
+    assert len(segment_paths(log_dir)) < segments
+    assert set(log.index) == {"kept"}
+    assert log.live_bytes == log.total_bytes
+    assert log.get("kept")[0] == b"new"
+    log.close()
+
+    log = open_log(log_dir)
+    assert set(log.index) == {"kept"}
+    assert log.get("kept")[0] == b"new"
+    log.close()
+
+
+def test_write_during_compaction_wins(log_dir, monkeypatch):
+    log = open_log(log_dir)
+    log.put("a", b"old", later())
+    log.put("b", b"old", later())
+    read = log._map
+    written = []
+
+    def write_while_copying(segment, needed):
+        # another request saves while the sealed segments are being copied
+        if not written:
+            written.append(True)
+            log.put("a", b"new", later())
+            log.delete("b")
+        return read(segment, needed)
+
+    monkeypatch.setattr(log, "_map", write_while_copying)
+    log.compact()
+    monkeypatch.undo()
+    assert log.get("a")[0] == b"new"
+    assert log.get("b") is None
+    log.close()
+    log = open_log(log_dir)
+    assert log.get("a")[0] == b"new"
+    assert log.get("b") is None
+    log.close()
+
+
+def test_group_commit(log_dir, monkeypatch):
+    syncs = []
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        syncs.append(fd)
+        time.sleep(0.02)
+        fsync(fd)
+
+    monkeypatch.setattr(log_store.os, "fsync", slow_fsync)
+    log = open_log(log_dir, fsync="always")
+    threads = [
+        threading.Thread(target=log.put, args=("key%d" % i, b"data", later()))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every put waited for its fsync, but they shared them
+    assert len(log.index) == 8
+    assert 1 <= len(syncs) < 8
+    assert log._synced_upto == log._appended
+    log.close()
+
+
+def test_directory_is_owned_by_one_log(log_dir):
+    log = open_log(log_dir)
+    with pytest.raises(RuntimeError):
+        open_log(log_dir)
+    log.close()
+
+
+def test_store(log_dir, monkeypatch):
+    monkeypatch.setattr(LogSessionStore, "log", open_log(log_dir))
+    store = LogSessionStore()
+    store["user"] = "alice"
+    store.save()
+    assert LogSessionStore(store.session_key)["user"] == "alice"
+    with pytest.raises(CreateError):
+        LogSessionStore(store.session_key).save(must_create=True)
+    store.set_expiry(timedelta(days=1))
+    assert store.touch()
+    store.delete()
+    assert not LogSessionStore().exists(store.session_key)
+    assert LogSessionStore(store.session_key).load() == {}
+    LogSessionStore.log.close()
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from session.constants import Config
+from session.db_adapter import SessionStore
+from session.middleware import SessionMiddleware
+
+
+class CountingStore(SessionStore):
+    '''
+    SessionStore recording what the middleware makes it do
+    '''
+
+    calls = []
+
+    def __init__(self, session_key=None) -> None:
+        self.calls.append("init")
+        super().__init__(session_key)
+
+    def save(self, must_create=False):
+        self.calls.append("save")
+        return super().save(must_create)
+
+    def touch(self):
+        self.calls.append("touch")
+        return super().touch()
+
+
+async def untouched(request):
+    return PlainTextResponse("ok")
+
+
+async def read(request):
+    return JSONResponse({"user": request.session.get("user")})
+
+
+async def login(request):
+    request.session["user"] = request.query_params.get("user", "alice")
+    return PlainTextResponse("ok")
+
+
+async def failing(request):
+    request.session["user"] = "mallory"
+    return PlainTextResponse("error", status_code=500)
+
+
+async def health(request):
+    return JSONResponse({"has_session": "session" in request.scope})
+
+
+@pytest.fixture(autouse=True)
+def settings(db, monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_SAVE_EVERY_REQUEST", True)
+    monkeypatch.setattr(Config, "SESSION_REFRESH_INTERVAL", 60)
+    monkeypatch.setattr(Config, "SESSION_EXEMPT_PATHS", ("/static", "/health"))
+    monkeypatch.setattr(Config, "SESSION_PATHS", None)
+    monkeypatch.setattr(CountingStore, "calls", [])
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[
+        Route("/", untouched),
+        Route("/read", read),
+        Route("/login", login),
+        Route("/failing", failing),
+        Route("/health", health),
+        Route("/probe", health),
+    ])
+    app.add_middleware(SessionMiddleware, store_class=CountingStore)
+    return TestClient(app)
+
+
+def session_cookie(response):
+    return response.cookies.get(Config.SESSION_KEY_NAME)
+
+
+def set_cookie_headers(response):
+    return response.headers.get_list("set-cookie")
+
+
+def test_untouched_session_is_never_built(client):
+    response = client.get("/")
+    assert set_cookie_headers(response) == []
+    assert CountingStore.calls == []
+
+
+def test_anonymous_reader_gets_no_cookie_and_no_row(client):
+    response = client.get("/read")
+    assert response.json() == {"user": None}
+    assert set_cookie_headers(response) == []
+    assert CountingStore.calls == ["init"]
+    assert "cookie" in response.headers["vary"].lower()
+
+
+def test_modified_session_is_saved_with_cookie(client):
+    response = client.get("/login")
+    session_key = session_cookie(response)
+    assert session_key
+    assert "save" in CountingStore.calls
+    assert SessionStore(session_key)["user"] == "alice"
+    assert client.get("/read").json() == {"user": "alice"}
+
+
+def test_refresh_is_throttled(client, monkeypatch):
+    client.get("/login")
+    CountingStore.calls.clear()
+    response = client.get("/read")
+    # the expiry would barely move: no write, no new cookie
+    assert response.json() == {"user": "alice"}
+    assert "save" not in CountingStore.calls and "touch" not in CountingStore.calls
+    assert set_cookie_headers(response) == []
+
+    monkeypatch.setattr(Config, "SESSION_REFRESH_INTERVAL", 0)
+    response = client.get("/read")
+    assert "touch" in CountingStore.calls and "save" not in CountingStore.calls
+    assert session_cookie(response)
+
+
+def test_no_refresh_without_save_every_request(client, monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_SAVE_EVERY_REQUEST", False)
+    monkeypatch.setattr(Config, "SESSION_REFRESH_INTERVAL", 0)
+    client.get("/login")
+    CountingStore.calls.clear()
+    response = client.get("/read")
+    assert CountingStore.calls == ["init"]
+    assert set_cookie_headers(response) == []
+
+
+def test_unknown_cookie_is_deleted(client):
+    client.cookies.set(Config.SESSION_KEY_NAME, "unknown0123456789abcdefghijklmno")
+    response = client.get("/read")
+    assert response.json() == {"user": None}
+    [header] = set_cookie_headers(response)
+    assert header.startswith(Config.SESSION_KEY_NAME + '=""')
+    assert "Max-Age=0" in header
+    assert "save" not in CountingStore.calls
+
+
+def test_session_deleted_elsewhere(client, monkeypatch):
+    session_key = session_cookie(client.get("/login"))
+    SessionStore(session_key).delete()
+    monkeypatch.setattr(Config, "SESSION_REFRESH_INTERVAL", 0)
+    # loaded before the delete, so the refresh is what finds out
+    monkeypatch.setattr(CountingStore, "load", lambda self: {"user": "alice"})
+    response = client.get("/read")
+    [header] = set_cookie_headers(response)
+    assert "Max-Age=0" in header
+
+
+def test_server_error_is_not_saved(client):
+    response = client.get("/failing")
+    assert response.status_code == 500
+    assert set_cookie_headers(response) == []
+    assert "save" not in CountingStore.calls
+
+
+def test_exempt_path_bypasses_sessions(client):
+    client.get("/login")
+    CountingStore.calls.clear()
+    response = client.get("/health")
+    assert response.json() == {"has_session": False}
+    assert set_cookie_headers(response) == []
+    assert CountingStore.calls == []
+
+
+def test_session_paths_allow_list(client, monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_PATHS", ("/login",))
+    assert session_cookie(client.get("/login"))
+    CountingStore.calls.clear()
+    response = client.get("/probe")
+    assert response.json() == {"has_session": False}
+    assert CountingStore.calls == []
+
+
+def test_expiry_is_stored_and_sent(client):
+    response = client.get("/login")
+    session_key = session_cookie(response)
+    [header] = set_cookie_headers(response)
+    assert "Max-Age=%d" % Config.SESSION_COOKIE_AGE in header
+    store = SessionStore(session_key)
+    store.load()
+    expected = datetime.now() + timedelta(seconds=Config.SESSION_COOKIE_AGE)
+    assert abs(store._stored_expire_date - expected) < timedelta(seconds=5)
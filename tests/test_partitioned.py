@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, select
+
+from session.db_adapter import FastAPI_Session, session_scope
+from session.partitioned import PartitionedSessionStore, is_bucket_table
+from session.session import CreateError
+
+
+@pytest.fixture(autouse=True)
+def buckets(db, monkeypatch):
+    monkeypatch.setattr(PartitionedSessionStore, "buckets", None)
+    return PartitionedSessionStore.get_buckets()
+
+
+def bucket_tables(db):
+    return sorted(name for name in inspect(db).get_table_names() if is_bucket_table(name))
+
+
+def holding(buckets, session_key):
+    '''
+    Return the names of the bucket tables holding a row for session_key
+    '''
+    with session_scope() as session:
+        return [
+            table.name for table in buckets.live(session, datetime.now())
+            if session.scalar(select(table.c.session_key).where(table.c.session_key == session_key))
+        ]
+
+
+def saved(expiry, **data):
+    store = PartitionedSessionStore()
+    store.update(data)
+    store.set_expiry(expiry)
+    store.save()
+    return store
+
+
+def test_save_load(buckets):
+    store = saved(timedelta(hours=1), user="alice")
+    assert PartitionedSessionStore(store.session_key)["user"] == "alice"
+    assert PartitionedSessionStore().exists(store.session_key)
+    assert holding(buckets, store.session_key) == [buckets.name_for(store.get_expiry_date())]
+
+
+def test_save_must_create_existing_key():
+    store = saved(timedelta(hours=1))
+    with pytest.raises(CreateError):
+        PartitionedSessionStore(store.session_key).save(must_create=True)
+
+
+def test_next_bucket_is_registered_ahead(db, buckets):
+    store = saved(timedelta(hours=1))
+    expire_date = store.get_expiry_date()
+    assert bucket_tables(db) == sorted([
+        buckets.name_for(expire_date), buckets.name_for(expire_date + buckets.length),
+    ])
+
+
+def test_save_moves_session_to_new_bucket(buckets):
+    store = saved(timedelta(hours=1), user="alice")
+    store.set_expiry(timedelta(days=3))
+    store.save()
+    assert holding(buckets, store.session_key) == [buckets.name_for(store.get_expiry_date())]
+    assert PartitionedSessionStore(store.session_key)["user"] == "alice"
+
+
+def test_touch_moves_session_to_new_bucket(buckets):
+    store = saved(timedelta(hours=1), user="alice")
+    store.set_expiry(timedelta(days=3))
+    assert store.touch()
+    assert holding(buckets, store.session_key) == [buckets.name_for(store.get_expiry_date())]
+    assert PartitionedSessionStore(store.session_key)["user"] == "alice"
+
+
+def test_touch_finds_session_moved_by_another_request(buckets):
+    store = saved(timedelta(hours=1), user="alice")
+    other = PartitionedSessionStore(store.session_key)
+    other.load()
+    # another request moves the row before this one touches it
+    store.set_expiry(timedelta(days=3))
+    store.touch()
+    other.set_expiry(timedelta(days=6))
+    assert other.touch()
+    assert holding(buckets, store.session_key) == [buckets.name_for(other.get_expiry_date())]
+
+
+def test_touch_missing_session():
+    store = saved(timedelta(hours=1))
+    stale = PartitionedSessionStore(store.session_key)
+    stale.load()
+    store.delete()
+    assert not stale.touch()
+
+
+def test_load_many_and_delete_for_user():
+    alice = [saved(timedelta(hours=1), _auth_user_id=1), saved(timedelta(days=3), _auth_user_id=1)]
+    bob = saved(timedelta(hours=1), _auth_user_id=2)
+    keys = [store.session_key for store in alice + [bob]]
+    assert set(PartitionedSessionStore.load_many(keys)) == set(keys)
+    assert sorted(PartitionedSessionStore.keys_for_user(1)) == sorted(keys[:2])
+    assert PartitionedSessionStore.delete_for_user(1) == 2
+    assert list(PartitionedSessionStore.load_many(keys)) == [bob.session_key]
+
+
+def test_clear_expired_counts_sessions(db, buckets):
+    expired = saved(datetime.now() - timedelta(days=3))
+    live = saved(timedelta(hours=1))
+    # the bucket of 'expired' and the empty one registered after it are
+    # both over: two tables dropped, one session removed
+    assert PartitionedSessionStore.clear_expired() == 1
+    assert buckets.name_for(expired.get_expiry_date()) not in bucket_tables(db)
+    assert PartitionedSessionStore().exists(live.session_key)
+    assert PartitionedSessionStore.clear_expired() == 0
+
+
+def test_import_sessions():
+    now = datetime.now()
+    with session_scope() as session:
+        store = PartitionedSessionStore()
+        session.add(FastAPI_Session(
+            session_key="imported0123456789abcdefghijklmn",
+            session_data=store.encode({"user": "carol"}),
+            expire_date=now + timedelta(hours=1),
+        ))
+        session.add(FastAPI_Session(
+            session_key="expired0123456789abcdefghijklmno",
+            session_data=store.encode({}),
+            expire_date=now - timedelta(hours=1),
+        ))
+        session.commit()
+    assert PartitionedSessionStore.import_sessions() == 1
+    assert PartitionedSessionStore("imported0123456789abcdefghijklmn")["user"] == "carol"
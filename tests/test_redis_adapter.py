@@ -0,0 +1,215 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from session.redis_adapter import AsyncRedisSessionStore, RedisSessionStore
+from session.session import CreateError
+
+# well-formed keys that no store has written
+UNKNOWN_KEY = "unknown0123456789abcdefghijklmno"
+
+
+@pytest.fixture(autouse=True)
+def fake_server(monkeypatch):
+    # both stores talk to the same in-process server, like they would to
+    # the same Redis
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        RedisSessionStore, "client", fakeredis.FakeRedis(server=server, decode_responses=True)
+    )
+    monkeypatch.setattr(
+        AsyncRedisSessionStore, "aclient",
+        fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+    )
+    return server
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_save_load():
+    store = RedisSessionStore()
+    store["user"] = "alice"
+    store.save()
+    assert RedisSessionStore(store.session_key)["user"] == "alice"
+    assert RedisSessionStore().exists(store.session_key)
+
+
+def test_load_unknown_key():
+    store = RedisSessionStore(UNKNOWN_KEY)
+    assert store.load() == {}
+    assert store.session_key is None
+
+
+def test_create_retries_on_collision(monkeypatch):
+    taken = RedisSessionStore()
+    taken.save()
+    keys = iter([taken.session_key, "fresh-key-0123456789abcdefghijkl"])
+    monkeypatch.setattr(RedisSessionStore, "_get_new_session_key", lambda self: next(keys))
+    store = RedisSessionStore()
+    store.create()
+    assert store.session_key == "fresh-key-0123456789abcdefghijkl"
+
+
+def test_save_must_create_existing_key():
+    store = RedisSessionStore()
+    store.save()
+    with pytest.raises(CreateError):
+        RedisSessionStore(store.session_key).save(must_create=True)
+
+
+def test_save_sets_expiry():
+    store = RedisSessionStore()
+    store.set_expiry(100)
+    store.save()
+    assert 0 < RedisSessionStore.client.ttl(store._key(store.session_key)) <= 100
+
+
+def test_touch_resets_expiry():
+    store = RedisSessionStore()
+    store.set_expiry(10)
+    store.save()
+    store.set_expiry(1000)
+    assert store.touch()
+    assert RedisSessionStore.client.ttl(store._key(store.session_key)) > 10
+
+
+def test_touch_missing_key():
+    store = RedisSessionStore(UNKNOWN_KEY)
+    assert not store.touch()
+
+
+def test_expired_session_is_gone():
+    store = RedisSessionStore()
+    store["a"] = 1
+    store.set_expiry(1)
+    store.save()
+    time.sleep(1.1)
+    assert RedisSessionStore(store.session_key).load() == {}
+
+
+def test_delete():
+    store = RedisSessionStore()
+    store.save()
+    store.delete()
+    assert not store.exists(store.session_key)
+
+
+def test_load_many_and_delete_many():
+    keys = []
+    for i in range(3):
+        store = RedisSessionStore()
+        store["i"] = i
+        store.save()
+        keys.append(store.session_key)
+    loaded = RedisSessionStore.load_many(keys + [UNKNOWN_KEY])
+    assert loaded == {key: {"i": i} for i, key in enumerate(keys)}
+    assert RedisSessionStore.delete_many(keys + [UNKNOWN_KEY]) == 3
+    assert RedisSessionStore.load_many(keys) == {}
+
+
+def test_async_save_load():
+    async def scenario():
+        store = AsyncRedisSessionStore()
+        await store.aset("user", "bob")
+        await store.asave()
+        loaded = AsyncRedisSessionStore(store.session_key)
+        return await loaded.aget("user"), await loaded.aexists(store.session_key)
+
+    assert run(scenario()) == ("bob", True)
+
+
+def test_async_create_retries_on_collision(monkeypatch):
+    taken = RedisSessionStore()
+    taken.save()
+    keys = iter([taken.session_key, "fresh-key-0123456789abcdefghijkl"])
+
+    async def new_key(self):
+        return next(keys)
+
+    monkeypatch.setattr(AsyncRedisSessionStore, "_aget_new_session_key", new_key)
+
+    async def scenario():
+        store = AsyncRedisSessionStore()
+        await store.acreate()
+        return store.session_key
+
+    assert run(scenario()) == "fresh-key-0123456789abcdefghijkl"
+
+
+def test_async_save_must_create_existing_key():
+    taken = RedisSessionStore()
+    taken.save()
+
+    async def scenario():
+        await AsyncRedisSessionStore(taken.session_key).asave(must_create=True)
+
+    with pytest.raises(CreateError):
+        run(scenario())
+
+
+def test_async_touch():
+    async def scenario():
+        store = AsyncRedisSessionStore()
+        store.set_expiry(10)
+        await store.asave()
+        store.set_expiry(1000)
+        touched = await store.atouch()
+        return touched, await store.aclient.ttl(store._key(store.session_key))
+
+    touched, ttl = run(scenario())
+    assert touched and ttl > 10
+    assert not run(AsyncRedisSessionStore(UNKNOWN_KEY).atouch())
+
+
+def test_async_delete():
+    async def scenario():
+        store = AsyncRedisSessionStore()
+        await store.asave()
+        await store.adelete()
+        return await store.aexists(store.session_key)
+
+    assert not run(scenario())
+
+
+def test_async_load_many_and_delete_many():
+    async def scenario():
+        keys = []
+        for i in range(3):
+            store = AsyncRedisSessionStore()
+            await store.aset("i", i)
+            await store.asave()
+            keys.append(store.session_key)
+        loaded = await AsyncRedisSessionStore.aload_many(keys + [UNKNOWN_KEY])
+        deleted = await AsyncRedisSessionStore.adelete_many(keys)
+        return keys, loaded, deleted
+
+    keys, loaded, deleted = run(scenario())
+    assert loaded == {key: {"i": i} for i, key in enumerate(keys)}
+    assert deleted == 3
+
+
+def test_async_reads_what_sync_wrote():
+    store = RedisSessionStore()
+    store["from"] = "sync"
+    store.save()
+
+    async def scenario():
+        return await AsyncRedisSessionStore(store.session_key).aget("from")
+
+    assert run(scenario()) == "sync"
+
+
+def test_sync_reads_what_async_wrote():
+    async def scenario():
+        store = AsyncRedisSessionStore()
+        await store.aset("from", "async")
+        await store.asave()
+        return store.session_key
+
+    session_key = run(scenario())
+    assert RedisSessionStore(session_key)["from"] == "async"
+    assert RedisSessionStore.load_many([session_key]) == {session_key: {"from": "async"}}
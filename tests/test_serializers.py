@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from session import serializers
+from session.constants import Config
+from session.db_adapter import SessionStore
+from session.serializers import JSONSerializer, MsgpackSerializer, dumps, loads
+
+DATA = {
+    "user": "alice",
+    "count": 3,
+    "ratio": 0.5,
+    "flags": [True, False, None],
+    "login": datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc),
+    "history": [{"at": datetime(2026, 10, 17, 8, 0), "path": "/cart"}],
+}
+
+CODECS = {
+    "json": JSONSerializer(use_orjson=False),
+    "orjson": JSONSerializer(use_orjson=True),
+    "msgpack": MsgpackSerializer(),
+}
+
+
+@pytest.fixture(params=sorted(CODECS))
+def codec(request):
+    return CODECS[request.param]
+
+
+def test_round_trip(codec):
+    payload = dumps(DATA, codec, compress_min_size=None)
+    assert payload.startswith(codec.tag)
+    assert loads(payload) == DATA
+
+
+def test_round_trip_compressed(codec):
+    data = dict(DATA, cart=["item %d" % i for i in range(200)])
+    payload = dumps(data, codec, compress_min_size=100)
+    assert payload[1] == "z"
+    assert loads(payload) == data
+
+
+def test_urlsafe(codec):
+    payload = dumps(dict(DATA, text="a+b/c=d &;,"), codec, compress_min_size=None, urlsafe=True)
+    body = payload.partition(":")[2]
+    assert set(body) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+    assert loads(payload)["text"] == "a+b/c=d &;,"
+
+
+def test_small_payload_is_not_compressed():
+    payload = dumps({"a": 1}, CODECS["json"], compress_min_size=100)
+    assert payload == 'j:{"a":1}'
+
+
+def test_payload_growing_when_compressed_is_left_alone():
+    # zlib adds more header than it can save on a few bytes
+    payload = dumps({"a": 1}, CODECS["json"], compress_min_size=1)
+    assert payload == 'j:{"a":1}'
+
+
+def test_orjson_and_json_read_each_other():
+    payload = dumps(DATA, CODECS["orjson"], compress_min_size=None)
+    assert CODECS["json"].loads(payload.partition(":")[2].encode()) == DATA
+    payload = dumps(DATA, CODECS["json"], compress_min_size=None)
+    assert CODECS["orjson"].loads(payload.partition(":")[2].encode()) == DATA
+
+
+def test_legacy_json_payload():
+    assert loads(json.dumps({"user": "alice"})) == {"user": "alice"}
+
+
+def test_unknown_tag():
+    with pytest.raises(ValueError):
+        loads("q:whatever")
+
+
+def test_default_codec_follows_setting(monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_SERIALIZER", "msgpack")
+    assert dumps({"a": 1}).startswith("m:")
+    monkeypatch.setattr(Config, "SESSION_SERIALIZER", "json")
+    assert dumps({"a": 1}).startswith("j")
+
+
+def test_store_reads_data_written_with_another_codec(monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_SERIALIZER", "msgpack")
+    session_data = SessionStore().encode(DATA)
+    monkeypatch.setattr(Config, "SESSION_SERIALIZER", "json")
+    assert SessionStore().decode(session_data) == DATA
+
+
+def test_unserializable_value():
+    with pytest.raises(TypeError):
+        serializers.dumps({"obj": object()}, CODECS["json"])
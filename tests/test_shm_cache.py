@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+import pytest
+
+from session.shm_cache import GENERATION, SharedMemoryCache, default_path
+
+EXPIRE = datetime(2100, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SharedMemoryCache(str(tmp_path / "sessions.cache"), slots=1000, slot_size=512)
+    yield cache
+    cache.close()
+
+
+class RecordingLock:
+    def __init__(self, index, taken):
+        self.index = index
+        self.taken = taken
+        self.lock = Lock()
+
+    def __enter__(self):
+        self.taken.append(self.index)
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.lock.__exit__(*exc_info)
+
+
+def test_set_get_delete(cache):
+    cache.set("key", ("data", EXPIRE))
+    assert cache.get("key") == ("data", EXPIRE)
+    assert "key" in cache and len(cache) == 1
+    cache.delete("key")
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_naive_expire_date_round_trip(cache):
+    naive = datetime(2100, 1, 1, 12, 30)
+    cache.set("key", ("data", naive))
+    assert cache.get("key") == ("data", naive)
+
+
+def test_entry_too_large_is_not_cached(cache):
+    cache.set("key", ("small", EXPIRE))
+    cache.set("key", ("x" * 1000, EXPIRE))
+    assert cache.get("key") is None
+
+
+def test_entry_expires_with_expire_date(cache):
+    cache.set("key", ("data", EXPIRE), expire_date=datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert cache.get("key") is None
+
+
+def test_file_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "sessions.cache"
+    cache = SharedMemoryCache(str(path), slots=16, slot_size=256)
+    assert not path.exists()
+    cache.set("key", ("data", EXPIRE))
+    assert path.exists()
+    cache.close()
+
+
+def test_processes_share_the_file(tmp_path):
+    path = str(tmp_path / "sessions.cache")
+    first = SharedMemoryCache(path, slots=16, slot_size=256)
+    second = SharedMemoryCache(path, slots=16, slot_size=256)
+    first.set("key", ("data", EXPIRE))
+    assert second.get("key") == ("data", EXPIRE)
+    second.delete("key")
+    assert first.get("key") is None
+    first.close()
+    second.close()
+
+
+def test_other_layout_is_refused(tmp_path):
+    path = str(tmp_path / "sessions.cache")
+    first = SharedMemoryCache(path, slots=16, slot_size=256)
+    first.set("key", ("data", EXPIRE))
+    other = SharedMemoryCache(path, slots=32, slot_size=256)
+    with pytest.raises(RuntimeError):
+        other.get("key")
+    # the live mapping is left alone
+    assert first.get("key") == ("data", EXPIRE)
+    first.close()
+
+
+def test_read_during_write_is_a_miss(cache):
+    cache.set("key", ("data", EXPIRE))
+    _, slot = cache._slot(b"key")
+    offset = cache._offset(slot)
+    generation = GENERATION.unpack_from(cache._mm, offset)[0]
+    # a writer in another process is halfway through the slot
+    GENERATION.pack_into(cache._mm, offset, generation + 1)
+    assert cache.get("key") is None
+    assert cache.version("key") == -1
+    GENERATION.pack_into(cache._mm, offset, generation)
+    assert cache.get("key") == ("data", EXPIRE)
+
+
+def test_versioned_set_does_not_overwrite_newer_save(cache):
+    version = cache.version("key")
+    # another worker saves after our database read
+    cache.set("key", ("new", EXPIRE))
+    cache.set("key", ("old", EXPIRE), version=version)
+    assert cache.get("key") == ("new", EXPIRE)
+    # with an up-to-date version the fill goes through
+    cache.set("key", ("newer", EXPIRE), version=cache.version("key"))
+    assert cache.get("key") == ("newer", EXPIRE)
+
+
+def test_busy_slot_version_never_matches(cache):
+    cache.set("key", ("data", EXPIRE))
+    cache.set("key", ("stale", EXPIRE), version=-1)
+    assert cache.get("key") == ("data", EXPIRE)
+
+
+def test_thread_lock_follows_the_slot(cache):
+    taken = []
+    cache._locks = [RecordingLock(i, taken) for i in range(len(cache._locks))]
+    keys = {}
+    for i in range(20000):
+        key = "key%d" % i
+        keys.setdefault(cache._slot(key.encode())[1], []).append(key)
+    # 1000 slots is not a multiple of the 64 locks: keys sharing a slot
+    # must still take the same lock, whichever way the slot is written
+    slot, same_slot = next((slot, keys) for slot, keys in keys.items() if len(keys) > 1)
+    for key in same_slot:
+        cache.set(key, ("data", EXPIRE))
+    cache.delete(same_slot[0])
+    assert set(taken) == {slot % len(cache._locks)}
+    taken.clear()
+    cache.clear()
+    assert taken == [slot % len(cache._locks) for slot in range(cache.slots)]
+
+
+def test_default_path_depends_on_deployment(tmp_path, monkeypatch):
+    here = default_path(1024, 4096)
+    assert here == default_path(1024, 4096)
+    assert default_path(2048, 4096) != here
+    monkeypatch.chdir(tmp_path)
+    assert default_path(1024, 4096) != here
@@ -0,0 +1,90 @@
+import pytest
+
+from session import signing
+from session.async_db_adapter import AsyncSessionStore
+from session.cached_db import CachedSessionStore
+from session.constants import Config
+from session.db_adapter import SessionStore
+from session.redis_adapter import RedisSessionStore
+from session.signing import BadSignature, SignatureExpired, Signer, TimestampSigner, get_signer
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_SECRET_KEY", "current-secret")
+    monkeypatch.setattr(Config, "SESSION_SECRET_KEY_FALLBACKS", [])
+
+
+def rotate(monkeypatch, new_key, fallbacks):
+    monkeypatch.setattr(Config, "SESSION_SECRET_KEY", new_key)
+    monkeypatch.setattr(Config, "SESSION_SECRET_KEY_FALLBACKS", fallbacks)
+
+
+def test_sign_unsign():
+    signer = get_signer("salt")
+    signed = signer.sign("value")
+    assert signed.startswith("value:")
+    assert signer.unsign(signed) == "value"
+
+
+def test_tampered_value_is_rejected():
+    signed = get_signer("salt").sign("value")
+    with pytest.raises(BadSignature):
+        get_signer("salt").unsign("other" + signed[5:])
+    with pytest.raises(BadSignature):
+        get_signer("salt").unsign("no separator")
+
+
+def test_salt_separates_signatures():
+    signed = get_signer("salt").sign("value")
+    with pytest.raises(BadSignature):
+        get_signer("other salt").unsign(signed)
+
+
+def test_key_rotation(monkeypatch):
+    signed = get_signer("salt").sign("value")
+    rotate(monkeypatch, "new-secret", ["current-secret"])
+    # still accepted through the fallback, new values use the new key
+    assert get_signer("salt").unsign(signed) == "value"
+    resigned = get_signer("salt").sign("value")
+    assert resigned != signed
+    assert Signer(key="new-secret", salt="salt", fallback_keys=[]).unsign(resigned) == "value"
+    # once the old key is retired, its values are rejected
+    rotate(monkeypatch, "new-secret", [])
+    with pytest.raises(BadSignature):
+        get_signer("salt").unsign(signed)
+
+
+def test_get_signer_is_cached_per_key(monkeypatch):
+    signer = get_signer("salt")
+    assert get_signer("salt") is signer
+    rotate(monkeypatch, "new-secret", [])
+    assert get_signer("salt") is not signer
+    assert get_signer("salt").key == "new-secret"
+
+
+def test_timestamp_signer(monkeypatch):
+    signer = get_signer("salt", TimestampSigner)
+    signed = signer.sign("value")
+    assert signer.unsign(signed, max_age=60) == "value"
+    now = signing.time.time()
+    monkeypatch.setattr(signing.time, "time", lambda: now + 120)
+    with pytest.raises(SignatureExpired):
+        signer.unsign(signed, max_age=60)
+    assert signer.unsign(signed) == "value"
+
+
+def test_session_data_survives_rotation(monkeypatch):
+    session_data = SessionStore().encode({"user": "alice"})
+    rotate(monkeypatch, "new-secret", ["current-secret"])
+    assert SessionStore().decode(session_data) == {"user": "alice"}
+    rotate(monkeypatch, "new-secret", [])
+    assert SessionStore().decode(session_data) == {}
+
+
+def test_stores_of_one_format_share_the_salt():
+    session_data = AsyncSessionStore().encode({"user": "alice"})
+    assert SessionStore().decode(session_data) == {"user": "alice"}
+    assert CachedSessionStore().decode(session_data) == {"user": "alice"}
+    # another storage format can't be fed database rows
+    assert RedisSessionStore().decode(session_data) == {}